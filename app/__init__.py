@@ -3,12 +3,15 @@ from flask import Flask
 import os
 from .extensions import api
 from .config import Config
+from .uploads import UploadRequest
 from dotenv import load_dotenv
 import logging
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 def create_app(config_object: type[Config] | None = None):
     app = Flask(__name__)
+    # uploads are hashed and size checked while the multipart body is parsed
+    app.request_class = UploadRequest
     # CORS(app,
     #      resources={r"/*": {"origins": [
     #         "http://localhost:3000",
@@ -45,8 +48,31 @@ def create_app(config_object: type[Config] | None = None):
     from excel_companion.excel_companion import bp as excel_bp
     api.register_blueprint(excel_bp, url_prefix="/excel")
 
+    # the ingest queue consumer and orphaned-document sweep run in every app process,
+    # started here rather than on import so importing a blueprint starts no threads
+    from rag_on_doc.jobs import start_background_workers
+    start_background_workers()
+
     @app.get("/")
     def health():
         return {"status": "ok"}
 
+    @app.get("/stats")
+    def stats():
+        from .qdrant import get_stats as get_qdrant_stats
+        from .chains import get_stats as get_chain_stats
+        from .embedding_cache import get_stats as get_embedding_stats
+        from .semantic_cache import get_stats as get_semantic_cache_stats
+        from .hybrid import get_stats as get_hybrid_stats
+        from text_api.cache import get_stats as get_text_cache_stats
+        return {
+            "status": "ok",
+            "qdrant": get_qdrant_stats(),
+            "chains": get_chain_stats(),
+            "embeddings": get_embedding_stats(),
+            "semantic_cache": get_semantic_cache_stats(),
+            "hybrid_search": get_hybrid_stats(),
+            "text_api_cache": get_text_cache_stats(),
+        }
+
     return app
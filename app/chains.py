@@ -0,0 +1,152 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from langchain_openai import ChatOpenAI
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.summarize import load_summarize_chain
+from langchain_core.prompts import ChatPromptTemplate
+from app.qdrant import build_metadata_filter
+from app.streaming import iter_callback_tokens
+from app.hybrid import HybridRetriever
+
+MODEL_NAME = os.getenv("MODEL_NAME")
+MAX_CHAINS = int(os.getenv("MAX_CACHED_CHAINS", 64))
+
+ANSWER_CONTEXT = """
+
+Use the following pieces of retrieved context to answer the question.
+----------------
+{context}"""
+
+_lock = threading.Lock()
+_chat_models = {}
+_chains = OrderedDict()
+
+stats = {
+    "model_hits": 0,
+    "model_misses": 0,
+    "chain_hits": 0,
+    "chain_misses": 0,
+}
+
+
+def get_chat_model(model=None, temperature=0.5, **kwargs):
+    """Return a shared ChatOpenAI for the model/temperature, building it once"""
+    model = model or MODEL_NAME
+    key = (model, float(temperature), tuple(sorted(kwargs.items())))
+    with _lock:
+        llm = _chat_models.get(key)
+        if llm is not None:
+            stats["model_hits"] += 1
+            return llm
+        stats["model_misses"] += 1
+        llm = ChatOpenAI(model=model, temperature=float(temperature), **kwargs)
+        _chat_models[key] = llm
+        return llm
+
+
+def _get_cached_chain(key, build):
+    with _lock:
+        chain = _chains.get(key)
+        if chain is not None:
+            _chains.move_to_end(key)
+            stats["chain_hits"] += 1
+            return chain
+        stats["chain_misses"] += 1
+
+    chain = build()
+    with _lock:
+        chain = _chains.setdefault(key, chain)
+        _chains.move_to_end(key)
+        while len(_chains) > MAX_CHAINS:
+            _chains.popitem(last=False)
+    return chain
+
+
+def prompt_version(template):
+    """Short content hash of a prompt, changes whenever the prompt text does"""
+    return hashlib.sha1(template.encode()).hexdigest()[:12]
+
+
+def build_answer_prompt(system_prompt):
+    """Answer prompt with the system prompt as a fixed template, so it is never part of the stored history"""
+    system_prompt = system_prompt.strip().replace("{", "{{").replace("}", "}}")
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt + ANSWER_CONTEXT),
+        ("human", "{question}"),
+    ])
+
+
+def get_retrieval_chain(vectorstore, model=None, temperature=0.5, top_k=3, metadata_filter=None, streaming=False,
+                        system_prompt=None, hybrid=False, rerank=False):
+    """Return a ConversationalRetrievalChain built once per (model, temperature, collection, top_k).
+
+    The chain is built without memory so it can be shared between requests,
+    callers pass their own history through ask_retrieval_chain.
+    metadata_filter ({field: value}) restricts retrieval to matching chunk metadata.
+    With streaming=True only the answer step streams tokens, question condensing does not.
+    system_prompt is sent once with the answer step, question condensing doesn't see it.
+    hybrid=True fuses dense search with in-process BM25 (see app.hybrid), rerank=True
+    also reorders the fused candidates with a local cross-encoder.
+    """
+    model = model or MODEL_NAME
+    filter_key = tuple(sorted(metadata_filter.items())) if metadata_filter else None
+    version = prompt_version(system_prompt) if system_prompt else None
+    key = ("retrieval", model, float(temperature), vectorstore.collection_name, top_k, filter_key, streaming, version,
+           hybrid, rerank)
+
+    def build():
+        if hybrid:
+            retriever = HybridRetriever(vectorstore=vectorstore, top_k=top_k, metadata_filter=metadata_filter or {},
+                                        use_reranker=rerank)
+        else:
+            search_kwargs = {"k": top_k}
+            if metadata_filter:
+                search_kwargs["filter"] = build_metadata_filter(metadata_filter)
+            retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
+        llm = get_chat_model(model, temperature)
+        return ConversationalRetrievalChain.from_llm(
+            llm=get_chat_model(model, temperature, streaming=True) if streaming else llm,
+            retriever=retriever,
+            condense_question_llm=llm,
+            combine_docs_chain_kwargs={"prompt": build_answer_prompt(system_prompt)} if system_prompt else None,
+            return_source_documents=False
+        )
+
+    return _get_cached_chain(key, build)
+
+
+def ask_retrieval_chain(chain, query, history):
+    """Run a shared retrieval chain with the per-request memory.
+
+    The question and answer are added to history here, the system prompt is part of
+    the answer prompt template and never stored with the conversation.
+    """
+    answer = chain.invoke({"question": query, "chat_history": history.chat_memory.messages})
+    history.save_context({"question": query}, {"answer": answer["answer"]})
+    return answer["answer"]
+
+
+def stream_retrieval_chain(chain, query, history):
+    """Like ask_retrieval_chain but yields answer tokens, the turn is saved once the answer is complete"""
+    answer = yield from iter_callback_tokens(
+        lambda callbacks: chain.invoke(
+            {"question": query, "chat_history": history.chat_memory.messages},
+            config={"callbacks": callbacks},
+        )
+    )
+    history.save_context({"question": query}, {"answer": answer["answer"]})
+
+
+def get_summarize_chain(model, prompt, chain_type="stuff"):
+    key = ("summarize", model.model_name, model.temperature, chain_type, prompt.template)
+    return _get_cached_chain(
+        key,
+        lambda: load_summarize_chain(model, chain_type=chain_type, prompt=prompt, document_variable_name="page_content")
+    )
+
+
+def get_stats():
+    with _lock:
+        return {**stats, "chat_models_cached": len(_chat_models), "chains_cached": len(_chains)}
@@ -1,3 +1,5 @@
+import os
+
 class Config:
     API_TITLE = "My API"
     API_VERSION = "v1"
@@ -5,3 +7,5 @@ class Config:
     OPENAPI_URL_PREFIX = "/"
     OPENAPI_SWAGGER_UI_PATH = "/swagger"
     OPENAPI_SWAGGER_UI_URL = "https://cdn.jsdelivr.net/npm/swagger-ui-dist/"
+    # no request body may be larger than this, endpoints with uploads set lower limits
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 64 * 1024 * 1024))
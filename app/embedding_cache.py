@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.stores import ByteStore
+from langchain_openai import OpenAIEmbeddings
+from app.threads import start_thread
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL", "")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 60 * 60 * 24 * 30))
+# seconds between trims of a file cache back to its max_entries
+CACHE_TRIM_INTERVAL = int(os.getenv("CACHE_TRIM_INTERVAL", 5 * 60))
+TRIM_MARKER = ".trimmed"
+
+_lock = threading.Lock()
+_store = None
+_embeddings = {}
+
+
+class BoundedByteStore(ByteStore):
+    """ByteStore wrapper that counts hits and keeps a LocalFileStore under max_entries files.
+
+    Reads update a file's atime, and every trim_interval one worker deletes the least
+    recently read files past max_entries in a background thread. The bound is the
+    directory's, shared by every worker, and can be overshot by the writes of one interval.
+    """
+
+    def __init__(self, store, max_entries=None, trim_interval=CACHE_TRIM_INTERVAL):
+        self.store = store
+        self.max_entries = max_entries if isinstance(store, LocalFileStore) else None
+        self.trim_interval = trim_interval
+        self.hits = 0
+        self.misses = 0
+        self._last_trim = 0
+        self._lock = threading.Lock()
+        if self.max_entries:
+            store.update_atime = True
+
+    def mget(self, keys):
+        values = self.store.mget(keys)
+        hits = sum(value is not None for value in values)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(values) - hits
+        return values
+
+    def mset(self, key_value_pairs):
+        self.store.mset(key_value_pairs)
+        if self.max_entries:
+            self._maybe_trim()
+
+    def mdelete(self, keys):
+        self.store.mdelete(keys)
+
+    def yield_keys(self, prefix=None):
+        return self.store.yield_keys(prefix=prefix)
+
+    def _maybe_trim(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_trim < self.trim_interval:
+                return
+            self._last_trim = now
+        # the marker's mtime tells the other workers a trim already started
+        marker = os.path.join(self.store.root_path, TRIM_MARKER)
+        try:
+            if now - os.stat(marker).st_mtime < self.trim_interval:
+                return
+        except FileNotFoundError:
+            pass
+        with open(marker, "a"):
+            os.utime(marker)
+        start_thread(self.trim, name="cache-trim")
+
+    def trim(self):
+        """Delete the least recently read files past max_entries, returns how many were deleted"""
+        files = []
+        for root, _, names in os.walk(self.store.root_path):
+            for name in names:
+                if name == TRIM_MARKER:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.stat(path).st_atime, path))
+                except FileNotFoundError:
+                    pass
+        excess = len(files) - self.max_entries
+        if excess <= 0:
+            return 0
+        files.sort()
+        removed = 0
+        for _, path in files[:excess]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _create_store():
+    if EMBEDDING_CACHE_REDIS_URL:
+        # Redis expires entries by TTL, size is bounded by the server's maxmemory policy
+        from langchain_community.storage import RedisStore
+        return BoundedByteStore(RedisStore(redis_url=EMBEDDING_CACHE_REDIS_URL, ttl=EMBEDDING_CACHE_TTL, namespace="embeddings"))
+    return BoundedByteStore(LocalFileStore(EMBEDDING_CACHE_DIR), max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+
+
+def get_embedding_store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = _create_store()
+        return _store
+
+
+def get_cached_embeddings(model="text-embedding-3-small"):
+    """Return OpenAIEmbeddings wrapped in a cache keyed by sha256(model + text)"""
+    with _lock:
+        cached = _embeddings.get(model)
+        if cached is not None:
+            return cached
+    store = get_embedding_store()
+    cached = CacheBackedEmbeddings.from_bytes_store(
+        OpenAIEmbeddings(model=model),
+        store,
+        namespace=model,
+        query_embedding_cache=True,
+        key_encoder="sha256",
+    )
+    with _lock:
+        return _embeddings.setdefault(model, cached)
+
+
+def get_stats():
+    store = get_embedding_store()
+    lookups = store.hits + store.misses
+    return {
+        "hits": store.hits,
+        "misses": store.misses,
+        "hit_ratio": round(store.hits / lookups, 4) if lookups else 0.0,
+    }
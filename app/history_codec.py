@@ -0,0 +1,79 @@
+import os
+import json
+import zlib
+import base64
+from datetime import datetime, timedelta, timezone
+
+# "compact" (default) stores [type, epoch microseconds, content] JSON arrays,
+# "msgpack" the same array packed with msgpack, "json" the original dicts.
+# Every format is readable whatever the writer is set to, so switching is safe.
+HISTORY_CODEC = os.getenv("HISTORY_CODEC", "compact")
+# content longer than this many bytes is zlib compressed, 0 disables compression
+HISTORY_COMPRESS_MIN = int(os.getenv("HISTORY_COMPRESS_MIN", 1024))
+
+TYPE_CODES = {"human": 0, "ai": 1, "system": 2}
+CODE_TYPES = {code: name for name, code in TYPE_CODES.items()}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch_us(timestamp):
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_epoch_us(value):
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def _pack(row, codec):
+    if codec == "msgpack":
+        import msgpack
+        return "m", msgpack.packb(row)
+    return "", json.dumps(row, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def encode_message(msg_type, content, timestamp, codec=None):
+    """Encode one message as the string stored in the Redis list"""
+    codec = codec or HISTORY_CODEC
+    try:
+        epoch_us = None if codec == "json" else to_epoch_us(timestamp)
+    except (TypeError, ValueError):
+        epoch_us = None
+    if epoch_us is None:
+        # timestamps that aren't ISO strings keep the original format
+        return json.dumps({"type": msg_type, "content": content, "timestamp": timestamp})
+    prefix, data = _pack([TYPE_CODES[msg_type], epoch_us, content], codec)
+    if HISTORY_COMPRESS_MIN and len(data) >= HISTORY_COMPRESS_MIN:
+        return "z" + base64.b64encode(zlib.compress(data)).decode()
+    if prefix:
+        return prefix + base64.b64encode(data).decode()
+    return data.decode()
+
+
+def _unpack(data):
+    if data[:1] == b"[":
+        return json.loads(data)
+    import msgpack
+    return msgpack.unpackb(data)
+
+
+def decode_message(raw):
+    """Return (type, content, iso timestamp) for any stored format"""
+    if isinstance(raw, bytes):
+        raw = raw.decode()
+    marker = raw[:1]
+    if marker == "{":
+        msg = json.loads(raw)
+        return msg["type"], msg["content"], msg.get("timestamp")
+    if marker == "[":
+        row = json.loads(raw)
+    elif marker == "z":
+        row = _unpack(zlib.decompress(base64.b64decode(raw[1:])))
+    elif marker == "m":
+        row = _unpack(base64.b64decode(raw[1:]))
+    else:
+        raise ValueError(f"Unknown history message format: {raw[:20]!r}")
+    return CODE_TYPES[row[0]], row[2], from_epoch_us(row[1])
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from upstash_redis import Redis as UpstashRedis
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import get_buffer_string
+from app.history_codec import encode_message, decode_message
+
+HISTORY_TTL = 60 * 60 * 24 * 7
+# turns (human + ai message) sent to the model, older turns are folded into a summary
+HISTORY_WINDOW_TURNS = int(os.getenv("HISTORY_WINDOW_TURNS", 10))
+# rough token cap for the windowed messages, 0 disables it
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 3000))
+# stored transcript is capped with LTRIM so it can't grow without limit
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", 1000))
+SUMMARY_MODEL_NAME = os.getenv("SUMMARY_MODEL_NAME") or os.getenv("MODEL_NAME")
+# folds of one conversation wait for each other, a crashed fold releases the lock after this
+SUMMARY_LOCK_TTL = 120
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+MESSAGE_CLASSES = {cls: name for name, cls in MESSAGE_TYPES.items()}
+
+
+def create_redis_client(url=None, token=None):
+    """Upstash REST client by default, redis-py for redis:// or rediss:// URLs"""
+    url = os.getenv("REDIS_URL", "") if url is None else url
+    token = os.getenv("REDIS_TOKEN", "") if token is None else token
+    if url.startswith(("redis://", "rediss://")):
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+    return UpstashRedis(url=url, token=token)
+
+
+def serialize_messages(messages, timestamp):
+    serialized = []
+    for msg in messages:
+        msg_type = MESSAGE_CLASSES.get(type(msg)) or next(
+            (name for name, cls in MESSAGE_TYPES.items() if isinstance(msg, cls)), None)
+        if msg_type:
+            serialized.append(encode_message(msg_type, msg.content, timestamp))
+    return serialized
+
+
+def deserialize_messages(data, types=("human", "ai", "system")):
+    messages = []
+    for raw in data or []:
+        msg_type, content, timestamp = decode_message(raw)
+        if msg_type in types:
+            messages.append(MESSAGE_TYPES[msg_type](content=content, additional_kwargs={"timestamp": timestamp}))
+    return messages
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English, avoids loading a tokenizer per request
+    return len(text) // 4 + 1
+
+
+def window_start(contents, window, budget):
+    """Index of the first of contents in the window: at most `window` messages fitting in budget tokens.
+
+    The latest message is always in the window. Appending only ever moves the start
+    forward, so every message leaves the window exactly once.
+    """
+    start = max(0, len(contents) - window)
+    if budget:
+        used = 0
+        for index in range(len(contents) - 1, start - 1, -1):
+            used += estimate_tokens(contents[index])
+            if used > budget and index < len(contents) - 1:
+                return index + 1
+    return start
+
+
+def fit_token_budget(messages, budget):
+    """Drop the oldest messages until the rest fit in budget tokens, the latest one is always kept"""
+    return messages[window_start([msg.content for msg in messages], len(messages), budget):]
+
+
+def summary_messages(summary):
+    if not summary:
+        return []
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
+
+
+class HistoryStore:
+    """Chat history lists in Redis where every operation is a single round-trip.
+
+    Works with both upstash_redis (REST, pipelines end in exec()) and redis-py
+    (pipelines end in execute()), so a local fake redis can stand in for tests.
+    """
+
+    def __init__(self, client, ttl=HISTORY_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    def pipeline(self):
+        return self.client.pipeline()
+
+    def execute(self, pipe):
+        run = getattr(pipe, "exec", None) or pipe.execute
+        return run()
+
+    def load(self, key, start=0, end=-1):
+        return self.client.lrange(key, start, end)
+
+    def load_many(self, keys, start=0, end=-1):
+        if not keys:
+            return []
+        pipe = self.pipeline()
+        for key in keys:
+            pipe.lrange(key, start, end)
+        return self.execute(pipe)
+
+    def append(self, key, values, extra=None):
+        """rpush values and refresh the TTL; extra(pipe) can queue more commands in the same round-trip"""
+        pipe = self.pipeline()
+        if values:
+            pipe.rpush(key, *values)
+        pipe.expire(key, self.ttl)
+        if extra:
+            extra(pipe)
+        return self.execute(pipe)
+
+    def touch(self, key):
+        return self.client.expire(key, self.ttl)
+
+    def load_messages(self, key, start=0, end=-1, types=("human", "ai", "system")):
+        return deserialize_messages(self.load(key, start, end), types)
+
+    def append_messages(self, key, messages, timestamp, extra=None):
+        return self.append(key, serialize_messages(messages, timestamp), extra=extra)
+
+    def summary_key(self, key):
+        return f"{key}:summary"
+
+    def load_window(self, key, turns=HISTORY_WINDOW_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                    types=("human", "ai")):
+        """Last `turns` turns of a conversation and the rolling summary of everything before, in one round-trip"""
+        pipe = self.pipeline()
+        pipe.lrange(key, -turns * 2, -1)
+        pipe.get(self.summary_key(key))
+        data, summary = self.execute(pipe)
+        # the budget counts every stored message, as append_window does when folding
+        messages = [msg for msg in fit_token_budget(deserialize_messages(data), token_budget)
+                    if MESSAGE_CLASSES.get(type(msg)) in types]
+        return messages, json.loads(summary)["summary"] if summary else ""
+
+    def append_window(self, key, messages, timestamp, turns=HISTORY_WINDOW_TURNS,
+                      token_budget=HISTORY_TOKEN_BUDGET, extra=None):
+        """Append messages and fold the ones that just left the window into the summary.
+
+        A message leaves the window when it is more than `turns` turns old or no longer
+        fits token_budget, so nothing load_window drops is lost from the summary. The
+        stored list is capped at HISTORY_MAX_MESSAGES, the window is read back in the
+        same pipeline and evicted messages are summarized in a background thread so the
+        reply isn't held up by it. extra(pipe) can queue more commands in the same
+        round-trip, their results are returned.
+        """
+        values = serialize_messages(messages, timestamp)
+        if not values:
+            return []
+        window = turns * 2
+        pipe = self.pipeline()
+        pipe.rpush(key, *values)
+        pipe.lrange(key, -(window + len(values)), -1)
+        pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+        pipe.expire(key, self.ttl)
+        pipe.expire(self.summary_key(key), self.ttl)
+        if extra:
+            extra(pipe)
+        results = self.execute(pipe)
+        data = results[1]
+        contents = [decode_message(raw)[1] for raw in data]
+        start = window_start(contents[:-len(values)], window, token_budget)
+        evicted = data[start:window_start(contents, window, token_budget)]
+        if evicted:
+            threading.Thread(target=self.fold_summary, args=(key, evicted), daemon=True).start()
+        return results[5:]
+
+    @contextmanager
+    def summary_lock(self, key, timeout=SUMMARY_LOCK_TTL):
+        """Redis lock on the summary of one conversation, so concurrent folds don't overwrite each other"""
+        lock_key = f"{self.summary_key(key)}:lock"
+        token = str(uuid.uuid4())
+        deadline = time.time() + timeout
+        while not self.client.set(lock_key, token, nx=True, ex=SUMMARY_LOCK_TTL):
+            if time.time() > deadline:
+                raise TimeoutError(f"Summary of {key} is locked")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if self.client.get(lock_key) == token:
+                self.client.delete(lock_key)
+
+    def fold_summary(self, key, evicted):
+        """Merge evicted messages into the conversation summary stored next to it"""
+        try:
+            from app.chains import get_chat_model
+            new_lines = get_buffer_string(deserialize_messages(evicted, ("human", "ai")))
+            if not new_lines:
+                return
+            llm = get_chat_model(SUMMARY_MODEL_NAME, temperature=0)
+            # read, summarize and write under the lock, a fold started meanwhile builds on this one
+            with self.summary_lock(key):
+                raw = self.client.get(self.summary_key(key))
+                summary = json.loads(raw)["summary"] if raw else ""
+                summary = (SUMMARY_PROMPT | llm).invoke({"summary": summary, "new_lines": new_lines}).content.strip()
+                self.client.set(self.summary_key(key), json.dumps({"summary": summary}), ex=self.ttl)
+        except Exception as e:
+            print("Error:", e)
@@ -0,0 +1,242 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, defaultdict
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from app.qdrant import get_client, build_metadata_filter
+from app.threads import run_in_thread, start_thread
+
+# the in-process BM25 index of a collection is rebuilt from Qdrant after this many seconds,
+# in the background while searches keep using the previous one
+BM25_INDEX_TTL = int(os.getenv("BM25_INDEX_TTL", 60 * 10))
+# a failed rebuild is retried after this many seconds
+BM25_REBUILD_RETRY = 60
+# dense and BM25 results fetched per query before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = 60
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._][a-z0-9]+)*")
+STOPWORDS = frozenset("""a an and are as at be by can do does for from how i in is it of on or that the this
+to what when where which with you your""".split())
+
+_lock = threading.Lock()
+_indexes = {}
+_rebuilding = set()
+# bumped by forget_bm25_index so a rebuild that started before it doesn't store stale data
+_generations = defaultdict(int)
+_reranker_lock = threading.Lock()
+_reranker = None
+
+stats = {
+    "index_builds": 0,
+    "index_build_errors": 0,
+    "searches": 0,
+    "reranks": 0,
+    "rerank_errors": 0,
+}
+
+
+def tokenize(text):
+    """Lowercased words, keeping names like XLOOKUP, T.TEST or A1 as single terms"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of Documents, backed by a plain inverted index"""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for index, doc in enumerate(documents):
+            terms = Counter(tokenize(doc.page_content))
+            self.lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self.postings[term].append((index, count))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k=10):
+        """Return [(document, score)] of the k best matches, best first"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, count in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.avg_length)
+                scores[index] += idf * count * (self.k1 + 1) / (count + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[index], score) for index, score in best]
+
+
+def _load_documents(collection_name):
+    client = get_client()
+    documents = []
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=1000, offset=offset,
+                                       with_payload=True, with_vectors=False)
+        for point in points:
+            payload = point.payload or {}
+            metadata = dict(payload.get("metadata") or {})
+            metadata["_id"] = point.id
+            metadata["_collection_name"] = collection_name
+            documents.append(Document(page_content=payload.get("page_content", ""), metadata=metadata))
+        if offset is None:
+            return documents
+
+
+def _build(collection_name):
+    with _lock:
+        generation = _generations[collection_name]
+    index = BM25Index(_load_documents(collection_name))
+    with _lock:
+        if generation == _generations[collection_name]:
+            _indexes[collection_name] = (index, time.time())
+        stats["index_builds"] += 1
+    return index
+
+
+def _rebuild(collection_name):
+    try:
+        _build(collection_name)
+    except Exception as e:
+        print("Error:", e)
+        with _lock:
+            stats["index_build_errors"] += 1
+            entry = _indexes.get(collection_name)
+            if entry is not None:
+                # keep serving the old index and try again later rather than on every search
+                _indexes[collection_name] = (entry[0], time.time() - BM25_INDEX_TTL + BM25_REBUILD_RETRY)
+    finally:
+        with _lock:
+            _rebuilding.discard(collection_name)
+
+
+def get_bm25_index(collection_name):
+    """Return the BM25 index of a collection, built from its Qdrant payloads.
+
+    Only the first search of a collection waits for the build. Once the index is older
+    than BM25_INDEX_TTL it is rebuilt in a background thread and the old one is served
+    until the new one is ready.
+    """
+    with _lock:
+        entry = _indexes.get(collection_name)
+        if entry is not None:
+            if time.time() - entry[1] >= BM25_INDEX_TTL and collection_name not in _rebuilding:
+                _rebuilding.add(collection_name)
+                start_thread(_rebuild, (collection_name,), name="bm25-rebuild")
+            return entry[0]
+    return run_in_thread(_build, collection_name)
+
+
+def forget_bm25_index(collection_name):
+    """Drop the cached index so the next search sees a changed collection"""
+    with _lock:
+        _indexes.pop(collection_name, None)
+        _generations[collection_name] += 1
+
+
+def _doc_key(doc):
+    return doc.metadata.get("_id") or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """Merge ranked Document lists, each document scores sum(1 / (k + rank)) over the lists it is in"""
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = _doc_key(doc)
+            scores[key] += 1 / (k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def _get_reranker():
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            # a model that failed to load once isn't retried on every query
+            _reranker = False
+            import torch
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            tokenizer = AutoTokenizer.from_pretrained(RERANK_MODEL)
+            model = AutoModelForSequenceClassification.from_pretrained(RERANK_MODEL).eval()
+            _reranker = (torch, tokenizer, model)
+        return _reranker
+
+
+def _rerank_scores(query, documents):
+    torch, tokenizer, model = _get_reranker()
+    inputs = tokenizer([query] * len(documents), [doc.page_content for doc in documents],
+                       padding=True, truncation=True, max_length=512, return_tensors="pt")
+    with torch.no_grad():
+        return model(**inputs).logits.view(-1).tolist()
+
+
+def rerank(query, documents):
+    """Order documents by a local cross-encoder, falls back to the given order if it can't be loaded"""
+    if len(documents) < 2 or _reranker is False:
+        return documents
+    try:
+        scores = run_in_thread(_rerank_scores, query, documents)
+    except Exception as e:
+        print("Error:", e)
+        with _lock:
+            stats["rerank_errors"] += 1
+        return documents
+    with _lock:
+        stats["reranks"] += 1
+    return [doc for _, doc in sorted(zip(scores, documents), key=lambda item: item[0], reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense Qdrant search fused with in-process BM25 by reciprocal rank, optionally reranked.
+
+    BM25 catches exact terms (function names, error codes) that embeddings blur, so the
+    top_k documents passed to the LLM can stay small. metadata_filter ({field: value})
+    applies to both sides.
+    """
+
+    vectorstore: Any
+    top_k: int = 3
+    candidates: int = HYBRID_CANDIDATES
+    metadata_filter: dict = {}
+    use_reranker: bool = False
+
+    def dense_search(self, query):
+        kwargs = {"filter": build_metadata_filter(self.metadata_filter)} if self.metadata_filter else {}
+        return self.vectorstore.similarity_search(query, k=self.candidates, **kwargs)
+
+    def sparse_search(self, query):
+        index = get_bm25_index(self.vectorstore.collection_name)
+        results = index.search(query, self.candidates * 2 if self.metadata_filter else self.candidates)
+        documents = [doc for doc, _ in results
+                     if all(doc.metadata.get(field) == value for field, value in self.metadata_filter.items())]
+        return documents[:self.candidates]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with _lock:
+            stats["searches"] += 1
+        fused = reciprocal_rank_fusion([self.dense_search(query), self.sparse_search(query)])
+        if self.use_reranker:
+            fused = rerank(query, fused[:self.candidates])
+        return fused[:self.top_k]
+
+
+def get_stats():
+    with _lock:
+        return {**stats, "indexes_cached": len(_indexes), "indexes_rebuilding": len(_rebuilding)}
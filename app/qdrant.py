@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import OrderedDict
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.models import VectorParams, PayloadSchemaType
+from langchain_qdrant import QdrantVectorStore
+
+VECTOR_SIZE = 1536
+MAX_VECTORSTORES = int(os.getenv("QDRANT_MAX_VECTORSTORES", 128))
+
+_lock = threading.RLock()
+_client = None
+_client_pid = None
+_vectorstores = OrderedDict()
+_known_collections = set()
+_known_indexes = set()
+
+stats = {
+    "client_created": 0,
+    "vectorstore_hits": 0,
+    "vectorstore_misses": 0,
+    "collection_hits": 0,
+    "collection_misses": 0,
+    "evictions": 0,
+}
+
+
+def _create_client():
+    url = os.getenv("QDRANT_URL")
+    if url == ":memory:":
+        return QdrantClient(":memory:")
+    return QdrantClient(url=url, api_key=os.getenv("QDRANT_API_KEY"))
+
+
+def get_client():
+    """Return the Qdrant client shared by every request of this worker process"""
+    global _client, _client_pid
+    # gunicorn forks workers, so a client inherited from the master is never reused
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = _create_client()
+                _client_pid = os.getpid()
+                _vectorstores.clear()
+                _known_collections.clear()
+                _known_indexes.clear()
+                stats["client_created"] += 1
+    return _client
+
+
+def set_client(client):
+    """Swap the shared client, e.g. for a local QdrantClient(":memory:")"""
+    global _client, _client_pid
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+        _vectorstores.clear()
+        _known_collections.clear()
+        _known_indexes.clear()
+
+
+def ensure_collection(collection_name):
+    client = get_client()
+    with _lock:
+        if collection_name in _known_collections:
+            stats["collection_hits"] += 1
+            return
+        stats["collection_misses"] += 1
+        if not client.collection_exists(collection_name):
+            client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=VECTOR_SIZE, distance="Cosine")
+            )
+        _known_collections.add(collection_name)
+
+
+def ensure_payload_index(collection_name, field_name, field_schema=PayloadSchemaType.KEYWORD):
+    """Create an index (keyword by default) for a payload field used in filters, once per worker"""
+    key = (collection_name, field_name)
+    if key in _known_indexes:
+        return
+    ensure_collection(collection_name)
+    get_client().create_payload_index(
+        collection_name=collection_name,
+        field_name=field_name,
+        field_schema=field_schema,
+    )
+    with _lock:
+        _known_indexes.add(key)
+
+
+def build_metadata_filter(metadata_filter):
+    """Qdrant filter matching {field: value} against the metadata of langchain documents"""
+    return models.Filter(must=[
+        models.FieldCondition(key=f"metadata.{field}", match=models.MatchValue(value=value))
+        for field, value in metadata_filter.items()
+    ])
+
+
+def get_vectorstore(collection_name, embedding, create=True):
+    """Return a cached QdrantVectorStore for the collection, building it on first use"""
+    client = get_client()
+    with _lock:
+        vectorstore = _vectorstores.get(collection_name)
+        if vectorstore is not None:
+            _vectorstores.move_to_end(collection_name)
+            stats["vectorstore_hits"] += 1
+            return vectorstore
+        stats["vectorstore_misses"] += 1
+
+    if create:
+        ensure_collection(collection_name)
+
+    # QdrantVectorStore validates the collection config on init, which is another round-trip
+    vectorstore = QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
+        embedding=embedding,
+    )
+    with _lock:
+        _known_collections.add(collection_name)
+        _vectorstores[collection_name] = vectorstore
+        _vectorstores.move_to_end(collection_name)
+        while len(_vectorstores) > MAX_VECTORSTORES:
+            _vectorstores.popitem(last=False)
+            stats["evictions"] += 1
+    return vectorstore
+
+
+def forget_collection(collection_name):
+    """Drop cached state for a collection that was deleted or recreated"""
+    with _lock:
+        _vectorstores.pop(collection_name, None)
+        _known_collections.discard(collection_name)
+        for key in [key for key in _known_indexes if key[0] == collection_name]:
+            _known_indexes.discard(key)
+
+
+def get_stats():
+    with _lock:
+        return {
+            **stats,
+            "vectorstores_cached": len(_vectorstores),
+            "collections_known": len(_known_collections),
+        }
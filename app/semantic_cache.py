@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import uuid
+import threading
+from qdrant_client.http import models
+from qdrant_client.http.models import PayloadSchemaType
+from app.qdrant import get_client, ensure_collection, ensure_payload_index
+from app.hybrid import tokenize
+
+SEMANTIC_CACHE_COLLECTION = os.getenv("SEMANTIC_CACHE_COLLECTION", "semantic_cache")
+# cosine similarity a cached question needs to be reused for a new one
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 60 * 60 * 24 * 7))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 10000))
+# expired and over-limit entries are pruned after this many stores
+SEMANTIC_CACHE_PRUNE_EVERY = 100
+# upper-case names like VLOOKUP, T.TEST or A1 embed almost alike, so they have to match exactly
+EXACT_TERM_PATTERN = re.compile(r"\b[A-Z][A-Z0-9]*(?:[._][A-Z0-9]+)*\b")
+
+_lock = threading.Lock()
+
+stats = {
+    "hits": 0,
+    "misses": 0,
+    "bypassed": 0,
+    "stores": 0,
+    "evictions": 0,
+    "errors": 0,
+}
+
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def exact_terms(question):
+    """Sorted, space-joined upper-case names in a question, "" when there are none"""
+    terms = {term for match in EXACT_TERM_PATTERN.findall(question) if len(match) > 1 for term in tokenize(match)}
+    return " ".join(sorted(terms))
+
+
+class SemanticCache:
+    """Answers keyed by question embedding in a small Qdrant collection.
+
+    A lookup returns the answer of the most similar earlier question within
+    `scope` (e.g. collection, model and prompt version) when the similarity is at
+    least `threshold`, both questions name the same exact terms (function names like
+    VLOOKUP vs XLOOKUP) and the entry is younger than `ttl` seconds. Cache errors are
+    counted and treated as misses so the caller always falls back to the LLM.
+    """
+
+    def __init__(self, embeddings, collection_name=SEMANTIC_CACHE_COLLECTION, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 ttl=SEMANTIC_CACHE_TTL, max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._stores = 0
+
+    def _setup(self):
+        ensure_collection(self.collection_name)
+        ensure_payload_index(self.collection_name, "scope")
+        ensure_payload_index(self.collection_name, "terms")
+        ensure_payload_index(self.collection_name, "created_at", PayloadSchemaType.FLOAT)
+
+    def bypass(self):
+        with _lock:
+            stats["bypassed"] += 1
+
+    def lookup(self, question, scope):
+        try:
+            self._setup()
+            vector = self.embeddings.embed_query(normalize_question(question))
+            points = get_client().query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=models.Filter(must=[
+                    models.FieldCondition(key="scope", match=models.MatchValue(value=scope)),
+                    models.FieldCondition(key="terms", match=models.MatchValue(value=exact_terms(question))),
+                    models.FieldCondition(key="created_at", range=models.Range(gte=time.time() - self.ttl)),
+                ]),
+                limit=1,
+                score_threshold=self.threshold,
+                with_payload=True,
+            ).points
+        except Exception as e:
+            print("Error:", e)
+            with _lock:
+                stats["errors"] += 1
+                stats["misses"] += 1
+            return None
+        with _lock:
+            stats["hits" if points else "misses"] += 1
+        return points[0].payload["answer"] if points else None
+
+    def store(self, question, answer, scope):
+        try:
+            self._setup()
+            normalized = normalize_question(question)
+            get_client().upsert(collection_name=self.collection_name, points=[models.PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{scope}:{normalized}")),
+                vector=self.embeddings.embed_query(normalized),
+                payload={"scope": scope, "question": question, "answer": answer, "terms": exact_terms(question),
+                         "created_at": time.time()},
+            )])
+            with _lock:
+                stats["stores"] += 1
+                self._stores += 1
+                prune = self._stores % SEMANTIC_CACHE_PRUNE_EVERY == 0
+            if prune:
+                self.prune()
+        except Exception as e:
+            print("Error:", e)
+            with _lock:
+                stats["errors"] += 1
+
+    def prune(self):
+        """Delete expired entries, then the oldest ones above max_entries"""
+        client = get_client()
+        client.delete(collection_name=self.collection_name, points_selector=models.FilterSelector(
+            filter=models.Filter(must=[
+                models.FieldCondition(key="created_at", range=models.Range(lt=time.time() - self.ttl)),
+            ])
+        ))
+        excess = client.count(collection_name=self.collection_name, exact=True).count - self.max_entries
+        if excess <= 0:
+            return
+        oldest, _ = client.scroll(
+            collection_name=self.collection_name,
+            limit=excess,
+            order_by=models.OrderBy(key="created_at", direction="asc"),
+            with_payload=False,
+        )
+        client.delete(collection_name=self.collection_name,
+                      points_selector=models.PointIdsList(points=[point.id for point in oldest]))
+        with _lock:
+            stats["evictions"] += len(oldest)
+
+
+def get_stats():
+    with _lock:
+        lookups = stats["hits"] + stats["misses"]
+        return {**stats, "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None}
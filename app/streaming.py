@@ -0,0 +1,92 @@
+import json
+import time
+import queue
+import logging
+import threading
+from flask import Response, request, stream_with_context
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def wants_stream():
+    """True when the client asked for server-sent events (?stream=1, "stream": true or Accept header)"""
+    data = request.get_json(silent=True) or {}
+    if data.get("stream") or request.args.get("stream") in ("1", "true"):
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def sse_event(data, event=None):
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+def stream_response(tokens, on_complete, name="stream"):
+    """Forward tokens as SSE `data` events, then call on_complete(reply) and send its result as a `done` event.
+
+    on_complete is where the full reply gets persisted, it only runs once the model
+    has finished so history is saved exactly as in the non-streaming path.
+    """
+    def generate():
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        try:
+            for token in tokens:
+                if not token:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    logger.info("%s time to first token: %.3fs", name, first_token)
+                parts.append(token)
+                yield sse_event({"token": token})
+            reply = "".join(parts).strip()
+            result = on_complete(reply) or {}
+            yield sse_event({**result, "time_to_first_token": first_token}, event="done")
+        except Exception as e:
+            print("Error:", e)
+            yield sse_event({"status": "fail", "error": str(e)}, event="error")
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    # stop nginx from buffering the stream
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+class _TokenQueueHandler(BaseCallbackHandler):
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.put(token)
+
+
+def iter_callback_tokens(run):
+    """Call run(callbacks) in a thread and yield the tokens streamed by its LLM calls.
+
+    Returns the value of run through StopIteration, so `result = yield from ...` works.
+    """
+    tokens = queue.Queue()
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = run([_TokenQueueHandler(tokens)])
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            tokens.put(_DONE)
+
+    threading.Thread(target=target, daemon=True).start()
+    while True:
+        token = tokens.get()
+        if token is _DONE:
+            break
+        yield token
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gevent_patched():
+    """True once gevent has patched threading (gunicorn gevent workers, ASYNC_WORKERS=1)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def run_in_thread(function, *args):
+    """Run CPU-heavy work on a real OS thread under gevent and wait for the result.
+
+    Greenlets only switch on I/O, so parsing, indexing or model inference on the hub
+    would stall every other request of the worker until it finished. Without gevent
+    the function just runs inline.
+    """
+    if not gevent_patched():
+        return function(*args)
+    from gevent import get_hub
+    return get_hub().threadpool.apply(function, args)
+
+
+def start_thread(target, args=(), name=None):
+    """Start a daemon thread that stays a real OS thread under gevent"""
+    if gevent_patched():
+        from gevent import get_hub
+        get_hub().threadpool.spawn(target, *args)
+        return
+    threading.Thread(target=target, args=args, name=name, daemon=True).start()
+
+
+def thread_pool_executor(max_workers, thread_name_prefix=""):
+    """concurrent.futures executor backed by real OS threads, gevent's own pool under gevent"""
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
@@ -0,0 +1,108 @@
+import os
+import uuid
+import shutil
+import hashlib
+import tempfile
+from flask import Request, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# uploaded files stay in memory up to this size and spill to a temp file above it
+UPLOAD_SPOOL_SIZE = int(os.getenv("UPLOAD_SPOOL_SIZE", 8 * 1024 * 1024))
+# room for multipart boundaries and the other form fields on top of a file limit
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, max_size):
+        super().__init__(f"File size exceeds {max_size / (1024 * 1024):g}MB")
+        self.max_size = max_size
+
+
+class HashingSpool:
+    """Spooled buffer for one uploaded file that hashes the bytes as they are written"""
+
+    def __init__(self, spool_size=UPLOAD_SPOOL_SIZE):
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request whose multipart file parts are parsed straight into HashingSpool buffers"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool()
+
+
+def get_upload(field="file", max_size=None):
+    """Return the uploaded file for field (None when missing), parsing at most max_size bytes.
+
+    The limit applies while the body is read, so an oversized upload is refused without
+    being buffered, whether or not the client sent a Content-Length.
+    """
+    if max_size:
+        request.max_content_length = max_size + UPLOAD_FORM_OVERHEAD
+    try:
+        file = request.files.get(field)
+    except RequestEntityTooLarge:
+        raise UploadTooLarge(max_size)
+    if file is not None and max_size and upload_size(file) > max_size:
+        raise UploadTooLarge(max_size)
+    return file
+
+
+def upload_size(file):
+    if isinstance(file.stream, HashingSpool):
+        return file.stream.size
+    position = file.stream.tell()
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(position)
+    return size
+
+
+def upload_hash(file):
+    """sha256 of the upload, already computed while parsing for HashingSpool streams"""
+    if isinstance(file.stream, HashingSpool):
+        return file.stream.hexdigest()
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    for block in iter(lambda: file.stream.read(1024 * 1024), b""):
+        digest.update(block)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def upload_bytes(file):
+    file.stream.seek(0)
+    data = file.stream.read()
+    file.stream.seek(0)
+    return data
+
+
+def save_upload(file, path):
+    """Write the upload to path atomically, readers never see a partial file"""
+    temp_path = f"{path}.{uuid.uuid4()}.part"
+    file.stream.seek(0)
+    try:
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(file.stream, f, 1024 * 1024)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    file.stream.seek(0)
@@ -0,0 +1,104 @@
+"""Disk writes, upload size and local latency of preparing audio for transcription, before and after.
+
+    python benchmarks/audio_io.py --minutes 2 5 20 --uplink 50
+
+"before" is the original YouTube path of audio_to_text_content: the downloaded stream is
+written to disk, decoded with AudioFileClip into a .wav file next to it, and that file is
+read back for the upload. "after" is transcribe_audio_bytes as audio_to_text_content calls
+it, for an m4a stream (accepted as is) and a Matroska one (re-encoded to mp3); audio longer
+than TRANSCRIBE_WINDOW_SECONDS is instead decoded and uploaded as WAV segments (see
+text_api/transcribe.py). The transcription call only counts the bytes it would upload, the
+upload time is modeled at --uplink Mbit/s. Disk writes are the files left in the temp dirs
+when they are removed. "*" marks uploads over the 25 MB the API takes in one request,
+which the original path sent anyway. Audio is generated with the ffmpeg moviepy uses.
+"""
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+import _setup
+import imageio_ffmpeg
+from moviepy import AudioFileClip
+import text_api.utils
+from text_api.utils import transcribe_audio_bytes
+
+# the real path only re-encodes containers the API rejects, .mka stands for those
+SOURCES = (("m4a", ["-c:a", "aac", "-b:a", "128k"]), ("mka", ["-c:a", "libvorbis", "-q:a", "4"]))
+API_MAX_BYTES = 25 * 1024 * 1024
+
+written = []
+uploads = []
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class CountingTemporaryDirectory(tempfile.TemporaryDirectory):
+    def cleanup(self):
+        written.append(_directory_size(self.name))
+        super().cleanup()
+
+
+def fake_transcribe(data, filename):
+    uploads.append(len(data))
+    return "text"
+
+
+def make_audio(path, minutes, codec_args):
+    subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"anoisesrc=d={minutes * 60}:c=pink:a=0.2", *codec_args, path], check=True)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def before(filename, data):
+    with CountingTemporaryDirectory() as work_dir:
+        downloaded_file = os.path.join(work_dir, filename)
+        with open(downloaded_file, "wb") as f:
+            f.write(data)
+        audio_clip = AudioFileClip(downloaded_file)
+        file_path = os.path.splitext(downloaded_file)[0] + ".wav"
+        audio_clip.write_audiofile(file_path, logger=None)
+        audio_clip.close()
+        os.path.getsize(file_path)
+        with open(file_path, "rb") as audio_file:
+            fake_transcribe(audio_file.read(), file_path)
+
+
+def after(filename, data):
+    transcribe_audio_bytes(data, filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, nargs="+", default=[2, 5, 20])
+    parser.add_argument("--uplink", type=float, default=50, help="modeled upload bandwidth in Mbit/s")
+    args = parser.parse_args()
+
+    tempfile.TemporaryDirectory = CountingTemporaryDirectory
+    text_api.utils._transcribe_once = fake_transcribe
+
+    print(f"{'audio':<12}{'path':<8}{'local s':>9}{'disk MB':>9}{'upload MB':>11}{'requests':>10}"
+          f"{'upload s':>10}{'total s':>9}")
+    with tempfile.TemporaryDirectory() as source_dir:
+        for minutes in args.minutes:
+            for ext, codec_args in SOURCES:
+                filename = f"audio.{ext}"
+                data = make_audio(os.path.join(source_dir, f"source.{ext}"), minutes, codec_args)
+                for label, run in (("before", before), ("after", after)):
+                    written.clear()
+                    uploads.clear()
+                    started = time.perf_counter()
+                    run(filename, data)
+                    elapsed = time.perf_counter() - started
+                    upload_seconds = sum(uploads) * 8 / (args.uplink * 1e6)
+                    too_large = "*" if max(uploads) > API_MAX_BYTES else ""
+                    print(f"{f'{minutes} min {ext}':<12}{label:<8}{elapsed:>9.2f}{sum(written) / 1e6:>9.1f}"
+                          f"{sum(uploads) / 1e6:>10.1f}{too_large:1}{len(uploads):>10}{upload_seconds:>10.1f}"
+                          f"{elapsed + upload_seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Per-request cost of building the retrieval chain, before and after caching it.
+
+    python benchmarks/chain_construction.py --requests 200
+
+"before" is the original excel/rag get_answer_from_query: a ChatOpenAI, a vector store,
+a retriever and ConversationalRetrievalChain.from_llm on every request (a new
+QdrantClient per request isn't counted, so the old cost is understated). "after" is
+get_retrieval_chain, built once and reused. The first table only constructs, the second
+also answers through a fake LLM and an in-memory Qdrant, so no time goes to the network.
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+import statistics
+import _setup
+from qdrant_client import QdrantClient
+from langchain_openai import ChatOpenAI
+from langchain_qdrant import QdrantVectorStore
+from langchain.chains import ConversationalRetrievalChain
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import app.chains
+from app.qdrant import set_client, get_vectorstore
+
+sys.path.insert(0, os.path.join(_setup.ROOT, "tests"))
+from fakes import RecordingChatModel
+
+COLLECTION = "bench_chain"
+MODEL_NAME = "gpt-4o-mini"
+QUESTION = "How is it different from XLOOKUP?"
+
+
+def _history():
+    """One earlier turn, so both flows also condense the question"""
+    warnings.filterwarnings("ignore", module="langchain")
+    history = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    history.chat_memory.messages = [HumanMessage(content="What does VLOOKUP do?"),
+                                    AIMessage(content="It searches the first column of a range.")]
+    return history
+
+
+def build_before(client, embeddings, fake_llm=None):
+    vectorstore = QdrantVectorStore(client=client, collection_name=COLLECTION, embedding=embeddings)
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    # the ChatOpenAI is still built when a fake answers, its client setup is part of the old cost
+    llm = ChatOpenAI(model=MODEL_NAME, temperature=0.5)
+    llm = fake_llm or llm
+    return ConversationalRetrievalChain.from_llm(llm=llm, retriever=retriever, memory=_history(),
+                                                 return_source_documents=False)
+
+
+def build_after(embeddings):
+    vectorstore = get_vectorstore(COLLECTION, embeddings, create=False)
+    return app.chains.get_retrieval_chain(vectorstore, MODEL_NAME, temperature=0.5, top_k=3)
+
+
+def per_request(function, requests):
+    """Median microseconds per call, steadier than a batch average when a GC pause lands in one run"""
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def report(title, before, after):
+    print(f"\n{title:<28}{'us/request':>12}")
+    print(f"{'before':<28}{before:>12.1f}\n{'after':<28}{after:>12.1f}\n{'saved':<28}{before - after:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    client = QdrantClient(":memory:")
+    set_client(client)
+    embeddings = DeterministicFakeEmbedding(size=1536)
+    get_vectorstore(COLLECTION, embeddings).add_texts(
+        [f"{name} looks up a value in a table range." for name in ("VLOOKUP", "XLOOKUP", "HLOOKUP", "INDEX", "MATCH")])
+
+    build_after(embeddings)
+    report("construction only", per_request(lambda: build_before(client, embeddings), args.requests),
+           per_request(lambda: build_after(embeddings), args.requests))
+
+    model = RecordingChatModel(responses=["VLOOKUP searches the first column of a range."])
+    app.chains.get_chat_model = lambda *args, **kwargs: model
+    app.chains._chains.clear()
+
+    def ask_before():
+        model.reset()
+        build_before(client, embeddings, model).invoke({"question": QUESTION})
+
+    def ask_after():
+        model.reset()
+        app.chains.ask_retrieval_chain(build_after(embeddings), QUESTION, _history())
+
+    ask_after()
+    report("request with a fake LLM", per_request(ask_before, args.requests), per_request(ask_after, args.requests))
+
+
+if __name__ == "__main__":
+    main()
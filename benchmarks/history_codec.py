@@ -0,0 +1,60 @@
+"""Stored size and encode/decode time of chat messages per history codec.
+
+    python benchmarks/history_codec.py --messages 2000
+
+"json" is the original format ({"type", "content", "timestamp"} dicts), the others are
+the [type, epoch microseconds, content] rows of app.history_codec with and without zlib
+for long replies. Messages alternate short questions and AI replies of a few hundred to
+a few thousand characters. Decode is deserialize_messages, so it includes building the
+LangChain message objects as a history load does; every codec must read back the same
+messages.
+"""
+import random
+import argparse
+from datetime import datetime, timedelta
+import _setup
+from _setup import timed
+from app import history_codec
+from app.history_codec import encode_message
+from app.history_store import deserialize_messages
+
+WORDS = ("the range lookup value column returns first match table formula sheet cell "
+         "outfit dinner tonight movie weekend because really think maybe").split()
+CODECS = (("json", 0), ("compact", 0), ("compact", 1024), ("msgpack", 0), ("msgpack", 1024))
+
+
+def make_messages(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 6, 9)
+    messages = []
+    for i in range(count):
+        words = rng.randint(5, 20) if i % 2 == 0 else rng.randint(60, 600)
+        content = " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+        timestamp = (start + timedelta(seconds=i * 7, microseconds=rng.randint(0, 999999))).isoformat()
+        messages.append(("human" if i % 2 == 0 else "ai", content, timestamp))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    baseline = None
+    print(f"{'codec':<16}{'bytes/msg':>10}{'size':>8}{'encode us':>11}{'decode us':>11}")
+    for codec, compress_min in CODECS:
+        history_codec.HISTORY_COMPRESS_MIN = compress_min
+        encode_time, data = timed(lambda: [encode_message(*message, codec=codec) for message in messages])
+        decode_time, decoded = timed(deserialize_messages, data)
+        assert [(msg.type, msg.content, msg.additional_kwargs["timestamp"]) for msg in decoded] == messages
+
+        size = sum(len(value.encode()) for value in data)
+        baseline = baseline or size
+        name = codec + (" + zlib" if compress_min else "")
+        print(f"{name:<16}{size / len(data):>10.0f}{size / baseline:>8.0%}"
+              f"{encode_time / len(data) * 1e6:>11.2f}{decode_time / len(data) * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
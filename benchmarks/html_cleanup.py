@@ -0,0 +1,75 @@
+"""Pages per second of crawled HTML cleanup, before and after the combined selector.
+
+    python benchmarks/html_cleanup.py --repeat 20
+
+"before" is the original extract_clean_text (html.parser, 13 separate find/select passes)
+without the fetch, "after" is common.clean_html_text with html.parser (the default) and
+with lxml. Pages are the saved w3schools-style corpus in tests/fixtures/w3schools plus a
+full-size page (~60 KB, like a real w3schools tutorial page) made by repeating the body
+of one of them. The last column counts pages whose text differs from "before".
+"""
+import os
+import argparse
+import _setup
+from _setup import timed
+from bs4 import BeautifulSoup
+import common
+
+CORPUS = os.path.join(_setup.ROOT, "tests", "fixtures", "w3schools")
+
+
+def clean_text_before(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(["script", "style", "nav", "footer", "header", "aside"]):
+        tag.decompose()
+    classes_to_remove = ["w3-sidebar", "sidesection","leftmenuinner",
+                        "ws-hide-on-logged-in", "footer", "topnavcontainer",
+                        "w3-clear", 'user-profile-bottom-wrapper', "ga-bottom",
+                        "fa", ]
+    for class_name in classes_to_remove:
+        for tag in soup.select(f".{class_name}"):
+            tag.decompose()
+    ids_to_remove = ["spacemyfooter", "top-nav-bar"]
+    for id_name in ids_to_remove:
+        for tag in soup.select(f"#{id_name}"):
+            tag.decompose()
+    text = soup.get_text(separator="\n")
+    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    return text
+
+
+def load_pages():
+    pages = {}
+    for name in sorted(os.listdir(CORPUS)):
+        with open(os.path.join(CORPUS, name), encoding="utf-8") as f:
+            pages[name] = f.read()
+    html = pages["excel_vlookup.html"]
+    start, end = html.index("<h2>VLOOKUP Function</h2>"), html.index("<h2>Example</h2>")
+    pages["full_size.html"] = html[:start] + html[start:end] * 25 + html[end:]
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the pages per timing")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    expected = {name: clean_text_before(html) for name, html in pages.items()}
+    runs = [("before", clean_text_before), ("after html.parser", lambda html: common.clean_html_text(html, "html.parser"))]
+    try:
+        import lxml
+        runs.append(("after lxml", lambda html: common.clean_html_text(html, "lxml")))
+    except ImportError:
+        print("lxml is not installed, skipping it")
+
+    for label, names in (("corpus", [name for name in pages if name != "full_size.html"]), ("full size", ["full_size.html"])):
+        print(f"\n{label + ' pages':<22}{'pages/s':>10}{'differs':>10}")
+        for name, clean in runs:
+            elapsed, texts = timed(lambda: [clean(pages[page]) for page in names * args.repeat])
+            differs = sum(text != expected[page] for page, text in zip(names, texts))
+            print(f"{name:<22}{len(names) * args.repeat / elapsed:>10.0f}{differs:>10}")
+
+
+if __name__ == "__main__":
+    main()
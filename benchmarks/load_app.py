@@ -0,0 +1,59 @@
+"""WSGI app served by load_test.py.
+
+/chat answers through a LangChain chain whose fake model sleeps LOAD_LLM_LATENCY seconds,
+like an API round-trip. /cpu-job builds BM25 indexes for LOAD_CPU_SECONDS in the
+background, on a real OS thread (native=1, app.threads) or a plain threading.Thread,
+which is a greenlet on the gevent hub.
+"""
+import os
+import sys
+import time
+import random
+import threading
+import _setup
+from flask import Flask, request
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from app.hybrid import BM25Index
+from app.threads import start_thread
+
+sys.path.insert(0, os.path.join(_setup.ROOT, "tests"))
+from fakes import RecordingChatModel
+
+LATENCY = float(os.getenv("LOAD_LLM_LATENCY", 0.5))
+CPU_SECONDS = float(os.getenv("LOAD_CPU_SECONDS", 3))
+WORDS = "alpha beta gamma delta VLOOKUP XLOOKUP sum range cell table pivot chart".split()
+
+app = Flask(__name__)
+model = RecordingChatModel(latency=LATENCY, responses=["VLOOKUP looks up a value in the first column."])
+chain = ChatPromptTemplate.from_messages([("human", "{question}")]) | model | StrOutputParser()
+rng = random.Random(0)
+documents = [Document(page_content=" ".join(rng.choice(WORDS) for _ in range(200))) for _ in range(2000)]
+
+
+def _cpu_job():
+    deadline = time.time() + CPU_SECONDS
+    while time.time() < deadline:
+        BM25Index(documents)
+
+
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+
+@app.get("/chat")
+def chat():
+    # the fake model keeps every prompt, the load test doesn't need them
+    model.reset()
+    return {"answer": chain.invoke({"question": "What does VLOOKUP do?"})}
+
+
+@app.post("/cpu-job")
+def cpu_job():
+    if request.args.get("native") == "1":
+        start_thread(_cpu_job, name="cpu-job")
+    else:
+        threading.Thread(target=_cpu_job, daemon=True).start()
+    return {"started": True}
@@ -0,0 +1,134 @@
+"""Requests per second of sync vs gevent gunicorn workers against a fixed-latency fake LLM.
+
+    pip install -r requirements-dev.txt
+    python benchmarks/load_test.py --workers 2 --clients 64 --seconds 10 --latency 0.5
+
+Each worker class serves benchmarks/load_app.py. The second table keeps a light load
+on one gevent worker while a CPU-bound background job runs, once on a plain thread
+(a greenlet under gevent) and once on a real OS thread via app.threads, and reports
+the /chat latency meanwhile.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import requests
+import _setup
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_class, workers, latency, cpu_seconds):
+    port = _free_port()
+    env = {**os.environ, "LOAD_LLM_LATENCY": str(latency), "LOAD_CPU_SECONDS": str(cpu_seconds)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn",
+         "--worker-class", worker_class, "--workers", str(workers), "--worker-connections", "1000",
+         "--bind", f"127.0.0.1:{port}", "--timeout", "120", "--log-level", "warning", "load_app:app"],
+        cwd=BENCH_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/health", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{worker_class} server didn't start")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+def run_load(url, clients, seconds):
+    """Closed loop: every client sends its next /chat request as soon as the last one returns"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def client():
+        session = requests.Session()
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                session.get(f"{url}/chat", timeout=120).raise_for_status()
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(e)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {"rps": len(latencies) / elapsed, "p50": _percentile(latencies, 50), "p95": _percentile(latencies, 95),
+            "max": max(latencies, default=0), "errors": len(errors)}
+
+
+def throughput(args):
+    print(f"{'worker':<8}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}{'errors':>8}")
+    for worker_class in ("sync", "gevent"):
+        process, url = start_server(worker_class, args.workers, args.latency, args.cpu_seconds)
+        try:
+            result = run_load(url, args.clients, args.seconds)
+        finally:
+            stop_server(process)
+        print(f"{worker_class:<8}{result['rps']:>8.1f}{result['p50']:>8.2f}{result['p95']:>8.2f}{result['errors']:>8}")
+
+
+def cpu_stall(args):
+    print(f"\n/chat on one gevent worker while a {args.cpu_seconds:g}s CPU job runs")
+    print(f"{'cpu job on':<12}{'req/s':>8}{'p95 s':>8}{'max s':>8}")
+    for label, native in (("greenlet", "0"), ("OS thread", "1")):
+        process, url = start_server("gevent", 1, args.latency, args.cpu_seconds)
+        # the job starts one second into the load and the load outlasts it
+        trigger = threading.Timer(1, requests.post, (f"{url}/cpu-job",), {"params": {"native": native}, "timeout": 60})
+        try:
+            trigger.start()
+            result = run_load(url, 8, args.cpu_seconds + 2)
+            trigger.join()
+        finally:
+            stop_server(process)
+        print(f"{label:<12}{result['rps']:>8.1f}{result['p95']:>8.2f}{result['max']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds the fake LLM takes per call")
+    parser.add_argument("--cpu-seconds", type=float, default=3)
+    args = parser.parse_args()
+    throughput(args)
+    cpu_stall(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Time and peak memory of turning a PDF into chunks, before and after streaming the pages.
+
+    python benchmarks/pdf_split.py --pages 300 600
+
+"before" is the original extract_text_from_pdf (text += page per page) followed by one
+split_text over the joined string, "after" is split_pages(iter_pdf_pages(...)). Both
+consume the chunks one by one, and the chunk lists are checked to be identical.
+"""
+import os
+import random
+import hashlib
+import argparse
+import tempfile
+import _setup
+import fitz
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from rag_on_doc.utils import iter_pdf_pages, split_pages
+
+WORDS = "alpha beta gamma delta VLOOKUP XLOOKUP sum range cell table pivot chart formula".split()
+
+
+def make_pdf(path, pages, seed=0):
+    rng = random.Random(seed)
+    with fitz.open() as pdf:
+        for _ in range(pages):
+            page = pdf.new_page()
+            lines = []
+            for _ in range(45):
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12))))
+                if rng.random() < 0.15:
+                    lines.append("")
+            page.insert_textbox(page.rect + (36, 36, -36, -36), "\n".join(lines), fontsize=8)
+        pdf.save(path)
+
+
+def extract_text_from_pdf_before(file_path):
+    text = ""
+    with fitz.open(file_path) as pdf:
+        for page in pdf:
+            text += page.get_text()
+    return text
+
+
+def _digest(chunks):
+    digest = hashlib.sha256()
+    count = 0
+    for chunk in chunks:
+        digest.update(chunk.encode())
+        count += 1
+    return count, digest.hexdigest()
+
+
+def before(path, splitter):
+    return _digest(splitter.split_text(extract_text_from_pdf_before(path)))
+
+
+def after(path, splitter, workers=1):
+    return _digest(split_pages(iter_pdf_pages(path, workers=workers), splitter))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[300, 600])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="process pool size for the extra parallel extraction row")
+    args = parser.parse_args()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+    print(f"{'pages':>5}  {'variant':<18}{'seconds':>9}{'peak MB':>9}{'chunks':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for pages in args.pages:
+            path = os.path.join(tmp_dir, f"synthetic_{pages}.pdf")
+            make_pdf(path, pages)
+            rows = [
+                ("before", lambda: before(path, splitter), True),
+                ("after", lambda: after(path, splitter), True),
+                (f"after, {args.workers} procs", lambda: after(path, splitter, args.workers), False),
+            ]
+            expected = None
+            for name, run, traced in rows:
+                seconds, result = _setup.timed(run)
+                expected = expected or result
+                assert result == expected, f"{name} chunks differ from before"
+                # child processes aren't traced, so the parallel row reports time only
+                peak = f"{_setup.peak_memory(run) / 2 ** 20:9.1f}" if traced else f"{'-':>9}"
+                print(f"{pages:>5}  {name:<18}{seconds:>9.3f}{peak}{result[0]:>8}")
+
+
+if __name__ == "__main__":
+    main()
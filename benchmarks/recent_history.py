@@ -0,0 +1,114 @@
+"""Time and Redis bytes read by /gf/recent-chats over long histories, before and after per-day counts.
+
+    python benchmarks/recent_history.py --messages 10000 50000 --per-day 40
+
+"before" is the original load_recent_history: lrange of the last 5000 messages, every one
+JSON-parsed and its timestamp parsed to keep the latest day's. "after" reads the day count
+from the hash and lranges only those messages, every read goes to Redis. Both run on fakeredis, so the time is parsing and
+copying, the bytes column is what a real Redis would send over the network. The returned
+messages are checked to be identical.
+"""
+import json
+import argparse
+from datetime import datetime, timedelta
+import _setup
+from _setup import timed
+import fakeredis
+from langchain.schema import HumanMessage, AIMessage
+from langchain_community.chat_message_histories import ChatMessageHistory
+import gf_ai_chat.config
+from gf_ai_chat import utils
+
+SESSION_ID = "bench"
+KEY = f"user:{SESSION_ID}:history"
+
+
+def load_recent_history_before(redis_client, session_id):
+    key = f"user:{session_id}:history"
+    latest = redis_client.lindex(f"user:{session_id}:history", -1)
+    latest_time = json.loads(latest)["timestamp"] if latest else None
+    if latest_time:
+        latest_dt = datetime.fromisoformat(latest_time)
+        today_start = latest_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    all_msgs = redis_client.lrange(key, -5000, -1)
+
+    history = ChatMessageHistory()
+    for msg_json in all_msgs:
+        msg = json.loads(msg_json)
+        msg_time = datetime.fromisoformat(msg["timestamp"])
+        if msg_time >= today_start:
+            if msg["type"] == "human":
+                human_msg = HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
+                history.add_message(human_msg)
+            elif msg["type"] == "ai":
+                ai_msg = AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
+                history.add_message(ai_msg)
+
+    return history
+
+
+def fill_history(client, messages, per_day):
+    """messages legacy JSON messages, per_day of them on each day up to today"""
+    client.flushall()
+    start = datetime(2025, 1, 1, 8) - timedelta(days=messages // per_day)
+    values = []
+    for i in range(messages):
+        day = start + timedelta(days=(i - messages % per_day) // per_day + 1, seconds=i % per_day * 30)
+        values.append(json.dumps({
+            "type": "human" if i % 2 == 0 else "ai",
+            "content": f"message {i} about the outfit for tonight, and what we could watch after dinner",
+            "timestamp": day.isoformat(),
+        }))
+    for offset in range(0, len(values), 1000):
+        client.rpush(KEY, *values[offset:offset + 1000])
+
+
+def read_bytes(client, start):
+    return sum(len(value.encode()) for value in client.lrange(KEY, start, -1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--reads", type=int, default=20)
+    args = parser.parse_args()
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    gf_ai_chat.config.redis = client
+    gf_ai_chat.config.history_store.client = client
+    utils.redis_client = client
+
+    def read(times):
+        for _ in range(times):
+            history = utils.load_recent_history(SESSION_ID)
+        return [(msg.type, msg.content) for msg in history.messages]
+
+    def read_before(times):
+        for _ in range(times):
+            history = load_recent_history_before(client, SESSION_ID)
+        return [(msg.type, msg.content) for msg in history.messages]
+
+    print(f"{'messages':>9}{'returned':>10}{'before ms':>11}{'after ms':>10}"
+          f"{'before KB':>11}{'after KB':>10}{'backfill ms':>13}")
+    for messages in args.messages:
+        fill_history(client, messages, args.per_day)
+        # a legacy history is counted once, on its first read or save
+        backfill, _ = timed(utils._ensure_day_counts, SESSION_ID, KEY, repeat=1)
+        count = int(max(client.hgetall(utils._days_key(SESSION_ID)).items())[1])
+
+        before_time, expected = timed(read_before, args.reads)
+        after_time, returned = timed(read, args.reads)
+        assert returned == expected and len(returned) == count
+
+        print(f"{messages:>9}{count:>10}{before_time / args.reads * 1e3:>11.2f}"
+              f"{after_time / args.reads * 1e3:>10.3f}"
+              f"{read_bytes(client, -5000) / 1024:>11.0f}{read_bytes(client, -count) / 1024:>10.1f}"
+              f"{backfill * 1e3:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
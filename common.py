@@ -1,14 +1,29 @@
+import re
+import glob
+import json
+import time
+import uuid
+import hashlib
+import threading
 import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
-import fitz 
 from flask import jsonify
 from dotenv import load_dotenv
-from rag_on_doc.utils import get_qdrant_vectorstore, store_pdf_in_qdrant
+from qdrant_client.http import models
+from rag_on_doc.utils import get_qdrant_vectorstore, store_pdf_in_qdrant, iter_pdf_pages, split_pages
+from rag_on_doc.ingest import ingest_chunks
+from app.qdrant import get_client, ensure_payload_index
+from app.hybrid import HybridRetriever, get_bm25_index, forget_bm25_index
 
 load_dotenv()
 
@@ -18,6 +33,29 @@ topic = "Excel Sheet"
 
 main_url ="https://www.w3schools.com/excel/"
 
+CRAWL_FETCH_WORKERS = int(os.getenv("CRAWL_FETCH_WORKERS", 8))
+# concurrent requests to one host, keeps the crawl polite
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", 4))
+CRAWL_LLM_CONCURRENCY = int(os.getenv("CRAWL_LLM_CONCURRENCY", 8))
+CRAWL_RETRIES = 3
+CRAWL_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
+
+tags_to_remove = ["script", "style", "nav", "footer", "header", "aside"]
+classes_to_remove = ["w3-sidebar", "sidesection","leftmenuinner", 
+                    "ws-hide-on-logged-in", "footer", "topnavcontainer",
+                    "w3-clear", 'user-profile-bottom-wrapper', "ga-bottom",
+                    "fa", ]
+ids_to_remove = ["spacemyfooter", "top-nav-bar"]
+REMOVE_SELECTOR = ", ".join(tags_to_remove + [f".{name}" for name in classes_to_remove] + [f"#{name}" for name in ids_to_remove])
+
+# HTML_PARSER=lxml parses several times faster, but it repairs misnested tags differently
+# from html.parser, so the extracted text of such pages can change
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+
+_crawl_lock = threading.Lock()
+_http_session = None
+_host_slots = {}
+
 
 excel_links = [
     "index.php",
@@ -130,40 +168,56 @@ excel_links = [
 
 
 
-def extract_clean_text(url):
-    print(f"Fetching: {url}")
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    # print(soup, "soup")
+def get_http_session():
+    """Pooled session shared by the crawler threads, retrying throttled and failed requests with backoff"""
+    global _http_session
+    with _crawl_lock:
+        if _http_session is None:
+            retry = Retry(total=CRAWL_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET", "HEAD"])
+            adapter = HTTPAdapter(pool_connections=CRAWL_FETCH_WORKERS, pool_maxsize=CRAWL_FETCH_WORKERS, max_retries=retry)
+            _http_session = requests.Session()
+            _http_session.headers["User-Agent"] = CRAWL_USER_AGENT
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+        return _http_session
+
+
+def _host_slot(url):
+    host = urlsplit(url).netloc
+    with _crawl_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(CRAWL_PER_HOST)
+        return _host_slots[host]
 
-    # Remove unwanted sections
-    for tag in soup.find_all(["script", "style", "nav", "footer", "header", "aside"]):
-        tag.decompose()
-
-    # Remove unwanted sections by class names
-    classes_to_remove = ["w3-sidebar", "sidesection","leftmenuinner", 
-                        "ws-hide-on-logged-in", "footer", "topnavcontainer",
-                        "w3-clear", 'user-profile-bottom-wrapper', "ga-bottom",
-                        "fa", ]
-    for class_name in classes_to_remove:
-        for tag in soup.select(f".{class_name}"):
-            tag.decompose()
-    
-    ids_to_remove = ["spacemyfooter", "top-nav-bar"]
-    for id_name in ids_to_remove:
-        for tag in soup.select(f"#{id_name}"):
-            tag.decompose()
 
+def fetch_html(url):
+    with _host_slot(url):
+        response = get_http_session().get(url, timeout=30)
+    response.raise_for_status()
+    return response.text
 
 
+def clean_html_text(html, parser=None):
+    soup = BeautifulSoup(html, parser or HTML_PARSER)
+    # print(soup, "soup")
+
+    # Remove unwanted sections, tags, classes and ids in one pass over the tree
+    for tag in soup.select(REMOVE_SELECTOR):
+        # children of an already removed section are matched too
+        if not tag.decomposed:
+            tag.decompose()
+
     # Extract visible text
     text = soup.get_text(separator="\n")
     text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
     return text
 
-def crawl_and_extract():
-    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
+def extract_clean_text(url):
+    print(f"Fetching: {url}")
+    return clean_html_text(fetch_html(url))
 
+def get_extraction_chain():
     llm = ChatOpenAI(model=MODEL_NAME, temperature=0.3, openai_api_key=OPENAI_API_KEY)
 
     prompt = PromptTemplate(
@@ -185,62 +239,236 @@ def crawl_and_extract():
         ),
     )
 
-    chain = prompt | llm
+    return (prompt | llm).with_retry(stop_after_attempt=CRAWL_RETRIES)
 
-    batch_size = 10
-    output_dir = "results"
-    os.makedirs(output_dir, exist_ok=True)
+def load_checkpoint(path):
+    """Results of the URLs finished by earlier runs, {url: [extracted text, ...]}.
+
+    URLs that failed permanently (a 4xx response) are finished too, with no results.
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line cut short by an interrupted run
+                    continue
+                done[entry["url"]] = entry["results"]
+    return done
 
-    for batch_start in range(0, len(excel_links), batch_size):
-        batch_urls = excel_links[batch_start:batch_start + batch_size]
-        batch_results = []
-        index = batch_start // batch_size + 1
-        print("Processing batch:",index)
-
-        for url in batch_urls:
-            text = extract_clean_text(main_url + url)
-            chunks = splitter.split_text(text)
-
-            for i, chunk in enumerate(chunks):
-                response = chain.invoke({"topic": topic, "chunk": chunk})
-                batch_results.append(response.content.strip())
-        # Save batch results to a text file
-        batch_filename = os.path.join(output_dir, f"batch_{batch_start // batch_size + 1}.txt")
-        with open(batch_filename, "w", encoding="utf-8") as f:
-            for idx, result in enumerate(batch_results, 1):
+def is_permanent_failure(error):
+    # 4xx other than timeouts and throttling won't change on a rerun, 429s were already retried
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+def _write_batch_file(output_dir, index, urls, done):
+    batch_filename = os.path.join(output_dir, f"batch_{index}.txt")
+    with open(batch_filename, "w", encoding="utf-8") as f:
+        for url in urls:
+            for result in done.get(url, []):
                 f.write(f"{result}\n\n")
-        print("batch saved to", batch_filename)
+    print("batch saved to", batch_filename)
 
-def extract_text_from_pdf(file_path):
-    text = ""
-    with fitz.open(file_path) as pdf:
-        for page in pdf:
-            text += page.get_text()
-    return text
+def crawl_and_extract(links=None, base_url=main_url, output_dir="results", chain=None, batch_size=10,
+                      fetch_workers=None, max_concurrency=None):
+    """Fetch pages concurrently and extract their Excel content with batched LLM calls.
+
+    Every finished URL is appended to <output_dir>/checkpoint.jsonl, an interrupted run
+    picks up from there and only fetches and extracts the URLs that are missing. URLs
+    answering with a permanent 4xx are recorded there as finished without results.
+    batch_<n>.txt files are written from the finished URLs of each batch, URLs that
+    failed for another reason are logged and retried by the next run.
+    """
+    links = excel_links if links is None else links
+    fetch_workers = fetch_workers or CRAWL_FETCH_WORKERS
+    max_concurrency = max_concurrency or CRAWL_LLM_CONCURRENCY
+    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
+    chain = chain or get_extraction_chain()
+
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, "checkpoint.jsonl")
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"Resuming, {len(done)} URLs already extracted")
+
+    with ThreadPoolExecutor(max_workers=fetch_workers) as pool, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for batch_start in range(0, len(links), batch_size):
+            batch_urls = [base_url + url for url in links[batch_start:batch_start + batch_size]]
+            index = batch_start // batch_size + 1
+            pending = [url for url in batch_urls if url not in done]
+            print("Processing batch:", index, f"({len(pending)} of {len(batch_urls)} URLs to extract)")
+
+            pages = {}
+            for url, future in [(url, pool.submit(extract_clean_text, url)) for url in pending]:
+                try:
+                    pages[url] = splitter.split_text(future.result())
+                except Exception as e:
+                    print("Error:", url, e)
+                    if is_permanent_failure(e):
+                        done[url] = []
+                        checkpoint.write(json.dumps({"url": url, "results": [], "error": str(e)}) + "\n")
+                        checkpoint.flush()
+
+            inputs = [{"topic": topic, "chunk": chunk} for url in pages for chunk in pages[url]]
+            responses = iter(chain.batch(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True))
+            for url, chunks in pages.items():
+                results = [next(responses) for _ in chunks]
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    print("Error:", url, errors[0])
+                    continue
+                done[url] = [result.content.strip() for result in results]
+                checkpoint.write(json.dumps({"url": url, "results": done[url]}) + "\n")
+                checkpoint.flush()
+
+            _write_batch_file(output_dir, index, batch_urls, done)
+            failed = [url for url in batch_urls if url not in done]
+            if failed:
+                print("batch", index, f"is missing {len(failed)} URLs, run again to retry:", ", ".join(failed))
 
 def extract_content_from_pdf():
     file = "/Users/kalyanjyothula/Desktop/Home/GenAI/Excel-app/18BCS5EL-U5.pdf"
-    text =  extract_text_from_pdf(file)
-    if not text.strip():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = list(split_pages(iter_pdf_pages(file), splitter))
+    if not chunks:
             return jsonify({"error": "No text found in PDF"}), 400
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_text(text)
     print(f"Total chunks created: {len(chunks)}")
     collection_name="Excel_Docs_DB"
     vectorstore = get_qdrant_vectorstore(collection_name=collection_name)
     total = store_pdf_in_qdrant(vectorstore, chunks, collection_name=collection_name)
     print(f"Stored {total} chunks for the PDF.")    
 
-def store_to_qdrant():
-    vectorstore = get_qdrant_vectorstore(collection_name="Excel_Docs_DB")
-    for i in range(12):
-        if( i <= 0): continue
-        with open(f"results/batch_{i}.txt", "r", encoding="utf-8") as f:
-            content = f.read()
-        chunks = content.split("\n\n")
-        total = store_pdf_in_qdrant(vectorstore, chunks, collection_name="Excel_Docs_DB")
-        print(f"Stored {total} chunks from batch_{i}.txt to Qdrant.")
+def get_kb_point_id(source, text):
+    # the id depends only on the content, so unchanged chunks keep their point across syncs
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}:{hashlib.sha256(text.encode()).hexdigest()}"))
+
+def load_batch_chunks(output_dir="results"):
+    """Chunks of the results/batch_<n>.txt files written by crawl_and_extract, in batch order"""
+    files = sorted(glob.glob(os.path.join(output_dir, "batch_*.txt")),
+                   key=lambda path: int(re.search(r"batch_(\d+)\.txt$", path).group(1)))
+    chunks = []
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend(chunk.strip() for chunk in f.read().split("\n\n") if chunk.strip())
+    return chunks
+
+def _list_point_ids(client, collection_name, scroll_filter):
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, scroll_filter=scroll_filter, limit=1000,
+                                       offset=offset, with_payload=False, with_vectors=False)
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+def sync_knowledge_base(chunks, collection_name="Excel_Docs_DB", source="excel_kb", drop_unmanaged=False):
+    """Make the collection's `source` chunks match chunks, embedding only what changed.
+
+    Points carry metadata.source so chunks added by other tools (e.g. PDFs) are left
+    alone. drop_unmanaged also deletes points without a source, which cleans up the
+    duplicates left by the old add_texts based loading (and anything else unmarked).
+    """
+    vectorstore = get_qdrant_vectorstore(collection_name=collection_name)
+    client = get_client()
+    ensure_payload_index(collection_name, "metadata.source")
+
+    wanted = {}
+    for chunk in chunks:
+        wanted.setdefault(get_kb_point_id(source, chunk), chunk)
+    existing = _list_point_ids(client, collection_name, models.Filter(must=[
+        models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source)),
+    ]))
+
+    new_ids = [point_id for point_id in wanted if point_id not in existing]
+    stale_ids = [point_id for point_id in existing if point_id not in wanted]
+    if drop_unmanaged:
+        stale_ids += list(_list_point_ids(client, collection_name, models.Filter(must=[
+            models.IsEmptyCondition(is_empty=models.PayloadField(key="metadata.source")),
+        ])))
+
+    added = 0
+    if new_ids:
+        added, _ = ingest_chunks(
+            vectorstore,
+            [wanted[point_id] for point_id in new_ids],
+            metadata={"source": source},
+            point_id=lambda index, text: get_kb_point_id(source, text),
+        )
+    if stale_ids:
+        client.delete(collection_name=collection_name, points_selector=models.PointIdsList(points=stale_ids))
+    forget_bm25_index(collection_name)
+    result = {"added": added, "deleted": len(stale_ids), "unchanged": len(wanted) - len(new_ids)}
+    print(f"Synced {collection_name}: {result}")
+    return result
+
+def store_to_qdrant(drop_unmanaged=False):
+    return sync_knowledge_base(load_batch_chunks("results"), collection_name="Excel_Docs_DB", drop_unmanaged=drop_unmanaged)
+
+def load_eval_cases(path):
+    """Retrieval evaluation cases from a JSONL file of {"question": ..., "expected": [text, ...]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def make_function_cases(chunks, limit=50):
+    """Offline cases from the knowledge base itself, one question per Excel function it documents"""
+    names = Counter(name for chunk in chunks for name in set(re.findall(r"\b([A-Z][A-Z0-9]+(?:\.[A-Z0-9]+)*)\(", chunk)))
+    return [
+        {"question": f"How do I use the {name} function in Excel?", "expected": [f"{name}("]}
+        for name, _ in names.most_common(limit)
+    ]
+
+def _is_relevant(doc, expected):
+    content = doc.page_content.lower()
+    return any(text.lower() in content for text in expected)
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def evaluate_retrieval(cases, collection_name="Excel_Docs_DB", ks=(1, 3, 5), rerank=False):
+    """Report recall@k and per-query latency of dense, BM25 and hybrid retrieval over cases.
+
+    A case counts as recalled at k when one of the first k chunks contains any of its
+    expected texts. Nothing is sent to the chat model, only the query embeddings are
+    requested (and cached by the embedding cache for repeated runs).
+    """
+    vectorstore = get_qdrant_vectorstore(collection_name=collection_name)
+    top_k = max(ks)
+    started = time.perf_counter()
+    bm25 = get_bm25_index(collection_name)
+    index_ms = (time.perf_counter() - started) * 1000
+    retrievers = {
+        "dense": lambda query: vectorstore.similarity_search(query, k=top_k),
+        "bm25": lambda query: [doc for doc, _ in bm25.search(query, top_k)],
+        "hybrid": HybridRetriever(vectorstore=vectorstore, top_k=top_k).invoke,
+    }
+    if rerank:
+        retrievers["hybrid+rerank"] = HybridRetriever(vectorstore=vectorstore, top_k=top_k, use_reranker=True).invoke
+
+    report = {"cases": len(cases), "bm25_index_ms": round(index_ms, 1), "bm25_documents": len(bm25.documents)}
+    for name, retrieve in retrievers.items():
+        hits = Counter()
+        latencies = []
+        for case in cases:
+            started = time.perf_counter()
+            docs = retrieve(case["question"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            ranks = [rank for rank, doc in enumerate(docs) if _is_relevant(doc, case["expected"])]
+            for k in ks:
+                if ranks and ranks[0] < k:
+                    hits[k] += 1
+        report[name] = {
+            **{f"recall@{k}": round(hits[k] / len(cases), 3) if cases else None for k in ks},
+            "p50_ms": round(_percentile(latencies, 50), 1) if latencies else None,
+            "p95_ms": round(_percentile(latencies, 95), 1) if latencies else None,
+        }
+        print(name, report[name])
+    return report
 
 if __name__ == "__main__":
     # crawl_and_extract()
@@ -249,3 +477,4 @@ if __name__ == "__main__":
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
     # extract_content_from_pdf()
     store_to_qdrant()
+    # evaluate_retrieval(make_function_cases(load_batch_chunks("results")))
@@ -1,5 +1,5 @@
 import os
-from upstash_redis import Redis
+from app.history_store import create_redis_client, HistoryStore
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
@@ -10,4 +10,5 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 REDIS_TOKEN = os.getenv("REDIS_TOKEN", "")
 REDIS_URL= os.getenv("REDIS_URL", "")
 
-redis = Redis(url=REDIS_URL, token=REDIS_TOKEN)
\ No newline at end of file
+redis = create_redis_client(REDIS_URL, REDIS_TOKEN)
+history_store = HistoryStore(redis)
\ No newline at end of file
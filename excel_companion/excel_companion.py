@@ -6,7 +6,8 @@ from flask_smorest import Blueprint
 from flask import jsonify, request, make_response
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from excel_companion.utils import load_user_chat_list, load_user_chat_messages, \
-    get_answer_from_query, save_user_chat_messages, get_session_id, save_chat_id
+    get_answer_from_query, save_user_chat_messages, get_session_id, save_chat_id, stream_answer_from_query
+from app.streaming import wants_stream, stream_response
 
 
 bp = Blueprint("excel-companion", __name__,)
@@ -92,10 +93,18 @@ def ask_query():
         
         time_stamp = datetime.utcnow().isoformat()
         history = load_user_chat_messages(session_id, chat_id)
-        human_msg = HumanMessage(content=query, additional_kwargs={"timestamp": time_stamp})
-        history.chat_memory.messages.append(human_msg)
-        history.chat_memory.messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
-        answer = get_answer_from_query(query, history, collection_name)
+        # "cache": false skips the semantic answer cache
+        use_cache = data.get("cache", True) is not False
+        if wants_stream():
+            def on_complete(answer):
+                save_user_chat_messages(session_id, chat_id, history, time_stamp, real_time=True)
+                return {"answer": answer, "chat_id": chat_id, "status": "success"}
+
+            tokens = stream_answer_from_query(query, history, collection_name, system_prompt=SYSTEM_PROMPT,
+                                              use_cache=use_cache)
+            return stream_response(tokens, on_complete, name="excel/query")
+        answer = get_answer_from_query(query, history, collection_name, system_prompt=SYSTEM_PROMPT,
+                                       use_cache=use_cache)
         save_user_chat_messages(session_id, chat_id, history, time_stamp, real_time=True)
 
         return jsonify({"answer": answer, "chat_id": chat_id , "status": "success"}), 200
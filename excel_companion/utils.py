@@ -3,17 +3,23 @@ import json
 import os
 from flask import request
 from datetime import datetime
-from excel_companion.config import redis as redis_client
-from langchain.schema import SystemMessage, HumanMessage, AIMessage
-from langchain.chains import ConversationalRetrievalChain
-from langchain_qdrant import QdrantVectorStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from qdrant_client import QdrantClient
+from excel_companion.config import redis as redis_client, history_store
+from app.qdrant import get_vectorstore
+from app.chains import get_retrieval_chain, ask_retrieval_chain, stream_retrieval_chain, prompt_version
+from app.embedding_cache import get_cached_embeddings
+from app.semantic_cache import SemanticCache
 from langchain.memory import ConversationBufferMemory
 
 session_memories = {}
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+MODEL_NAME = os.getenv("MODEL_NAME")
+# dense search fused with BM25 so exact function names (XLOOKUP, SUMIFS) are found at small top_k
+EXCEL_HYBRID_SEARCH = os.getenv("EXCEL_HYBRID_SEARCH", "1") == "1"
+# reorder the fused candidates with a local cross-encoder (RERANK_MODEL, needs transformers)
+EXCEL_RERANK = os.getenv("EXCEL_RERANK", "0") == "1"
+
+embeddings = get_cached_embeddings(model="text-embedding-3-small")
+semantic_cache = SemanticCache(embeddings)
 
 def get_session_id():
     session_id = request.cookies.get("session_id")
@@ -29,8 +35,7 @@ def get_chat_id():
 def save_chat_id(session_id, chat_id, title="Untitled Document"):
     key = f"excel_user_chat_list:{session_id}"
     message = {"chat_id": chat_id, "title": title, "timestamp": datetime.utcnow().isoformat()}
-    redis_client.rpush(key, json.dumps(message))
-    redis_client.expire(key, 60 * 60 * 24 * 7)
+    history_store.append(key, [json.dumps(message)])
 
 def load_user_chat_list(session_id):
     pattern = f"excel_user_chat_list:{session_id}"
@@ -40,63 +45,59 @@ def load_user_chat_list(session_id):
 # to load the message history of user chat 
 def load_user_chat_messages(session_id, chat_id):
     """Load message history from Redis"""
-    data = redis_client.lrange(f"excel_user_chat:{session_id}:{chat_id}", -20, -1)
-    messages = []
-    if data:
-        for msg in data:
-            msg = json.loads(msg)
-            if msg["type"] == "human":
-                messages.append(HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
-            elif msg["type"] == "ai":
-                messages.append(AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
-            elif msg["type"] == "system":
-                messages.append(SystemMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
+    messages = history_store.load_messages(f"excel_user_chat:{session_id}:{chat_id}", -20, -1, types=("human", "ai"))
     history = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
     history.chat_memory.messages.extend(messages)
     return history
 
 def save_user_chat_messages(session_id, chat_id, history, timestamp, real_time=False):
     """Save LangChain message history to Redis"""
-    serialized = []
     key = f"excel_user_chat:{session_id}:{chat_id}"
     message_list = history.chat_memory.messages if not real_time else history.chat_memory.messages[-2:]
-    for msg in message_list:
-        if isinstance(msg, HumanMessage):
-            serialized.append({"type": "human", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, AIMessage):
-            serialized.append({"type": "ai", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, SystemMessage):
-            serialized.append({"type": "system", "content": msg.content, "timestamp": timestamp})
-    json_messages = [json.dumps(m) for m in serialized]
-    redis_client.rpush(key, *json_messages)
-    redis_client.expire(key, 60 * 60 * 24 * 7)
-
-
-
-def get_answer_from_query(query, history, collection_name="pdf_docs", top_k=3):
-    client = QdrantClient(
-        url=os.getenv("QDRANT_URL"),
-        api_key=os.getenv("QDRANT_API_KEY")
-    )
-
-    model=os.getenv("MODEL_NAME")
-
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name=collection_name,
-        embedding=embeddings,
-    )
-
-    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
-
-    llm = ChatOpenAI(model=model, temperature=0.5)
-
-    qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        memory=history,
-        return_source_documents=False
-    )
-
-    answer = qa_chain.invoke({"question": query})
-    return answer["answer"]
+    history_store.append_messages(key, message_list, timestamp)
+
+
+
+def _cache_scope(collection_name, top_k, system_prompt):
+    # answers are only reused for the same knowledge base, model and prompt
+    return f"{collection_name}:{MODEL_NAME}:{top_k}:{prompt_version(system_prompt) if system_prompt else ''}" \
+        f"{':hybrid' if EXCEL_HYBRID_SEARCH else ''}{':rerank' if EXCEL_RERANK else ''}"
+
+def _use_semantic_cache(history, use_cache):
+    # follow-up questions depend on earlier turns, only standalone questions are cached
+    if use_cache and not history.chat_memory.messages:
+        return True
+    semantic_cache.bypass()
+    return False
+
+def get_answer_from_query(query, history, collection_name="pdf_docs", top_k=3, system_prompt=None, use_cache=True):
+    scope = _cache_scope(collection_name, top_k, system_prompt)
+    cacheable = _use_semantic_cache(history, use_cache)
+    if cacheable:
+        answer = semantic_cache.lookup(query, scope)
+        if answer is not None:
+            history.save_context({"question": query}, {"answer": answer})
+            return answer
+    vectorstore = get_vectorstore(collection_name, embeddings, create=False)
+    qa_chain = get_retrieval_chain(vectorstore, MODEL_NAME, temperature=0.5, top_k=top_k, system_prompt=system_prompt,
+                                   hybrid=EXCEL_HYBRID_SEARCH, rerank=EXCEL_RERANK)
+    answer = ask_retrieval_chain(qa_chain, query, history)
+    if cacheable:
+        semantic_cache.store(query, answer, scope)
+    return answer
+
+def stream_answer_from_query(query, history, collection_name="pdf_docs", top_k=3, system_prompt=None, use_cache=True):
+    scope = _cache_scope(collection_name, top_k, system_prompt)
+    cacheable = _use_semantic_cache(history, use_cache)
+    if cacheable:
+        answer = semantic_cache.lookup(query, scope)
+        if answer is not None:
+            history.save_context({"question": query}, {"answer": answer})
+            yield answer
+            return
+    vectorstore = get_vectorstore(collection_name, embeddings, create=False)
+    qa_chain = get_retrieval_chain(vectorstore, MODEL_NAME, temperature=0.5, top_k=top_k, streaming=True,
+                                   system_prompt=system_prompt, hybrid=EXCEL_HYBRID_SEARCH, rerank=EXCEL_RERANK)
+    yield from stream_retrieval_chain(qa_chain, query, history)
+    if cacheable:
+        semantic_cache.store(query, history.chat_memory.messages[-1].content, scope)
@@ -6,6 +6,8 @@ from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from langchain_openai import ChatOpenAI
 from gf_ai_chat.utils import get_session_id, load_session_history, \
     save_session_history,load_recent_history
+from app.streaming import wants_stream, stream_response
+from app.history_store import summary_messages
 
 
 bp = Blueprint("gf-chat", __name__,)
@@ -40,11 +42,21 @@ def ask():
             return jsonify({"status": "fail" , "error": "Message is required"}), 400
         time_stamp = datetime.utcnow().isoformat()
         
-        history = load_session_history(session_id)
+        history, summary = load_session_history(session_id)
         human_msg = HumanMessage(content=user_message, additional_kwargs={"timestamp": time_stamp})
         history.add_message(human_msg)
         # Build conversation
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + history.messages
+        messages = [SystemMessage(content=SYSTEM_PROMPT)] + summary_messages(summary) + history.messages
+        if wants_stream():
+            def on_complete(llm_reply):
+                time_stamp = datetime.utcnow().isoformat()
+                history.add_message(AIMessage(content=llm_reply, additional_kwargs={"timestamp": time_stamp}))
+                save_session_history(session_id, history, time_stamp, real_time=True)
+                return {"status": "success", "response": llm_reply, "timestamp": time_stamp}
+
+            resp = stream_response((chunk.content for chunk in llm.stream(messages)), on_complete, name="gf/ask")
+            resp.set_cookie("session_id", session_id, max_age=60 * 60 * 24 * 7)
+            return resp
         time_stamp = datetime.utcnow().isoformat()
         # Get AI response
         response = llm.invoke(messages)
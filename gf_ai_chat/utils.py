@@ -1,10 +1,8 @@
 import uuid
-import json
 from flask import request
-from gf_ai_chat.config import redis as redis_client
-from datetime import datetime
+from gf_ai_chat.config import redis as redis_client, history_store
+from app.history_store import deserialize_messages
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
 
 
 def get_session_id():
@@ -13,61 +11,73 @@ def get_session_id():
         user_id = str(uuid.uuid4())
     return user_id
 
+def _days_key(session_id):
+    return f"user:{session_id}:history:days"
+
+def _counted_key(session_id):
+    return f"user:{session_id}:history:counted"
+
+
 def load_session_history(session_id):
-    """Load message history from Redis"""
-    data = redis_client.lrange(f"user:{session_id}:history",0, -1)
+    """Load the recent turns and the summary of older ones from Redis"""
+    messages, summary = history_store.load_window(f"user:{session_id}:history")
     history = ChatMessageHistory()
-    if data:
-        for msg in data:
-            msg = json.loads(msg)
-            if msg["type"] == "human":
-                human_msg = HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(human_msg)
-            elif msg["type"] == "ai":
-                ai_msg = AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(ai_msg)
-    return history
+    history.add_messages(messages)
+    return history, summary
 
 
 def save_session_history(session_id, history, timestamp, real_time=False):
     """Save LangChain message history to Redis"""
-    serialized = []
     key = f"user:{session_id}:history"
     message_list = history.messages if not real_time else history.messages[-2:]
-    for msg in message_list:
-        if isinstance(msg, HumanMessage):
-            serialized.append({"type": "human", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, AIMessage):
-            serialized.append({"type": "ai", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, SystemMessage):
-            serialized.append({"type": "system", "content": msg.content, "timestamp": timestamp})
-    json_messages = [json.dumps(m) for m in serialized]
-    redis_client.rpush(key, *json_messages)
-    redis_client.expire(key, 60 * 60 * 24 * 7)
+
+    def count_day(pipe):
+        # messages per day, the latest day's messages are the tail of the list; days
+        # before the latest are never read and expire with the hash
+        pipe.hincrby(_days_key(session_id), timestamp[:10], len(message_list))
+        pipe.expire(_days_key(session_id), history_store.ttl)
+        pipe.set(_counted_key(session_id), 1, nx=True, ex=history_store.ttl)
+        pipe.expire(_counted_key(session_id), history_store.ttl)
+
+    results = history_store.append_window(key, message_list, timestamp, extra=count_day)
+    if results and results[2]:
+        # first save since per-day counts existed, older messages of the day weren't counted
+        _backfill_day_counts(session_id, key)
+
+
+def _backfill_day_counts(session_id, key):
+    """Count the latest day's messages of a history saved before per-day counts existed, idempotent"""
+    messages = deserialize_messages(redis_client.lrange(key, -5000, -1), ("human", "ai", "system"))
+    if not messages:
+        return None, 0
+    latest_day = messages[-1].additional_kwargs["timestamp"][:10]
+    count = 0
+    for msg in reversed(messages):
+        if msg.additional_kwargs["timestamp"][:10] != latest_day:
+            break
+        count += 1
+    redis_client.hset(_days_key(session_id), latest_day, count)
+    redis_client.expire(_days_key(session_id), history_store.ttl)
+    return latest_day, count
+
+
+def _ensure_day_counts(session_id, key):
+    """Backfill the day counts of a legacy history once per session, claimed with SET NX"""
+    if redis_client.set(_counted_key(session_id), 1, nx=True, ex=history_store.ttl):
+        _backfill_day_counts(session_id, key)
 
 
 def load_recent_history(session_id):
+    """Messages from the day of the latest message, read from the tail of the history list"""
     key = f"user:{session_id}:history"
-    latest = redis_client.lindex(f"user:{session_id}:history", -1)
-    latest_time = json.loads(latest)["timestamp"] if latest else None
-    if latest_time:
-        latest_dt = datetime.fromisoformat(latest_time)
-        today_start = latest_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    else:
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    all_msgs = redis_client.lrange(key, -5000, -1)
+    days = redis_client.hgetall(_days_key(session_id))
+    if not days:
+        # every save counts, so only sessions that never saved since can need it
+        _ensure_day_counts(session_id, key)
+        days = redis_client.hgetall(_days_key(session_id))
+    count = int(days[max(days)]) if days else 0
+    messages = history_store.load_messages(key, -count, -1, types=("human", "ai")) if count else []
 
     history = ChatMessageHistory()
-    for msg_json in all_msgs:
-        msg = json.loads(msg_json)
-        msg_time = datetime.fromisoformat(msg["timestamp"])
-        if msg_time >= today_start:
-            if msg["type"] == "human":
-                human_msg = HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(human_msg)
-            elif msg["type"] == "ai":
-                ai_msg = AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(ai_msg)
-
-    return history
\ No newline at end of file
+    history.add_messages(messages)
+    return history
@@ -0,0 +1,24 @@
+import os
+
+# loaded automatically by `gunicorn wsgi:app` from the working directory
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+
+# ASYNC_WORKERS=1 serves requests from gevent greenlets instead of one request per
+# sync worker. OpenAI, Upstash and Qdrant calls all go through httpx, which gevent
+# makes cooperative, so a worker keeps serving other requests while it waits on an
+# LLM round-trip and one process can hold up to worker_connections calls in flight.
+# Greenlets only switch on I/O though, so CPU-heavy work (PDF ingestion, BM25 index
+# builds, reranking) runs on real OS threads through app/threads.py; new CPU-bound
+# code on the request path should go through run_in_thread as well.
+# benchmarks/load_test.py compares both worker classes.
+if os.getenv("ASYNC_WORKERS") == "1":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+
+def worker_exit(server, worker):
+    # create_app starts the ingest consumer and cleanup sweeper, let them stop between jobs
+    from rag_on_doc.jobs import stop_background_workers
+    stop_background_workers(timeout=5)
@@ -0,0 +1,130 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from qdrant_client.http import models
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4))
+INGEST_UPSERT_CONCURRENCY = int(os.getenv("INGEST_UPSERT_CONCURRENCY", 1))
+
+_DONE = object()
+
+
+def ingest_chunks(vectorstore, chunks, metadata=None, point_id=None,
+                  batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY,
+                  upsert_concurrency=INGEST_UPSERT_CONCURRENCY, on_progress=None):
+    """Embed and upsert chunks in overlapping stages.
+
+    chunks can be any iterable (e.g. split_pages output), batches are embedded by
+    `concurrency` threads while earlier batches are upserted by `upsert_concurrency`
+    threads (one by default, a remote Qdrant can take more). Both queues are
+    bounded, so a slow stage holds the earlier ones back instead of buffering the
+    whole document. point_id(index, text) gives deterministic ids, metadata is
+    added to every chunk together with its index. on_progress(done, total) is
+    called after every upsert, total stays None until chunking has finished.
+
+    Returns (number of chunks stored, per-stage timings in seconds).
+    """
+    embedder = vectorstore.embeddings
+    client = vectorstore.client
+    embed_queue = queue.Queue(maxsize=concurrency * 2)
+    upsert_queue = queue.Queue(maxsize=max(concurrency, upsert_concurrency) * 2)
+    timings = {"chunking": 0.0, "embedding": 0.0, "upsert": 0.0, "total": 0.0}
+    state = {"stored": 0, "total": None}
+    errors = []
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def embed_worker():
+        while True:
+            item = embed_queue.get()
+            if item is _DONE:
+                return
+            if failed.is_set():
+                continue
+            try:
+                start = time.perf_counter()
+                vectors = embedder.embed_documents(item[1])
+                with lock:
+                    timings["embedding"] += time.perf_counter() - start
+                upsert_queue.put((item[0], item[1], vectors))
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+    def upsert_worker():
+        while True:
+            item = upsert_queue.get()
+            if item is _DONE:
+                return
+            if failed.is_set():
+                continue
+            try:
+                start = time.perf_counter()
+                first, texts, vectors = item
+                points = []
+                for offset, (text, vector) in enumerate(zip(texts, vectors)):
+                    index = first + offset
+                    points.append(models.PointStruct(
+                        id=point_id(index, text) if point_id else uuid.uuid4().hex,
+                        vector={vectorstore.vector_name: vector} if vectorstore.vector_name else vector,
+                        payload={
+                            vectorstore.content_payload_key: text,
+                            vectorstore.metadata_payload_key: {**(metadata or {}), "chunk": index},
+                        },
+                    ))
+                client.upsert(collection_name=vectorstore.collection_name, points=points)
+                with lock:
+                    timings["upsert"] += time.perf_counter() - start
+                    state["stored"] += len(points)
+                    stored, total = state["stored"], state["total"]
+                if on_progress:
+                    on_progress(stored, total)
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+    started = time.perf_counter()
+    embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(concurrency)]
+    upserters = [threading.Thread(target=upsert_worker, daemon=True) for _ in range(upsert_concurrency)]
+    for thread in embedders + upserters:
+        thread.start()
+
+    count = 0
+    batch = []
+    chunks = iter(chunks)
+    try:
+        while not failed.is_set():
+            start = time.perf_counter()
+            chunk = next(chunks, _DONE)
+            timings["chunking"] += time.perf_counter() - start
+            if chunk is _DONE:
+                break
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                embed_queue.put((count, batch))
+                count += len(batch)
+                batch = []
+        if batch and not failed.is_set():
+            embed_queue.put((count, batch))
+            count += len(batch)
+        with lock:
+            state["total"] = count
+    finally:
+        for _ in embedders:
+            embed_queue.put(_DONE)
+        for thread in embedders:
+            thread.join()
+        for _ in upserters:
+            upsert_queue.put(_DONE)
+        for thread in upserters:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    timings["total"] = time.perf_counter() - started
+    if on_progress:
+        on_progress(state["stored"], count)
+    return state["stored"], timings
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from rag_on_doc.config import redis as redis_client
+from app.threads import thread_pool_executor
+from rag_on_doc.utils import iter_pdf_pages, split_pages, store_doc_in_qdrant, \
+    is_doc_stored, get_doc_chunk_count, get_ingest_job, ingest_job_key, cleanup_orphaned_docs, INGEST_JOB_STALE_AFTER
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 2))
+# "local" runs jobs in this worker's thread pool, "redis" also queues them in Redis
+# so jobs left behind by a restarted worker are picked up again
+INGEST_QUEUE_BACKEND = os.getenv("INGEST_QUEUE_BACKEND", "local")
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", 2))
+JOB_TTL = 60 * 60 * 24
+JOB_STALE_AFTER = INGEST_JOB_STALE_AFTER
+# orphaned documents (all session references expired) are pruned this often by one worker
+DOC_CLEANUP_INTERVAL = int(os.getenv("DOC_CLEANUP_INTERVAL", 60 * 60))
+CLEANUP_LOCK_KEY = "pdf_docs:cleanup"
+QUEUE_KEY = "pdf_jobs:queue"
+# each consumer moves the jobs it runs to its own PROCESSING_KEY:<consumer id> list
+PROCESSING_KEY = "pdf_jobs:processing"
+CONSUMERS_KEY = "pdf_jobs:consumers"
+# a consumer whose heartbeat is older than this is gone, its jobs are requeued
+INGEST_CONSUMER_TTL = int(os.getenv("INGEST_CONSUMER_TTL", 30))
+CONSUMER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_consumer = None
+_sweeper = None
+# set by stop_background_workers, the consumer and sweeper loops exit once it is set
+_stop = threading.Event()
+
+
+def _job_key(job_id):
+    return ingest_job_key(job_id)
+
+def get_job(job_id):
+    return get_ingest_job(job_id)
+
+def _save_job(job):
+    job["updated_at"] = time.time()
+    redis_client.set(_job_key(job["job_id"]), json.dumps(job), ex=JOB_TTL)
+
+
+def run_job(job_id, doc_hash, file_path):
+    """Ingest one PDF, recording progress as chunks embedded out of total"""
+    job = {"job_id": job_id, "doc_hash": doc_hash, "status": "running", "processed": 0, "total": None, "error": None}
+    try:
+        if is_doc_stored(doc_hash):
+            total = get_doc_chunk_count(doc_hash)
+            job.update(status="done", processed=total, total=total)
+            return job
+        _save_job(job)
+
+        def on_progress(processed, total):
+            job.update(processed=processed, total=total)
+            _save_job(job)
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = split_pages(iter_pdf_pages(file_path), splitter)
+        total, timings = store_doc_in_qdrant(doc_hash, chunks, on_progress=on_progress)
+        if not total:
+            job.update(status="failed", error="No text found in PDF")
+        else:
+            job.update(status="done", processed=total, total=total, timings=timings)
+    except Exception as e:
+        job.update(status="failed", error=str(e))
+    finally:
+        _save_job(job)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    return job
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # real OS threads even under gevent, PDF parsing and splitting would stall the hub
+            _executor = thread_pool_executor(INGEST_WORKERS, thread_name_prefix="pdf-ingest")
+            _slots = threading.BoundedSemaphore(INGEST_WORKERS)
+        return _executor
+
+
+def _processing_key(consumer_id):
+    return f"{PROCESSING_KEY}:{consumer_id}"
+
+
+def _heartbeat_key(consumer_id):
+    return f"pdf_jobs:consumer:{consumer_id}"
+
+
+def _heartbeat(consumer_id):
+    # the heartbeat is set before registering so a live consumer is never seen without one
+    redis_client.set(_heartbeat_key(consumer_id), time.time(), ex=INGEST_CONSUMER_TTL)
+    redis_client.sadd(CONSUMERS_KEY, consumer_id)
+
+
+def _requeue(source):
+    moved = 0
+    while redis_client.lmove(source, QUEUE_KEY, "RIGHT", "LEFT"):
+        moved += 1
+    return moved
+
+
+def recover_orphaned_jobs():
+    """Requeue the jobs of consumers whose heartbeat expired, jobs of live consumers are left alone.
+
+    Rerunning is safe because ingestion upserts deterministic point ids. Each job is
+    moved atomically, so consumers recovering the same list never duplicate a job.
+    """
+    recovered = 0
+    for consumer_id in redis_client.smembers(CONSUMERS_KEY):
+        if redis_client.exists(_heartbeat_key(consumer_id)):
+            continue
+        recovered += _requeue(_processing_key(consumer_id))
+        redis_client.srem(CONSUMERS_KEY, consumer_id)
+    # shared list of workers from before per-consumer lists
+    recovered += _requeue(PROCESSING_KEY)
+    return recovered
+
+
+def _run_queued(raw, processing_key):
+    try:
+        payload = json.loads(raw)
+        run_job(payload["job_id"], payload["doc_hash"], payload["file_path"])
+    finally:
+        redis_client.lrem(processing_key, 1, raw)
+        _slots.release()
+
+
+def _consume(consumer_id=CONSUMER_ID, stop=_stop):
+    executor = _get_executor()
+    processing_key = _processing_key(consumer_id)
+    last_recovery = 0
+    while not stop.is_set():
+        try:
+            _heartbeat(consumer_id)
+            if time.time() - last_recovery >= INGEST_CONSUMER_TTL:
+                recovered = recover_orphaned_jobs()
+                if recovered:
+                    print(f"Requeued {recovered} ingest jobs of stopped workers")
+                last_recovery = time.time()
+        except Exception as e:
+            print("Error:", e)
+        # wait with a timeout so the heartbeat keeps going while every slot is busy
+        if not _slots.acquire(timeout=INGEST_POLL_INTERVAL):
+            continue
+        try:
+            raw = redis_client.lmove(QUEUE_KEY, processing_key, "LEFT", "RIGHT")
+        except Exception as e:
+            print("Error:", e)
+            raw = None
+        if not raw:
+            _slots.release()
+            stop.wait(INGEST_POLL_INTERVAL)
+            continue
+        executor.submit(_run_queued, raw, processing_key)
+
+
+def start_ingest_workers():
+    """Start the Redis queue consumer of this worker process when the redis backend is enabled"""
+    global _consumer
+    if INGEST_QUEUE_BACKEND != "redis":
+        return
+    with _lock:
+        if _consumer is None or not _consumer.is_alive():
+            _consumer = threading.Thread(target=_consume, name="pdf-ingest-consumer", daemon=True)
+            _consumer.start()
+
+
+def sweep_orphaned_docs():
+    """Prune orphaned documents unless another worker already did within DOC_CLEANUP_INTERVAL"""
+    if not redis_client.set(CLEANUP_LOCK_KEY, os.getpid(), nx=True, ex=DOC_CLEANUP_INTERVAL):
+        return None
+    return cleanup_orphaned_docs()
+
+
+def _sweep(stop=_stop):
+    while not stop.is_set():
+        try:
+            removed = sweep_orphaned_docs()
+            if removed:
+                print(f"Pruned {removed} orphaned documents")
+        except Exception as e:
+            print("Error:", e)
+        stop.wait(DOC_CLEANUP_INTERVAL)
+
+
+def start_cleanup_sweeper():
+    """Start the periodic orphaned-document sweep of this worker process"""
+    global _sweeper
+    with _lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep, name="pdf-doc-cleanup", daemon=True)
+            _sweeper.start()
+
+
+def start_background_workers():
+    """Start this worker process's queue consumer and cleanup sweeper, called from create_app"""
+    _stop.clear()
+    start_ingest_workers()
+    start_cleanup_sweeper()
+
+
+def stop_background_workers(timeout=None):
+    """Stop the consumer and sweeper loops, running ingest jobs are left to finish"""
+    _stop.set()
+    for thread in (_consumer, _sweeper):
+        if thread is not None:
+            thread.join(timeout)
+
+
+def submit_ingest_job(doc_hash, file_path):
+    """Queue ingestion of a stored upload, one job per document hash.
+
+    Submitting the same document again returns the queued or running job instead of
+    starting another one.
+    """
+    job_id = doc_hash
+    job = {"job_id": job_id, "doc_hash": doc_hash, "status": "queued", "processed": 0, "total": None,
+           "error": None, "updated_at": time.time()}
+    if is_doc_stored(doc_hash):
+        total = get_doc_chunk_count(doc_hash)
+        job.update(status="done", processed=total, total=total)
+        return job, False
+    if not redis_client.set(_job_key(job_id), json.dumps(job), nx=True, ex=JOB_TTL):
+        existing = get_job(job_id)
+        if existing and existing["status"] in ("queued", "running") \
+                and time.time() - existing.get("updated_at", 0) < JOB_STALE_AFTER:
+            return existing, False
+        _save_job(job)
+
+    if INGEST_QUEUE_BACKEND == "redis":
+        redis_client.rpush(QUEUE_KEY, json.dumps({"job_id": job_id, "doc_hash": doc_hash, "file_path": file_path}))
+        start_ingest_workers()
+    else:
+        _get_executor().submit(run_job, job_id, doc_hash, file_path)
+    return job, True
@@ -5,15 +5,19 @@ from datetime import datetime
 from flask_smorest import Blueprint
 from flask import jsonify, request, make_response
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from rag_on_doc.utils import extract_text_from_pdf, get_session_id, \
-    store_pdf_in_qdrant, get_answer_from_query, get_qdrant_vectorstore, \
-    get_doc_id, save_doc_chat_id, load_user_chat_list, load_user_chat_messages, save_user_chat_messages 
+from rag_on_doc.utils import get_session_id, get_answer_from_query, \
+    get_doc_id, save_doc_chat_id, load_user_chat_list, load_user_chat_messages, save_user_chat_messages, \
+    add_doc_reference, get_chat_doc_hash, release_doc_reference, SHARED_DOC_COLLECTION, \
+    stream_answer_from_query, is_doc_stored, is_valid_pdf, is_ingest_active, get_doc_chunk_count
+from app.uploads import get_upload, upload_hash, upload_bytes, save_upload, UploadTooLarge
+from app.streaming import wants_stream, stream_response
+from rag_on_doc.jobs import submit_ingest_job, get_job
 
 
 
 bp = Blueprint("docs-rag", __name__,)
 UPLOAD_FOLDER = "uploads"
+PDF_MAX_SIZE = int(os.getenv("PDF_MAX_SIZE", 2 * 1024 * 1024))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 SYSTEM_PROMPT = """
@@ -37,43 +41,72 @@ def index():
 
 @bp.post('/upload')
 def upload_pdf():
-    file = request.files.get("file")
+    try:
+        file = get_upload("file", max_size=PDF_MAX_SIZE)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 400
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
 
-    if file.content_length and file.content_length > 2 * 1024 * 1024:
-        return jsonify({"error": "File size exceeds 2MB"}), 400
-
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(file_path)
-
     session_id = get_session_id()
     doc_id = get_doc_id()
-
-    collection_name = f"{session_id}__{doc_id}"
+    # hashed while the upload was parsed, a document that is already stored never touches disk
+    doc_hash = upload_hash(file)
+    # named by content so concurrent uploads never collide and a re-upload maps to the same job
+    file_path = os.path.join(UPLOAD_FOLDER, f"{doc_hash}.pdf")
 
     try:
-        text = extract_text_from_pdf(file_path)
-        if not text.strip():
-            return jsonify({"error": "No text found in PDF"}), 400
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_text(text)
-
-        vectorstore = get_qdrant_vectorstore(collection_name=collection_name)
-        total = store_pdf_in_qdrant(vectorstore, chunks, collection_name=collection_name)
+        # the reference is taken first, a concurrent prune then either keeps the document
+        # or has finished deleting it by the time is_doc_stored is checked
+        add_doc_reference(session_id, doc_id, doc_hash)
+        if not is_doc_stored(doc_hash):
+            if not is_valid_pdf(upload_bytes(file)):
+                release_doc_reference(session_id, doc_id)
+                return jsonify({"error": "File is not a valid PDF"}), 400
+            save_upload(file, file_path)
+        job, _ = submit_ingest_job(doc_hash, file_path)
+        if job["status"] == "done" and os.path.exists(file_path):
+            os.remove(file_path)
         save_doc_chat_id(session_id, doc_id, title=file.filename)
 
-        os.remove(file_path)
-        resp = make_response(jsonify({"message": f"Stored {total} chunks for {file.filename}", "doc_id": doc_id}), 200)
+        # the job is polled by doc_id, content hashes never leave the server
+        resp = make_response(jsonify({
+            "message": f"Accepted {file.filename}",
+            "doc_id": doc_id,
+            "job_id": doc_id,
+            "status": job["status"]
+        }), 200 if job["status"] == "done" else 202)
         resp.set_cookie("session_id", session_id, max_age=60 * 60 * 24 * 7)
         return resp
     
     except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        try:
+            release_doc_reference(session_id, doc_id)
+            # a queued or running job removes the file itself once it has read it
+            if os.path.exists(file_path) and not is_ingest_active(doc_hash):
+                os.remove(file_path)
+        except Exception as cleanup_error:
+            print("Error:", cleanup_error)
         return jsonify({"error": str(e)}), 500
 
 
+@bp.get('/upload/<job_id>')
+def get_upload_status(job_id):
+    """Ingestion progress of an upload, only for the session that uploaded it"""
+    doc_hash = get_chat_doc_hash(get_session_id(), job_id)
+    if not doc_hash:
+        return jsonify({"error": "Unknown job_id"}), 404
+    job = get_job(doc_hash)
+    if not job:
+        # stored before this upload, or its job record expired
+        if not is_doc_stored(doc_hash):
+            return jsonify({"error": "Unknown job_id"}), 404
+        total = get_doc_chunk_count(doc_hash)
+        job = {"status": "done", "processed": total, "total": total, "error": None}
+    job = {key: value for key, value in job.items() if key != "doc_hash"}
+    return jsonify({**job, "job_id": job_id}), 200
+
+
 @bp.get('/chats-list')
 def get_chats_list():
     session_id = get_session_id()
@@ -108,6 +141,16 @@ def get_chat_history():
     resp = make_response(jsonify({"message": messages}), 200)
     return resp
 
+@bp.delete('/chat')
+def delete_chat():
+    session_id = request.cookies.get("session_id")
+    chat_id = request.get_json().get("chat_id")
+    if not session_id or not chat_id:
+        return jsonify({"error": "Missing session_id or chat_id"}), 400
+
+    removed = release_doc_reference(session_id, chat_id)
+    return jsonify({"message": "Chat released", "doc_removed": removed}), 200
+
 @bp.post('/ask')
 def ask_query():
     data = request.get_json()
@@ -119,17 +162,24 @@ def ask_query():
     if not chat_id:
         chat_id = str(uuid.uuid4())
 
-    collection_name = f"{session_id}__{chat_id}"
+    doc_hash = get_chat_doc_hash(session_id, chat_id)
+    # uploads made before deduplication still live in their own per-session collection
+    collection_name = SHARED_DOC_COLLECTION if doc_hash else f"{session_id}__{chat_id}"
     # print("Collection Name:", collection_name, "query", query, chat_id, session_id)
     if not query or not collection_name:
         return jsonify({"error": "Missing query or collection_name"}), 400
     
     time_stamp = datetime.utcnow().isoformat()
     history = load_user_chat_messages(session_id, chat_id)
-    human_msg = HumanMessage(content=query, additional_kwargs={"timestamp": time_stamp})
-    history.chat_memory.messages.append(human_msg)
-    history.chat_memory.messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
-    answer = get_answer_from_query(query, history, collection_name)
+    if wants_stream():
+        def on_complete(answer):
+            save_user_chat_messages(session_id, chat_id, history, time_stamp, real_time=True)
+            return {"answer": answer, "chat_id": chat_id}
+
+        tokens = stream_answer_from_query(query, history, collection_name, doc_hash=doc_hash,
+                                          system_prompt=SYSTEM_PROMPT)
+        return stream_response(tokens, on_complete, name="pdf/ask")
+    answer = get_answer_from_query(query, history, collection_name, doc_hash=doc_hash, system_prompt=SYSTEM_PROMPT)
 
     # ai_msg = AIMessage(content=answer, additional_kwargs={"timestamp": time_stamp})
     # history.chat_memory.messages.append(ai_msg)
@@ -1,28 +1,158 @@
 import fitz 
 import os
+import re
 import uuid
 import json
+import time
+import hashlib
+from bisect import bisect_left
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from langchain.chains import ConversationalRetrievalChain
-from langchain_qdrant import QdrantVectorStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams
+from qdrant_client.http import models
 from flask import request
-from rag_on_doc.config import redis as redis_client
+from rag_on_doc.config import redis as redis_client, history_store
+from app.qdrant import get_vectorstore, get_client, ensure_payload_index
+from app.chains import get_retrieval_chain, ask_retrieval_chain, stream_retrieval_chain
+from app.embedding_cache import get_cached_embeddings
+from app.threads import gevent_patched
+from rag_on_doc.ingest import ingest_chunks
 from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
 
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+MODEL_NAME = os.getenv("MODEL_NAME")
+SHARED_DOC_COLLECTION = os.getenv("PDF_SHARED_COLLECTION", "pdf_docs")
+DOC_TTL = 60 * 60 * 24 * 7
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 200))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_SPLIT_BUFFER = 8000
+# split_pages cuts approximately once it holds this many buffers without an exact cut point
+PDF_SPLIT_MAX_BUFFERS = 8
+# a document's reference and prune steps hold doc_lock:<hash> at most this long
+DOC_LOCK_TTL = 30
+# a queued/running ingest job without progress for this long was lost with its worker
+INGEST_JOB_STALE_AFTER = 60 * 10
 
+embeddings = get_cached_embeddings(model="text-embedding-3-small")
+
+
+def _open_pdf(source):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def is_valid_pdf(data):
+    try:
+        with _open_pdf(data) as pdf:
+            return pdf.page_count > 0
+    except Exception:
+        return False
+
+def _extract_page_range(source, start, stop):
+    with _open_pdf(source) as pdf:
+        return [pdf[i].get_text() for i in range(start, stop)]
+
+def iter_pdf_pages(source, workers=None):
+    """Yield the text of each page in order, large PDFs are extracted in a process pool"""
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    with _open_pdf(source) as pdf:
+        page_count = pdf.page_count
+        if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES or gevent_patched():
+            # process pools are not safe once gevent has patched threading (ASYNC_WORKERS=1)
+            for page in pdf:
+                yield page.get_text()
+            return
+
+    # several small ranges per worker so the first pages come back early
+    step = -(-page_count // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_extract_page_range, source, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        for future in futures:
+            yield from future.result()
+
+def _top_separator(splitter, text):
+    """Regex of the separator RecursiveCharacterTextSplitter splits text on first, "" for characters"""
+    is_regex = getattr(splitter, "_is_separator_regex", False)
+    for separator in getattr(splitter, "_separators", ["\n\n", "\n", " ", ""]):
+        pattern = separator if is_regex else re.escape(separator)
+        if separator == "" or re.search(pattern, text):
+            return pattern
+    return ""
+
+def _chunk_starts(text, chunks, overlap):
+    # the same search the splitter does for add_start_index
+    starts = []
+    index = previous = 0
+    for chunk in chunks:
+        found = text.find(chunk, max(0, index + previous - overlap))
+        index = found if found >= 0 else text.find(chunk)
+        starts.append(index)
+        previous = len(chunk)
+    return starts
+
+def _cut_point(buffer, chunks, splitter):
+    """(chunks that are final, offset to split again from), None when there is no exact cut.
+
+    A chunk is final when the separator split after it is complete, i.e. it ends before
+    the second to last separator, so no later text can change it. Splitting again from
+    the separator that opens a later chunk rebuilds the splitter's state (the overlap
+    carried into that chunk), so the chunks after the cut match the joined text too.
+    """
+    pattern = _top_separator(splitter, buffer)
+    if pattern:
+        matches = [(match.start(), match.end()) for match in re.finditer(pattern, buffer) if match.end() > match.start()]
+        if len(matches) < 2:
+            return None
+        last_final = matches[-2][0]
+    else:
+        last_final = len(buffer) - 1
+    starts = _chunk_starts(buffer, chunks, getattr(splitter, "_chunk_overlap", 0))
+    for index in range(len(chunks) - 1, 0, -1):
+        if starts[index - 1] + len(chunks[index - 1]) > last_final:
+            continue
+        if not pattern:
+            return index, starts[index]
+        # the chunk has to open a separator split, not start inside a long one
+        opening = bisect_left(matches, (starts[index], 0)) - 1
+        if opening >= 0 and not buffer[matches[opening][1]:starts[index]].strip():
+            return index, matches[opening][0]
+    return None
+
+def split_pages(pages, splitter, buffer_size=PDF_SPLIT_BUFFER):
+    """Split page texts as they arrive instead of joining the whole document first.
+
+    The chunks match splitter.split_text("".join(pages)) for a RecursiveCharacterTextSplitter,
+    except when the separator the joined text splits on first (a blank line) only shows up
+    after chunks were already yielded, or no exact cut point turns up within
+    PDF_SPLIT_MAX_BUFFERS buffers. Chunk boundaries near the cut can differ then, no text is lost.
+    """
+    buffer = ""
+    for text in pages:
+        buffer += text
+        if len(buffer) < buffer_size:
+            continue
+        chunks = splitter.split_text(buffer)
+        if not chunks:
+            buffer = ""
+            continue
+        cut = _cut_point(buffer, chunks, splitter)
+        if cut is None:
+            if len(buffer) < buffer_size * PDF_SPLIT_MAX_BUFFERS:
+                continue
+            # the last chunk may continue on the next page, so it is split again with it
+            tail_start = buffer.rfind(chunks[-1])
+            cut = len(chunks) - 1, max(tail_start, 0)
+        final, offset = cut
+        yield from chunks[:final]
+        buffer = buffer[offset:]
+    if buffer.strip():
+        yield from splitter.split_text(buffer)
 
 def extract_text_from_pdf(file_path):
-    text = ""
-    with fitz.open(file_path) as pdf:
-        for page in pdf:
-            text += page.get_text()
-    return text
+    return "".join(iter_pdf_pages(file_path))
 
 def get_session_id():
     session_id = request.cookies.get("session_id")
@@ -37,8 +167,7 @@ def get_doc_id():
 def save_doc_chat_id(session_id, doc_id, title="Untitled Document"):
     key = f"doc_chat:{session_id}"
     message = {"doc_id": doc_id, "title": title, "timestamp": datetime.utcnow().isoformat()}
-    redis_client.rpush(key, message)
-    redis_client.expire(key, 60 * 60 * 24 * 7)
+    history_store.append(key, [json.dumps(message)])
 
 # to load the chat ids associated with the document uploads
 def load_user_chat_list(session_id):
@@ -49,93 +178,162 @@ def load_user_chat_list(session_id):
 # to load the message history of user chat associated with document uploads
 def load_user_chat_messages(session_id, chat_id):
     """Load message history from Redis"""
-    data = redis_client.lrange(f"doc_user_chat:{session_id}:{chat_id}",-20, -1)
-    messages = []
-    if data:
-        for msg in data:
-            msg = json.loads(msg)
-            if msg["type"] == "human":
-                messages.append(HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
-            elif msg["type"] == "ai":
-                messages.append(AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
-            elif msg["type"] == "system":
-                messages.append(SystemMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]}))
+    messages = history_store.load_messages(f"doc_user_chat:{session_id}:{chat_id}", -20, -1, types=("human", "ai"))
     history = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
     history.chat_memory.messages.extend(messages)
     return history
 
 def save_user_chat_messages(session_id, chat_id, history, timestamp, real_time=False):
     """Save LangChain message history to Redis"""
-    serialized = []
     key = f"doc_user_chat:{session_id}:{chat_id}"
     message_list = history.chat_memory.messages if not real_time else history.chat_memory.messages[-2:]
-    for msg in message_list:
-        if isinstance(msg, HumanMessage):
-            serialized.append({"type": "human", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, AIMessage):
-            serialized.append({"type": "ai", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, SystemMessage):
-            serialized.append({"type": "system", "content": msg.content, "timestamp": timestamp})
-    json_messages = [json.dumps(m) for m in serialized]
-    redis_client.rpush(key, *json_messages)
-    redis_client.expire(key, 60 * 60 * 24 * 7)
+    history_store.append_messages(key, message_list, timestamp)
 
 
 def get_qdrant_vectorstore(collection_name="pdf_docs"):
-    client = QdrantClient(
-        url=os.getenv("QDRANT_URL"),
-        api_key=os.getenv("QDRANT_API_KEY")
-    )
+    return get_vectorstore(collection_name, embeddings)
 
-    if not client.collection_exists(collection_name):
-        client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=1536, distance="Cosine") 
-        )
 
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name=collection_name,
-        embedding=embeddings,
-    )
+def store_pdf_in_qdrant(vectorstore, chunks, collection_name="pdf_docs", metadatas=None, ids=None):
+    if vectorstore is None:
+        vectorstore = get_qdrant_vectorstore(collection_name)
+    ids = vectorstore.add_texts(chunks, metadatas=metadatas, ids=ids)
+    return len(ids)
+
+
+# every unique PDF is stored once in SHARED_DOC_COLLECTION, sessions only reference it by hash
+def get_file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_doc_point_id(doc_hash, index):
+    # deterministic ids make a repeated or concurrent ingest of the same document an upsert
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_hash}:{index}"))
 
+def get_shared_doc_vectorstore():
+    vectorstore = get_qdrant_vectorstore(SHARED_DOC_COLLECTION)
+    ensure_payload_index(SHARED_DOC_COLLECTION, "metadata.doc_hash")
     return vectorstore
 
+def is_doc_stored(doc_hash):
+    return bool(redis_client.exists(f"doc_store:{doc_hash}"))
 
-def store_pdf_in_qdrant(vectorstore, chunks, collection_name="pdf_docs"):
+def store_doc_in_qdrant(doc_hash, chunks, on_progress=None):
+    """Ingest a document's chunks into the shared collection, returns (total, stage timings)"""
+    vectorstore = get_shared_doc_vectorstore()
+    total, timings = ingest_chunks(
+        vectorstore,
+        chunks,
+        metadata={"doc_hash": doc_hash},
+        point_id=lambda index, text: get_doc_point_id(doc_hash, index),
+        on_progress=on_progress,
+    )
+    if total:
+        redis_client.set(f"doc_store:{doc_hash}", total)
+        redis_client.sadd("doc_store_hashes", doc_hash)
+    return total, timings
 
-    vectorstore = get_qdrant_vectorstore(collection_name)
-    ids = vectorstore.add_texts(chunks)
-    return len(ids)
+def get_doc_chunk_count(doc_hash):
+    total = redis_client.get(f"doc_store:{doc_hash}")
+    return int(total) if total else 0
 
+@contextmanager
+def doc_lock(doc_hash, timeout=DOC_LOCK_TTL):
+    """Redis lock that serializes adding references to a document with pruning it"""
+    key = f"doc_lock:{doc_hash}"
+    token = str(uuid.uuid4())
+    deadline = time.time() + timeout
+    while not redis_client.set(key, token, nx=True, ex=DOC_LOCK_TTL):
+        if time.time() > deadline:
+            raise TimeoutError(f"Document {doc_hash} is locked")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        if redis_client.get(key) == token:
+            redis_client.delete(key)
 
+def add_doc_reference(session_id, doc_id, doc_hash):
+    # refs are scored by expiry so references of expired sessions can be pruned
+    expires_at = time.time() + DOC_TTL
+    with doc_lock(doc_hash):
+        redis_client.zadd(f"doc_refs:{doc_hash}", {f"{session_id}:{doc_id}": expires_at})
+    redis_client.set(f"doc_hash:{session_id}:{doc_id}", doc_hash, ex=DOC_TTL)
 
-def get_answer_from_query(query, history, collection_name="pdf_docs", top_k=3):
-    client = QdrantClient(
-        url=os.getenv("QDRANT_URL"),
-        api_key=os.getenv("QDRANT_API_KEY")
-    )
+def get_chat_doc_hash(session_id, doc_id):
+    return redis_client.get(f"doc_hash:{session_id}:{doc_id}")
 
-    model=os.getenv("MODEL_NAME")
+def release_doc_reference(session_id, doc_id):
+    doc_hash = get_chat_doc_hash(session_id, doc_id)
+    if not doc_hash:
+        return False
+    redis_client.zrem(f"doc_refs:{doc_hash}", f"{session_id}:{doc_id}")
+    redis_client.delete(f"doc_hash:{session_id}:{doc_id}")
+    return prune_doc(doc_hash)
 
-    # embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name=collection_name,
-        embedding=embeddings,
-    )
+def ingest_job_key(job_id):
+    return f"pdf_job:{job_id}"
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
+def get_ingest_job(job_id):
+    raw = redis_client.get(ingest_job_key(job_id))
+    return json.loads(raw) if raw else None
+
+def is_ingest_active(doc_hash):
+    job = get_ingest_job(doc_hash)
+    return bool(job) and job["status"] in ("queued", "running") \
+        and time.time() - job.get("updated_at", 0) < INGEST_JOB_STALE_AFTER
+
+def prune_doc(doc_hash):
+    """Delete a stored document once no live session references it.
+
+    Runs under the document's lock, so an upload adding a reference either happens
+    before the check (and keeps the document) or after the points are gone (and sees
+    it as not stored). Documents with an ingest job in progress are left alone.
+    """
+    refs_key = f"doc_refs:{doc_hash}"
+    with doc_lock(doc_hash):
+        redis_client.zremrangebyscore(refs_key, 0, time.time())
+        if redis_client.zcard(refs_key) or is_ingest_active(doc_hash):
+            return False
+        redis_client.delete(f"doc_store:{doc_hash}")
+        redis_client.srem("doc_store_hashes", doc_hash)
+        client = get_client()
+        # a rejected upload on a fresh deployment has nothing to delete yet
+        if client.collection_exists(SHARED_DOC_COLLECTION):
+            client.delete(
+                collection_name=SHARED_DOC_COLLECTION,
+                points_selector=models.FilterSelector(filter=models.Filter(must=[
+                    models.FieldCondition(key="metadata.doc_hash", match=models.MatchValue(value=doc_hash))
+                ])),
+            )
+    return True
+
+def cleanup_orphaned_docs():
+    """Prune every stored document whose session references have all expired or been released"""
+    removed = 0
+    for doc_hash in redis_client.smembers("doc_store_hashes") or []:
+        try:
+            if prune_doc(doc_hash):
+                removed += 1
+        except Exception as e:
+            print("Error:", e)
+    return removed
 
-    llm = ChatOpenAI(model=model, temperature=0.5)
 
-    qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        memory=history,
-        return_source_documents=False
-    )
 
-    answer = qa_chain.invoke({"question": query})
-    return answer["answer"]
+def get_answer_from_query(query, history, collection_name="pdf_docs", top_k=3, doc_hash=None, system_prompt=None):
+    vectorstore = get_vectorstore(collection_name, embeddings, create=False)
+    metadata_filter = {"doc_hash": doc_hash} if doc_hash else None
+    qa_chain = get_retrieval_chain(vectorstore, MODEL_NAME, temperature=0.5, top_k=top_k, metadata_filter=metadata_filter,
+                                   system_prompt=system_prompt)
+    return ask_retrieval_chain(qa_chain, query, history)
 
+def stream_answer_from_query(query, history, collection_name="pdf_docs", top_k=3, doc_hash=None, system_prompt=None):
+    vectorstore = get_vectorstore(collection_name, embeddings, create=False)
+    metadata_filter = {"doc_hash": doc_hash} if doc_hash else None
+    qa_chain = get_retrieval_chain(vectorstore, MODEL_NAME, temperature=0.5, top_k=top_k,
+                                   metadata_filter=metadata_filter, streaming=True, system_prompt=system_prompt)
+    return stream_retrieval_chain(qa_chain, query, history)
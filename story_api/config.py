@@ -1,6 +1,6 @@
 import os
 import redis
-from upstash_redis import Redis
+from app.history_store import create_redis_client, HistoryStore
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
@@ -11,7 +11,8 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 REDIS_TOKEN = os.getenv("REDIS_TOKEN", "")
 REDIS_URL= os.getenv("REDIS_URL", "")
 
-redis = Redis(url=REDIS_URL, token=REDIS_TOKEN)
+redis = create_redis_client(REDIS_URL, REDIS_TOKEN)
+history_store = HistoryStore(redis)
 
 
 # Create reusable Redis connection
@@ -5,7 +5,9 @@ from flask import jsonify, request, make_response
 from datetime import datetime
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from story_api.utils import get_session_id, get_chat_id, \
-      load_chat_data, save_chat_data, load_recent_chat_data
+      load_chat_data, load_chat_window, save_chat_data, load_recent_chat_data
+from app.streaming import wants_stream, stream_response
+from app.history_store import summary_messages
 
 
 bp = Blueprint("story-api", __name__,)
@@ -43,11 +45,21 @@ def create():
             return jsonify({"status": "fail", "error": "Message is required"}), 400
         time_stamp = datetime.utcnow().isoformat()
         
-        history = load_chat_data(session_id, chat_id)
+        history, summary = load_chat_window(session_id, chat_id)
         human_msg = HumanMessage(content=user_message, additional_kwargs={"timestamp": time_stamp})
         history.add_message(human_msg)
         # Build conversation
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + history.messages
+        messages = [SystemMessage(content=SYSTEM_PROMPT)] + summary_messages(summary) + history.messages
+        if wants_stream():
+            def on_complete(llm_reply):
+                time_stamp = datetime.utcnow().isoformat()
+                history.add_message(AIMessage(content=llm_reply, additional_kwargs={"timestamp": time_stamp}))
+                save_chat_data(session_id, chat_id, history, time_stamp, real_time=True)
+                return {"status": "success", "response": llm_reply, "chat_id": chat_id, "timestamp": time_stamp}
+
+            resp = stream_response((chunk.content for chunk in llm.stream(messages)), on_complete, name="story/create-story")
+            resp.set_cookie("session_id", session_id, max_age=60 * 60 * 24 * 7)
+            return resp
         time_stamp = datetime.utcnow().isoformat()
         # Get AI response
         response = llm.invoke(messages)
@@ -1,10 +1,10 @@
 import uuid
-import json
+import time
 from flask import request
 from datetime import datetime
-from story_api.config import redis as redis_client
+from story_api.config import redis as redis_client, history_store
+from app.history_store import deserialize_messages
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
 
 def get_session_id():
     user_id = request.cookies.get("session_id")
@@ -20,60 +20,93 @@ def get_chat_id():
 
 def load_chat_data(session_id, chat_id):
     """Load message history from Redis"""
-    data = redis_client.lrange(f"story:{session_id}:{chat_id}",0, -1)
     history = ChatMessageHistory()
-    if data:
-        for msg in data:
-            msg = json.loads(msg)
-            if msg["type"] == "human":
-                human_msg = HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(human_msg)
-            elif msg["type"] == "ai":
-                ai_msg = AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                history.add_message(ai_msg)
+    history.add_messages(history_store.load_messages(f"story:{session_id}:{chat_id}", types=("human", "ai")))
     return history
 
+def load_chat_window(session_id, chat_id):
+    """Load the recent turns and the summary of older ones from Redis"""
+    messages, summary = history_store.load_window(f"story:{session_id}:{chat_id}")
+    history = ChatMessageHistory()
+    history.add_messages(messages)
+    return history, summary
+
 def save_chat_data(session_id, chat_id, history, timestamp, real_time=False):
     """Save LangChain message history to Redis"""
-    serialized = []
     key = f"story:{session_id}:{chat_id}"
     message_list = history.messages if not real_time else history.messages[-2:]
-    for msg in message_list:
-        if isinstance(msg, HumanMessage):
-            serialized.append({"type": "human", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, AIMessage):
-            serialized.append({"type": "ai", "content": msg.content, "timestamp": timestamp})
-        elif isinstance(msg, SystemMessage):
-            serialized.append({"type": "system", "content": msg.content, "timestamp": timestamp})
-    json_messages = [json.dumps(m) for m in serialized]
-    redis_client.rpush(key, *json_messages)
-    redis_client.expire(key, 60 * 60 * 24 * 7)
+
+    def index_chat(pipe):
+        # per-session index of chats scored by last activity, replaces KEYS scans
+        now = time.time()
+        pipe.zadd(f"story_index:{session_id}", {chat_id: now})
+        # chats idle for longer than the history TTL have expired, they are dropped
+        # here so reads never write
+        pipe.zremrangebyscore(f"story_index:{session_id}", "-inf", now - history_store.ttl)
+        pipe.expire(f"story_index:{session_id}", history_store.ttl)
+
+    history_store.append_window(key, message_list, timestamp, extra=index_chat)
+
+def _migrated_key(session_id):
+    return f"story_index_migrated:{session_id}"
+
+def _backfill_chat_index(session_id):
+    """Index chats saved before the per-session index existed (one KEYS scan per session).
+
+    Runs once per session whatever the index already holds, a chat saved after the
+    deploy creates the index before the old chats are read, so they are merged in.
+    """
+    # set nx makes sure only one request of a session does the scan
+    if not redis_client.set(_migrated_key(session_id), 1, nx=True, ex=60 * 60 * 24 * 7):
+        return
+    prefix = f"story:{session_id}:"
+    # the rolling summary of a chat is a string key under the same prefix
+    chat_keys = [key for key in redis_client.keys(f"{prefix}*") if not key.endswith(":summary")]
+    if not chat_keys:
+        return
+    # legacy chats rank below every chat already indexed with its real last activity
+    oldest = redis_client.zrange(f"story_index:{session_id}", 0, 0, withscores=True)
+    base = (oldest[0][1] if oldest else time.time()) - 1
+    scores = {key[len(prefix):]: base - i for i, key in enumerate(chat_keys)}
+    # nx leaves chats indexed by save_chat_data untouched
+    redis_client.zadd(f"story_index:{session_id}", scores, nx=True)
+    redis_client.expire(f"story_index:{session_id}", 60 * 60 * 24 * 7)
 
 def load_recent_chat_data(session_id):
-    pattern = f"story:{session_id}:*"
-    chat_keys = redis_client.keys(pattern)
+    """Today's messages of every chat of the session, most recently active first.
+
+    The migration marker is read in the same round-trip as the index, so a migrated
+    session takes two round-trips: the index and one pipelined fetch of the chats.
+    """
+    pipe = history_store.pipeline()
+    pipe.exists(_migrated_key(session_id))
+    pipe.zrange(f"story_index:{session_id}", 0, -1)
+    migrated, chat_ids = history_store.execute(pipe)
+    if not migrated:
+        _backfill_chat_index(session_id)
+        chat_ids = redis_client.zrange(f"story_index:{session_id}", 0, -1)
+    chat_ids = list(reversed(chat_ids or []))
+    if not chat_ids:
+        return []
+    chat_keys = [f"story:{session_id}:{chat_id}" for chat_id in chat_ids]
+    results = history_store.load_many(chat_keys, -5000, -1)
+
     recent_chats = []
-    for chat_key in chat_keys:
-        latest = redis_client.lindex(chat_key, -1)
-        latest_time = json.loads(latest)["timestamp"] if latest else None
+    for chat_key, all_msgs in zip(chat_keys, results):
+        # expired chats stay in the index until the next save prunes them
+        if not all_msgs:
+            continue
+        messages = deserialize_messages(all_msgs, ("human", "ai"))
+        latest_time = messages[-1].additional_kwargs.get("timestamp") if messages else None
         if latest_time:
             latest_dt = datetime.fromisoformat(latest_time)
             today_start = latest_dt.replace(hour=0, minute=0, second=0, microsecond=0)
         else:
             today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
 
-        all_msgs = redis_client.lrange(chat_key, -5000, -1)
         history = ChatMessageHistory()
-        for msg in all_msgs:
-            msg = json.loads(msg)
-            msg_time = datetime.fromisoformat(msg["timestamp"])
-            if msg_time >= today_start:
-                if msg["type"] == "human":
-                    human_msg = HumanMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                    history.add_message(human_msg)
-                elif msg["type"] == "ai":
-                    ai_msg = AIMessage(content=msg["content"], additional_kwargs={"timestamp": msg["timestamp"]})
-                    history.add_message(ai_msg)
+        history.add_messages([msg for msg in messages
+                              if datetime.fromisoformat(msg.additional_kwargs["timestamp"]) >= today_start])
         recent_chats.append({
             "chat_key": chat_key,
             "history": history
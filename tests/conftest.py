@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import importlib
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# module-level clients read their settings at import time, so they are set before any app import;
+# Redis and Qdrant are swapped for fakeredis / QdrantClient(":memory:") by the fixtures below
+_cache_dir = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("OPEN_AI_API_KEY", "test")
+os.environ.setdefault("HF_TOKEN", "test")
+os.environ.setdefault("MODEL_NAME", "gpt-4o-mini")
+os.environ["REDIS_URL"] = "redis://localhost:6379/15"
+os.environ["QDRANT_URL"] = ":memory:"
+os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(_cache_dir, "embeddings")
+os.environ["TEXT_CACHE_DIR"] = os.path.join(_cache_dir, "text_api")
+os.environ["TEXT_CACHE_REDIS_URL"] = ""
+
+REDIS_CONFIGS = ("gf_ai_chat.config", "story_api.config", "excel_companion.config", "rag_on_doc.config")
+REDIS_USERS = ("gf_ai_chat.utils", "story_api.utils", "excel_companion.utils", "rag_on_doc.utils", "rag_on_doc.jobs")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """One fakeredis shared by every blueprint's Redis client and HistoryStore"""
+    import fakeredis
+    client = fakeredis.FakeRedis(decode_responses=True)
+    for name in REDIS_CONFIGS:
+        config = importlib.import_module(name)
+        monkeypatch.setattr(config, "redis", client)
+        monkeypatch.setattr(config.history_store, "client", client)
+    for name in REDIS_USERS:
+        monkeypatch.setattr(importlib.import_module(name), "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def qdrant():
+    from qdrant_client import QdrantClient
+    from app.qdrant import set_client
+    client = QdrantClient(":memory:")
+    set_client(client)
+    yield client
+    set_client(QdrantClient(":memory:"))
+
+
+@pytest.fixture
+def fake_embeddings():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=1536)
+
+
+@pytest.fixture
+def chat_model(monkeypatch):
+    """Recording fake chat model returned by app.chains.get_chat_model for every model name"""
+    from fakes import RecordingChatModel
+    import app.chains
+    model = RecordingChatModel()
+    monkeypatch.setattr(app.chains, "get_chat_model", lambda *args, **kwargs: model)
+    app.chains._chains.clear()
+    yield model
+    app.chains._chains.clear()
@@ -0,0 +1,87 @@
+import re
+import time
+import threading
+from typing import Any
+from pydantic import PrivateAttr
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from app.history_store import estimate_tokens
+
+
+class RecordingChatModel(SimpleChatModel):
+    """Chat model that records every prompt and how many calls ran at once.
+
+    respond(messages) picks the reply, the default cycles through responses.
+    latency holds each call for that many seconds, like a real round-trip.
+    stream() yields the reply word by word, streaming=True makes invoke stream too
+    (like ChatOpenAI) so callback handlers see every token.
+    """
+
+    responses: list = ["ok"]
+    respond: Any = None
+    latency: float = 0
+    model_name: str = "fake-chat"
+    temperature: float = 0
+    streaming: bool = False
+    _calls: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _active: int = PrivateAttr(default=0)
+    _peak: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self):
+        return "recording"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._lock:
+            self._calls.append(messages)
+            index = len(self._calls) - 1
+            self._active += 1
+            self._peak = max(self._peak, self._active)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.respond:
+                return self.respond(messages)
+            return self.responses[index % len(self.responses)]
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in re.findall(r"\S+\s*", self._call(messages, stop, run_manager, **kwargs)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.streaming:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        chunks = []
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            chunks.append(chunk)
+        return generate_from_stream(iter(chunks))
+
+    @property
+    def calls(self):
+        return list(self._calls)
+
+    @property
+    def peak_concurrency(self):
+        return self._peak
+
+    def prompt_bytes(self, calls=None):
+        calls = self._calls if calls is None else calls
+        return sum(len(msg.content.encode()) for messages in calls for msg in messages)
+
+    def prompt_tokens(self, calls=None):
+        calls = self._calls if calls is None else calls
+        return sum(estimate_tokens(msg.content) for messages in calls for msg in messages)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._active = 0
+            self._peak = 0
@@ -0,0 +1,65 @@
+import time
+import threading
+import pytest
+from langchain_core.documents import Document
+
+
+@pytest.fixture
+def hybrid(monkeypatch):
+    from app import hybrid
+    monkeypatch.setattr(hybrid, "_indexes", {})
+    monkeypatch.setattr(hybrid, "_rebuilding", set())
+    return hybrid
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_expired_index_is_served_while_it_rebuilds(hybrid, monkeypatch):
+    release = threading.Event()
+    loads = []
+
+    def slow_load(collection_name):
+        loads.append(collection_name)
+        if len(loads) > 1:
+            release.wait(5)
+        return [Document(page_content=f"VLOOKUP version {len(loads)}")]
+
+    monkeypatch.setattr(hybrid, "_load_documents", slow_load)
+    first = hybrid.get_bm25_index("kb")
+    monkeypatch.setattr(hybrid, "BM25_INDEX_TTL", 0)
+
+    started = time.perf_counter()
+    assert hybrid.get_bm25_index("kb") is first
+    assert hybrid.get_bm25_index("kb") is first
+    assert time.perf_counter() - started < 1
+    # one rebuild at a time, searches never wait for it
+    _wait_for(lambda: len(loads) == 2)
+    assert hybrid.get_bm25_index("kb") is first
+    assert loads == ["kb", "kb"]
+
+    release.set()
+    _wait_for(lambda: not hybrid._rebuilding)
+    monkeypatch.setattr(hybrid, "BM25_INDEX_TTL", 600)
+    assert hybrid.get_bm25_index("kb").documents[0].page_content == "VLOOKUP version 2"
+
+
+def test_failed_rebuild_keeps_the_old_index(hybrid, monkeypatch):
+    monkeypatch.setattr(hybrid, "_load_documents", lambda name: [Document(page_content="VLOOKUP")])
+    first = hybrid.get_bm25_index("kb")
+
+    def broken(name):
+        raise ConnectionError("qdrant down")
+
+    monkeypatch.setattr(hybrid, "_load_documents", broken)
+    monkeypatch.setattr(hybrid, "BM25_INDEX_TTL", 30)
+    monkeypatch.setitem(hybrid._indexes, "kb", (first, time.time() - 31))
+    assert hybrid.get_bm25_index("kb") is first
+    _wait_for(lambda: not hybrid._rebuilding)
+    # retried after BM25_REBUILD_RETRY, not on the next search
+    assert time.time() - hybrid._indexes["kb"][1] < 30
+    assert hybrid.get_bm25_index("kb") is first and not hybrid._rebuilding
@@ -0,0 +1,135 @@
+import json
+import time
+import requests
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+BASE = "https://example.test/"
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} Client Error", response=response)
+
+
+def _crawl(common, tmp_path, monkeypatch, failures):
+    fetched = []
+
+    def fake_extract(url):
+        fetched.append(url)
+        if url in failures:
+            raise failures[url]
+        return f"text of {url}"
+
+    monkeypatch.setattr(common, "extract_clean_text", fake_extract)
+    chain = RunnableLambda(lambda inputs: AIMessage(content=inputs["chunk"].upper()))
+    common.crawl_and_extract(["a.php", "gone.php", "flaky.php"], base_url=BASE, output_dir=str(tmp_path),
+                             chain=chain, batch_size=3, fetch_workers=2)
+    return fetched
+
+
+def test_failed_urls_do_not_block_the_batch(tmp_path, monkeypatch):
+    import common
+    fetched = _crawl(common, tmp_path, monkeypatch, {
+        BASE + "gone.php": _http_error(404),
+        BASE + "flaky.php": requests.ConnectionError("reset"),
+    })
+    assert sorted(fetched) == [BASE + "a.php", BASE + "flaky.php", BASE + "gone.php"]
+    assert (tmp_path / "batch_1.txt").read_text() == f"TEXT OF {BASE.upper()}A.PHP\n\n"
+    entries = [json.loads(line) for line in (tmp_path / "checkpoint.jsonl").read_text().splitlines()]
+    assert {entry["url"]: entry["results"] for entry in entries} == {
+        BASE + "a.php": [f"TEXT OF {BASE.upper()}A.PHP"], BASE + "gone.php": []}
+
+    # the rerun only retries the transient failure and rewrites the batch with it
+    fetched = _crawl(common, tmp_path, monkeypatch, {})
+    assert fetched == [BASE + "flaky.php"]
+    assert (tmp_path / "batch_1.txt").read_text() == \
+        f"TEXT OF {BASE.upper()}A.PHP\n\nTEXT OF {BASE.upper()}FLAKY.PHP\n\n"
+
+
+def test_permanent_failures():
+    import common
+    assert common.is_permanent_failure(_http_error(404))
+    assert common.is_permanent_failure(_http_error(410))
+    assert not common.is_permanent_failure(_http_error(429))
+    assert not common.is_permanent_failure(_http_error(503))
+    assert not common.is_permanent_failure(requests.ConnectionError("reset"))
+
+
+class _Site:
+    """Local HTTP server: flaky.php answers 503 once, gone.php 404, every other page 200 after a delay"""
+
+    def __init__(self, delay=0.1):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.hits = {}
+        self.active = 0
+        self.peak = 0
+        lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    site.hits[self.path] = site.hits.get(self.path, 0) + 1
+                    hits = site.hits[self.path]
+                    site.active += 1
+                    site.peak = max(site.peak, site.active)
+                try:
+                    time.sleep(delay)
+                    if self.path == "/gone.php":
+                        status = 404
+                    elif self.path == "/flaky.php" and hits == 1:
+                        status = 503
+                    else:
+                        status = 200
+                    body = f"<html><body><p>page {self.path}</p></body></html>".encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        site.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_crawl_against_a_local_server(tmp_path, monkeypatch):
+    import common
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    monkeypatch.setattr(common, "_http_session", None)
+    monkeypatch.setattr(common, "_host_slots", {})
+    monkeypatch.setattr(common, "CRAWL_PER_HOST", 2)
+    site = _Site()
+    links = [f"page{i}.php" for i in range(6)] + ["flaky.php", "gone.php"]
+    chain = RunnableLambda(lambda inputs: AIMessage(content=inputs["chunk"].upper()))
+    try:
+        common.crawl_and_extract(links, base_url=site.base_url, output_dir=str(tmp_path), chain=chain,
+                                 batch_size=len(links), fetch_workers=8)
+    finally:
+        site.close()
+
+    # the 503 was retried by the session, the 404 is not retried
+    assert site.hits["/flaky.php"] == 2
+    assert site.hits["/gone.php"] == 1
+    assert all(site.hits[f"/{link}"] == 1 for link in links[:6])
+    # eight fetch workers, but never more than CRAWL_PER_HOST requests to the host at once
+    assert site.peak == 2
+
+    entries = {entry["url"]: entry for entry in map(json.loads, (tmp_path / "checkpoint.jsonl").read_text().splitlines())}
+    assert set(entries) == {site.base_url + link for link in links}
+    assert entries[site.base_url + "flaky.php"]["results"] == ["PAGE /FLAKY.PHP"]
+    assert entries[site.base_url + "gone.php"]["results"] == []
+    assert "404" in entries[site.base_url + "gone.php"]["error"]
@@ -0,0 +1,71 @@
+import json
+import time
+import threading
+import pytest
+
+
+@pytest.fixture
+def docs(redis_client, qdrant, fake_embeddings, monkeypatch):
+    from rag_on_doc import utils
+    monkeypatch.setattr(utils, "embeddings", fake_embeddings)
+    return utils
+
+
+def _store(utils, doc_hash, chunks=3):
+    total, _ = utils.store_doc_in_qdrant(doc_hash, [f"{doc_hash} chunk {i}" for i in range(chunks)])
+    return total
+
+
+def _points(qdrant, doc_hash):
+    from qdrant_client.http import models
+    from rag_on_doc.utils import SHARED_DOC_COLLECTION
+    return qdrant.count(SHARED_DOC_COLLECTION, exact=True, count_filter=models.Filter(must=[
+        models.FieldCondition(key="metadata.doc_hash", match=models.MatchValue(value=doc_hash))])).count
+
+
+def test_sweep_prunes_documents_of_expired_sessions(docs, redis_client, qdrant):
+    from rag_on_doc.jobs import sweep_orphaned_docs
+    _store(docs, "expired")
+    _store(docs, "live")
+    redis_client.zadd("doc_refs:expired", {"s1:d1": time.time() - 1})
+    docs.add_doc_reference("s2", "d2", "live")
+
+    assert sweep_orphaned_docs() == 1
+    assert not docs.is_doc_stored("expired") and _points(qdrant, "expired") == 0
+    assert docs.is_doc_stored("live") and _points(qdrant, "live") == 3
+    # one sweep per interval across workers
+    assert sweep_orphaned_docs() is None
+
+
+def test_prune_keeps_a_document_whose_ingest_is_running(docs, redis_client):
+    redis_client.set(docs.ingest_job_key("busy"), json.dumps(
+        {"job_id": "busy", "status": "running", "updated_at": time.time()}))
+    redis_client.sadd("doc_store_hashes", "busy")
+    assert docs.prune_doc("busy") is False
+
+
+def test_reference_added_during_prune_waits_for_it(docs, redis_client, qdrant, monkeypatch):
+    _store(docs, "raced")
+    client = docs.get_client()
+    original_delete = client.delete
+    deleting = threading.Event()
+    events = []
+
+    def slow_delete(*args, **kwargs):
+        deleting.set()
+        time.sleep(0.3)
+        result = original_delete(*args, **kwargs)
+        events.append("deleted")
+        return result
+
+    monkeypatch.setattr(client, "delete", slow_delete)
+    pruner = threading.Thread(target=docs.prune_doc, args=("raced",))
+    pruner.start()
+    deleting.wait(5)
+    # the upload's reference blocks until the points are gone, so it sees the document as not stored
+    docs.add_doc_reference("s", "d", "raced")
+    events.append("referenced")
+    pruner.join(5)
+    assert events == ["deleted", "referenced"]
+    assert not docs.is_doc_stored("raced")
+    assert redis_client.zcard("doc_refs:raced") == 1
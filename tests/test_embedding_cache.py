@@ -0,0 +1,83 @@
+import os
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+from app import embedding_cache
+from app.embedding_cache import BoundedByteStore, TRIM_MARKER
+
+
+class RecordingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _cached(store):
+    embedder = RecordingEmbeddings()
+    return embedder, CacheBackedEmbeddings.from_bytes_store(embedder, store, namespace="model", key_encoder="sha256")
+
+
+def test_only_misses_reach_the_embedder(tmp_path):
+    store = BoundedByteStore(LocalFileStore(str(tmp_path)))
+    embedder, cached = _cached(store)
+
+    first = cached.embed_documents(["alpha", "beta"])
+    assert embedder.texts == [["alpha", "beta"]]
+    assert (store.hits, store.misses) == (0, 2)
+
+    assert cached.embed_documents(["beta", "gamma", "alpha", "delta"]) == [first[1], [5.0, 1.0], first[0], [5.0, 1.0]]
+    assert embedder.texts[1:] == [["gamma", "delta"]]
+    assert (store.hits, store.misses) == (2, 4)
+
+
+def _files(path):
+    return sorted(name for name in os.listdir(path) if name != TRIM_MARKER)
+
+
+def test_trim_keeps_the_most_recently_read(tmp_path):
+    store = BoundedByteStore(LocalFileStore(str(tmp_path)), max_entries=3, trim_interval=3600)
+    store.store.mset([(f"k{i}", b"v") for i in range(5)])
+    for i in range(5):
+        os.utime(tmp_path / f"k{i}", (1000 + i, 1000 + i))
+    # reading k0 makes it the most recently used
+    assert store.mget(["k0"]) == [b"v"]
+
+    assert store.trim() == 2
+    assert _files(tmp_path) == ["k0", "k3", "k4"]
+    assert store.trim() == 0
+
+
+def test_writes_start_one_trim_per_interval(tmp_path, monkeypatch):
+    started = []
+    monkeypatch.setattr(embedding_cache, "start_thread", lambda target, name=None: started.append(target))
+    store = BoundedByteStore(LocalFileStore(str(tmp_path)), max_entries=3, trim_interval=3600)
+    store.mset([("a", b"1")])
+    store.mset([("b", b"2")])
+    assert len(started) == 1
+    # another worker sharing the directory sees the marker and leaves the trim to the first one
+    other = BoundedByteStore(LocalFileStore(str(tmp_path)), max_entries=3, trim_interval=3600)
+    other.mset([("c", b"3")])
+    assert len(started) == 1
+
+    store.store.mset([(f"k{i}", b"v") for i in range(5)])
+    started[0]()
+    assert len(_files(tmp_path)) == 3
+
+
+def test_redis_store_is_not_trimmed(monkeypatch):
+    class Store:
+        def mset(self, pairs):
+            self.pairs = pairs
+
+    started = []
+    monkeypatch.setattr(embedding_cache, "start_thread", lambda target, name=None: started.append(target))
+    store = BoundedByteStore(Store(), max_entries=3)
+    store.mset([("a", b"1")])
+    # Redis entries expire by TTL instead
+    assert store.max_entries is None and started == []
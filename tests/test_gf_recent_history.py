@@ -0,0 +1,70 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from langchain.schema import HumanMessage, AIMessage
+from langchain_community.chat_message_histories import ChatMessageHistory
+
+
+def _legacy_messages(redis_client, session_id, day, count):
+    for i in range(count):
+        redis_client.rpush(f"user:{session_id}:history", json.dumps({
+            "type": "human" if i % 2 == 0 else "ai",
+            "content": f"{day} message {i}",
+            "timestamp": f"{day}T09:00:{i:02d}",
+        }))
+
+
+def _turn(text):
+    history = ChatMessageHistory()
+    history.add_messages([HumanMessage(content=text), AIMessage(content=f"reply to {text}")])
+    return history
+
+
+def test_first_save_keeps_todays_legacy_messages(redis_client):
+    from gf_ai_chat import utils
+    today = datetime.utcnow().date().isoformat()
+    yesterday = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    _legacy_messages(redis_client, "s", yesterday, 4)
+    _legacy_messages(redis_client, "s", today, 6)
+
+    utils.save_session_history("s", _turn("hi"), f"{today}T10:00:00", real_time=True)
+    messages = utils.load_recent_history("s").messages
+    assert len(messages) == 8
+    assert messages[0].content == f"{today} message 0"
+    assert messages[-1].content == "reply to hi"
+
+
+def test_read_before_save_backfills_once(redis_client):
+    from gf_ai_chat import utils
+    today = datetime.utcnow().date().isoformat()
+    _legacy_messages(redis_client, "r", today, 4)
+
+    assert len(utils.load_recent_history("r").messages) == 4
+    utils.save_session_history("r", _turn("again"), f"{today}T11:00:00", real_time=True)
+    # the save counted on top of the backfill
+    assert len(utils.load_recent_history("r").messages) == 6
+    assert redis_client.hgetall("user:r:history:days") == {today: "6"}
+
+
+def test_new_day_shows_only_that_day(redis_client):
+    from gf_ai_chat import utils
+    utils.save_session_history("n", _turn("monday"), "2025-01-06T10:00:00", real_time=True)
+    utils.save_session_history("n", _turn("tuesday"), "2025-01-07T10:00:00", real_time=True)
+    assert [msg.content for msg in utils.load_recent_history("n").messages] == ["tuesday", "reply to tuesday"]
+
+
+def test_saves_and_reads_keep_to_their_round_trips(redis_client, monkeypatch):
+    from gf_ai_chat import utils
+    utils.save_session_history("t", _turn("monday"), "2025-01-06T10:00:00", real_time=True)
+
+    # later saves claim nothing outside their pipeline, reads never write
+    monkeypatch.setattr(utils, "_backfill_day_counts", lambda *args: pytest.fail("backfilled twice"))
+    monkeypatch.setattr(redis_client, "set", lambda *args, **kwargs: pytest.fail("SET outside the pipeline"))
+    monkeypatch.setattr(redis_client, "hdel", lambda *args: pytest.fail("HDEL on the read path"))
+    utils.save_session_history("t", _turn("tuesday"), "2025-01-07T10:00:00", real_time=True)
+    assert [msg.content for msg in utils.load_recent_history("t").messages] == ["tuesday", "reply to tuesday"]
+
+    # no per-worker copy, a save made anywhere shows on the next read
+    utils.save_session_history("t", _turn("later"), "2025-01-07T11:00:00", real_time=True)
+    assert len(utils.load_recent_history("t").messages) == 4
+    assert redis_client.hgetall("user:t:history:days") == {"2025-01-06": "2", "2025-01-07": "4"}
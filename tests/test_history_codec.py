@@ -0,0 +1,82 @@
+import json
+import pytest
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from app import history_codec
+from app.history_codec import encode_message, decode_message
+from app.history_store import serialize_messages, deserialize_messages
+
+CODECS = ("json", "compact", "msgpack")
+MESSAGES = [
+    ("human", "What does VLOOKUP do?", "2025-01-06T10:00:00"),
+    ("ai", "It searches the first column — «ünïcode» and emoji 🙂 included.", "2025-01-06T10:00:01.123456"),
+    ("system", "", "1999-12-31T23:59:59"),
+]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("message", MESSAGES)
+def test_round_trip(codec, message):
+    if codec == "msgpack":
+        pytest.importorskip("msgpack")
+    assert decode_message(encode_message(*message, codec=codec)) == message
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_long_content_is_compressed(codec, monkeypatch):
+    if codec == "msgpack":
+        pytest.importorskip("msgpack")
+    monkeypatch.setattr(history_codec, "HISTORY_COMPRESS_MIN", 1024)
+    message = ("ai", "The range is searched top to bottom. " * 100, "2025-01-06T10:00:00")
+    raw = encode_message(*message, codec=codec)
+    assert decode_message(raw) == message
+    if codec == "json":
+        assert raw.startswith("{")
+    else:
+        assert raw.startswith("z") and len(raw) < len(message[1]) / 4
+
+    monkeypatch.setattr(history_codec, "HISTORY_COMPRESS_MIN", 0)
+    assert not encode_message(*message, codec=codec).startswith("z")
+
+
+def test_compact_is_smaller_than_json():
+    for message in MESSAGES[:2]:
+        assert len(encode_message(*message, codec="compact")) < len(encode_message(*message, codec="json"))
+
+
+def test_timezone_aware_timestamps_are_stored_in_utc():
+    raw = encode_message("human", "hi", "2025-01-06T10:00:00+02:00", codec="compact")
+    assert decode_message(raw) == ("human", "hi", "2025-01-06T08:00:00")
+
+
+def test_non_iso_timestamp_keeps_the_original_format():
+    raw = encode_message("human", "hi", "yesterday", codec="compact")
+    assert json.loads(raw) == {"type": "human", "content": "hi", "timestamp": "yesterday"}
+    assert decode_message(raw) == ("human", "hi", "yesterday")
+
+
+def test_legacy_messages_without_timestamp_are_read():
+    assert decode_message(json.dumps({"type": "ai", "content": "old"})) == ("ai", "old", None)
+    assert decode_message(json.dumps({"type": "ai", "content": "old"}).encode()) == ("ai", "old", None)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        decode_message("plain text")
+
+
+def test_mixed_list_deserializes_in_order(monkeypatch):
+    """A list written before and after the switch (and by writers set to different codecs) reads back whole"""
+    data = [json.dumps({"type": "human", "content": "legacy", "timestamp": "2025-01-06T09:00:00"})]
+    for codec in ("compact", "json"):
+        monkeypatch.setattr(history_codec, "HISTORY_CODEC", codec)
+        data += serialize_messages([HumanMessage(content=codec), AIMessage(content=f"reply {codec}")],
+                                   "2025-01-06T10:00:00")
+    data += [encode_message("system", "summary", "2025-01-06T11:00:00", codec="compact")]
+
+    messages = deserialize_messages(data)
+    assert [(type(msg), msg.content) for msg in messages] == [
+        (HumanMessage, "legacy"), (HumanMessage, "compact"), (AIMessage, "reply compact"),
+        (HumanMessage, "json"), (AIMessage, "reply json"), (SystemMessage, "summary"),
+    ]
+    assert messages[1].additional_kwargs == {"timestamp": "2025-01-06T10:00:00"}
+    assert [msg.content for msg in deserialize_messages(data, ("ai",))] == ["reply compact", "reply json"]
@@ -0,0 +1,48 @@
+import threading
+import fakeredis
+from langchain.schema import HumanMessage, AIMessage
+from app.history_store import HistoryStore, deserialize_messages, serialize_messages
+
+
+def _merge(messages):
+    """Summary that keeps every line, so a lost fold shows up as missing lines"""
+    prompt = messages[-1].content.rsplit("Current summary:", 1)[1].rsplit("New summary:", 1)[0]
+    summary, new_lines = prompt.split("New lines of conversation:")
+    return "\n".join(part for part in (summary.strip(), new_lines.strip()) if part)
+
+
+def _turn(index, size=40):
+    return [HumanMessage(content=f"question {index} " + "q" * size), AIMessage(content=f"answer {index} " + "a" * size)]
+
+
+def test_messages_over_the_token_budget_are_folded(monkeypatch):
+    store = HistoryStore(fakeredis.FakeRedis(decode_responses=True))
+    folded = []
+    monkeypatch.setattr(store, "fold_summary", lambda key, evicted: folded.extend(deserialize_messages(evicted)))
+    sent = []
+    for index in range(12):
+        # every third turn is long, so the budget rather than the turn count cuts the window
+        turn = _turn(index, 400 if index % 3 == 0 else 40)
+        sent.extend(turn)
+        store.append_window("chat", turn, f"2025-01-01T10:00:{index:02d}", turns=4, token_budget=200)
+
+    window, _ = store.load_window("chat", turns=4, token_budget=200)
+    assert len(window) < 8
+    # every message is either still in the window or was folded, exactly once and in order
+    assert [msg.content for msg in folded + window] == [msg.content for msg in sent]
+
+
+def test_concurrent_folds_do_not_lose_each_other(chat_model):
+    store = HistoryStore(fakeredis.FakeRedis(decode_responses=True))
+    chat_model.respond = _merge
+    chat_model.latency = 0.2
+    evicted = [serialize_messages([HumanMessage(content=f"line {i}")], "2025-01-01T10:00:00") for i in range(3)]
+    threads = [threading.Thread(target=store.fold_summary, args=("chat", batch)) for batch in evicted]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    _, summary = store.load_window("chat")
+    assert sorted(summary.splitlines()) == ["Human: line 0", "Human: line 1", "Human: line 2"]
+    assert chat_model.peak_concurrency == 1
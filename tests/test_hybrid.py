@@ -0,0 +1,102 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.qdrant import get_vectorstore, VECTOR_SIZE
+
+DOCS = [
+    "VLOOKUP looks up a value in the first column of a table range.",
+    "HLOOKUP looks up a value in the first row of a table range.",
+    "XLOOKUP replaces both with one function that searches in any direction.",
+    "SUM adds the numbers in a range.",
+]
+# the dense side of the fixture is blind to function names: "XLOOKUP" embeds close to
+# the VLOOKUP and HLOOKUP chunks and far from the chunk that actually documents it
+QUERIES = {
+    "XLOOKUP": {0: 0.9, 1: 0.8, 2: 0.1},
+    "VLOOKUP": {0: 1.0, 3: 0.2},
+}
+
+
+class TableEmbeddings(Embeddings):
+    def _embed(self, text):
+        # unknown texts (QdrantVectorStore's validation probe) get a direction of their own
+        weights = QUERIES.get(text) or {DOCS.index(text) if text in DOCS else len(DOCS): 1.0}
+        vector = [0.0] * VECTOR_SIZE
+        for index, weight in weights.items():
+            vector[index] = weight
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def hybrid(qdrant, monkeypatch):
+    from app import hybrid
+    monkeypatch.setattr(hybrid, "_indexes", {})
+    monkeypatch.setattr(hybrid, "_rebuilding", set())
+    monkeypatch.setattr(hybrid, "_reranker", None)
+    monkeypatch.setattr(hybrid, "stats", dict.fromkeys(hybrid.stats, 0))
+    vectorstore = get_vectorstore("hybrid_kb", TableEmbeddings())
+    vectorstore.add_texts(DOCS)
+    hybrid.forget_bm25_index("hybrid_kb")
+    return hybrid, vectorstore
+
+
+def _contents(docs):
+    return [doc.page_content for doc in docs]
+
+
+def test_exact_function_name_missed_by_dense_search_is_recovered(hybrid):
+    hybrid, vectorstore = hybrid
+    retriever = hybrid.HybridRetriever(vectorstore=vectorstore, top_k=2, candidates=2)
+
+    assert DOCS[2] not in _contents(retriever.dense_search("XLOOKUP"))
+    assert _contents(retriever.sparse_search("XLOOKUP")) == [DOCS[2]]
+    assert DOCS[2] in _contents(retriever.invoke("XLOOKUP"))
+
+
+def test_dense_and_bm25_hits_of_one_point_are_fused_once(hybrid):
+    hybrid, vectorstore = hybrid
+    retriever = hybrid.HybridRetriever(vectorstore=vectorstore, top_k=4, candidates=4)
+    dense, sparse = retriever.dense_search("VLOOKUP"), retriever.sparse_search("VLOOKUP")
+    # both sides return the VLOOKUP point, with the same Qdrant id
+    assert dense[0].page_content == sparse[0].page_content == DOCS[0]
+    assert dense[0].metadata["_id"] == sparse[0].metadata["_id"]
+
+    fused = retriever.invoke("VLOOKUP")
+    ids = [doc.metadata["_id"] for doc in fused]
+    assert len(ids) == len(set(ids))
+    # ranked first in both lists, so first after fusion
+    assert fused[0].page_content == DOCS[0]
+
+
+def test_reranker_orders_the_fused_candidates(hybrid, monkeypatch):
+    hybrid, vectorstore = hybrid
+    monkeypatch.setattr(hybrid, "_rerank_scores",
+                        lambda query, documents: [float("XLOOKUP" in doc.page_content) for doc in documents])
+    retriever = hybrid.HybridRetriever(vectorstore=vectorstore, top_k=1, candidates=4, use_reranker=True)
+    assert _contents(retriever.invoke("VLOOKUP")) == [DOCS[2]]
+    assert hybrid.get_stats()["reranks"] == 1
+
+
+def test_reranker_failure_falls_back_to_the_fused_order(hybrid, monkeypatch):
+    hybrid, vectorstore = hybrid
+    plain = hybrid.HybridRetriever(vectorstore=vectorstore, top_k=3, candidates=4)
+    reranked = hybrid.HybridRetriever(vectorstore=vectorstore, top_k=3, candidates=4, use_reranker=True)
+    expected = _contents(plain.invoke("XLOOKUP"))
+
+    def broken(query, documents):
+        raise OSError("model not available")
+
+    monkeypatch.setattr(hybrid, "_rerank_scores", broken)
+    assert _contents(reranked.invoke("XLOOKUP")) == expected
+    assert hybrid.get_stats()["rerank_errors"] == 1
+
+    # a model that never loaded is not tried again
+    monkeypatch.setattr(hybrid, "_reranker", False)
+    monkeypatch.setattr(hybrid, "_rerank_scores", lambda query, documents: pytest.fail("reranker retried"))
+    assert _contents(reranked.invoke("XLOOKUP")) == expected
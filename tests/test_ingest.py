@@ -0,0 +1,127 @@
+import time
+import uuid
+import threading
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.qdrant import get_vectorstore
+from rag_on_doc.ingest import ingest_chunks
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embedder with latency that can fail on a given batch"""
+    latency: float = 0.0
+    fail_on: int = 0
+    batches: int = 0
+
+    def embed_documents(self, texts):
+        self.batches += 1
+        if self.fail_on and self.batches >= self.fail_on:
+            raise RuntimeError("embedding failed")
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+
+def chunks(n):
+    return [f"chunk {i}" for i in range(n)]
+
+
+def point_id(index, text):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"doc:{index}"))
+
+
+def run_with_timeout(function, timeout=10):
+    """Run function in a thread so a deadlock fails the test instead of hanging it"""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = function()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "ingest_chunks deadlocked"
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def ids(client, collection_name):
+    points, _ = client.scroll(collection_name, limit=1000)
+    return sorted(str(point.id) for point in points)
+
+
+def test_every_chunk_is_stored_and_timed(qdrant):
+    vectorstore = get_vectorstore("ingest", SlowEmbeddings(size=1536))
+    progress = []
+    stored, timings = ingest_chunks(vectorstore, chunks(50), metadata={"doc_hash": "d"}, batch_size=8,
+                                    on_progress=lambda done, total: progress.append((done, total)))
+
+    assert stored == 50
+    assert qdrant.count("ingest").count == 50
+    assert set(timings) == {"chunking", "embedding", "upsert", "total"}
+    assert all(value >= 0 for value in timings.values())
+    assert progress[-1] == (50, 50)
+    payloads = [point.payload for point in qdrant.scroll("ingest", limit=100)[0]]
+    assert sorted(payload["metadata"]["chunk"] for payload in payloads) == list(range(50))
+    assert all(payload["metadata"]["doc_hash"] == "d" for payload in payloads)
+
+
+def test_reingesting_with_deterministic_ids_is_idempotent(qdrant):
+    vectorstore = get_vectorstore("ingest", SlowEmbeddings(size=1536))
+    ingest_chunks(vectorstore, chunks(30), point_id=point_id, batch_size=7)
+    first = ids(qdrant, "ingest")
+    ingest_chunks(vectorstore, chunks(30), point_id=point_id, batch_size=4, concurrency=2)
+
+    assert ids(qdrant, "ingest") == first
+    assert qdrant.count("ingest").count == 30
+
+
+def test_embedder_error_reaches_the_caller(qdrant):
+    # enough batches to fill both bounded queues behind the failing one
+    embeddings = SlowEmbeddings(size=1536, latency=0.01, fail_on=3)
+    vectorstore = get_vectorstore("ingest", embeddings)
+
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        run_with_timeout(lambda: ingest_chunks(vectorstore, chunks(500), batch_size=2, concurrency=2))
+
+
+def test_chunking_error_reaches_the_caller(qdrant):
+    vectorstore = get_vectorstore("ingest", SlowEmbeddings(size=1536))
+
+    def broken():
+        yield from chunks(10)
+        raise ValueError("bad page")
+
+    with pytest.raises(ValueError, match="bad page"):
+        run_with_timeout(lambda: ingest_chunks(vectorstore, broken(), batch_size=4))
+
+
+def test_upserts_run_on_upsert_concurrency_threads(qdrant, monkeypatch):
+    vectorstore = get_vectorstore("ingest", SlowEmbeddings(size=1536))
+    upsert = qdrant.upsert
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def slow_upsert(*args, **kwargs):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02)
+        try:
+            return upsert(*args, **kwargs)
+        finally:
+            with lock:
+                running["now"] -= 1
+
+    monkeypatch.setattr(qdrant, "upsert", slow_upsert)
+    stored, _ = ingest_chunks(vectorstore, chunks(40), batch_size=2, upsert_concurrency=3)
+    assert stored == 40
+    assert running["peak"] == 3
+
+    running["peak"] = 0
+    ingest_chunks(vectorstore, chunks(20), batch_size=2)
+    assert running["peak"] == 1
@@ -0,0 +1,81 @@
+import json
+import threading
+import pytest
+
+
+@pytest.fixture
+def jobs(redis_client, monkeypatch):
+    from rag_on_doc import jobs
+    monkeypatch.setattr(jobs, "INGEST_POLL_INTERVAL", 0.01)
+    return jobs
+
+
+def _payload(job_id):
+    return json.dumps({"job_id": job_id, "doc_hash": job_id, "file_path": f"/tmp/{job_id}.pdf"})
+
+
+def test_starting_worker_leaves_jobs_of_live_workers_alone(jobs, redis_client):
+    jobs._heartbeat("busy")
+    redis_client.rpush(jobs._processing_key("busy"), _payload("running"))
+
+    assert jobs.recover_orphaned_jobs() == 0
+    assert redis_client.lrange(jobs._processing_key("busy"), 0, -1) == [_payload("running")]
+    assert redis_client.llen(jobs.QUEUE_KEY) == 0
+
+
+def test_jobs_of_stopped_workers_are_requeued_once(jobs, redis_client):
+    jobs._heartbeat("gone")
+    redis_client.rpush(jobs._processing_key("gone"), _payload("a"), _payload("b"))
+    redis_client.rpush(jobs.PROCESSING_KEY, _payload("legacy"))
+    redis_client.delete(jobs._heartbeat_key("gone"))
+
+    assert jobs.recover_orphaned_jobs() == 3
+    assert jobs.recover_orphaned_jobs() == 0
+    assert sorted(redis_client.lrange(jobs.QUEUE_KEY, 0, -1)) == sorted(
+        [_payload("a"), _payload("b"), _payload("legacy")])
+    assert "gone" not in redis_client.smembers(jobs.CONSUMERS_KEY)
+
+
+def test_consumer_runs_jobs_from_its_own_list(jobs, redis_client, monkeypatch):
+    finished = threading.Event()
+    seen = []
+
+    def fake_run_job(job_id, doc_hash, file_path):
+        seen.append((job_id, redis_client.lrange(jobs._processing_key("me"), 0, -1)))
+        finished.set()
+
+    monkeypatch.setattr(jobs, "run_job", fake_run_job)
+    jobs._heartbeat("other")
+    redis_client.rpush(jobs._processing_key("other"), _payload("theirs"))
+    redis_client.rpush(jobs.QUEUE_KEY, _payload("mine"))
+    stop = threading.Event()
+    consumer = threading.Thread(target=jobs._consume, args=("me", stop), daemon=True)
+    consumer.start()
+
+    assert finished.wait(5)
+    stop.set()
+    consumer.join(5)
+    assert not consumer.is_alive()
+    assert seen == [("mine", [_payload("mine")])]
+    assert redis_client.lrange(jobs._processing_key("other"), 0, -1) == [_payload("theirs")]
+    assert redis_client.exists(jobs._heartbeat_key("me"))
+
+
+def test_background_workers_start_on_request_and_stop(jobs, monkeypatch):
+    import rag_on_doc.rag_on_doc
+    monkeypatch.setattr(jobs, "INGEST_QUEUE_BACKEND", "redis")
+    monkeypatch.setattr(jobs, "DOC_CLEANUP_INTERVAL", 60)
+    monkeypatch.setattr(jobs, "cleanup_orphaned_docs", lambda: 0)
+    monkeypatch.setattr(jobs, "_consumer", None)
+    monkeypatch.setattr(jobs, "_sweeper", None)
+
+    # importing the blueprint starts nothing, create_app does
+    assert not [thread for thread in threading.enumerate()
+                if thread.name in ("pdf-ingest-consumer", "pdf-doc-cleanup")]
+
+    jobs.start_background_workers()
+    consumer, sweeper = jobs._consumer, jobs._sweeper
+    assert consumer.is_alive() and sweeper.is_alive()
+    # the sweeper is waiting out its 60 second interval, the stop event wakes it
+    jobs.stop_background_workers(timeout=5)
+    assert not consumer.is_alive() and not sweeper.is_alive()
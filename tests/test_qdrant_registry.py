@@ -0,0 +1,54 @@
+from app import qdrant as registry
+from app.qdrant import get_client, get_vectorstore, ensure_collection, forget_collection, get_stats
+
+
+def _delta(before, after, *keys):
+    return tuple(after[key] - before[key] for key in keys)
+
+
+def test_one_client_per_process(monkeypatch):
+    monkeypatch.setattr(registry, "_client", None)
+    before = get_stats()
+    client = get_client()
+    assert get_client() is client and get_client() is client
+    assert _delta(before, get_stats(), "client_created") == (1,)
+    # a forked worker builds its own client instead of reusing the parent's
+    monkeypatch.setattr(registry, "_client_pid", -1)
+    assert get_client() is not client
+    assert _delta(before, get_stats(), "client_created") == (2,)
+
+
+def test_vectorstores_are_cached(qdrant, fake_embeddings):
+    before = get_stats()
+    vectorstore = get_vectorstore("docs", fake_embeddings)
+    assert vectorstore.client is qdrant
+    assert get_vectorstore("docs", fake_embeddings) is vectorstore
+    assert get_vectorstore("docs", fake_embeddings) is vectorstore
+    assert qdrant.collection_exists("docs")
+    assert _delta(before, get_stats(), "vectorstore_misses", "vectorstore_hits") == (1, 2)
+
+    # the collection is known once its vectorstore is built, no further round-trips
+    ensure_collection("docs")
+    ensure_collection("other")
+    ensure_collection("other")
+    assert _delta(before, get_stats(), "collection_misses", "collection_hits") == (2, 2)
+
+    forget_collection("docs")
+    assert get_vectorstore("docs", fake_embeddings) is not vectorstore
+    assert _delta(before, get_stats(), "vectorstore_misses") == (2,)
+
+
+def test_least_recently_used_vectorstore_is_evicted(qdrant, fake_embeddings, monkeypatch):
+    monkeypatch.setattr(registry, "MAX_VECTORSTORES", 2)
+    before = get_stats()
+    first = get_vectorstore("a", fake_embeddings)
+    get_vectorstore("b", fake_embeddings)
+    assert get_vectorstore("a", fake_embeddings) is first
+    get_vectorstore("c", fake_embeddings)
+    assert get_stats()["vectorstores_cached"] == 2
+    assert _delta(before, get_stats(), "evictions") == (1,)
+    # "b" was the least recently used one
+    assert get_vectorstore("a", fake_embeddings) is first
+    misses = get_stats()["vectorstore_misses"]
+    get_vectorstore("b", fake_embeddings)
+    assert get_stats()["vectorstore_misses"] == misses + 1
@@ -0,0 +1,32 @@
+from langchain_core.embeddings import Embeddings
+
+
+class SameVectorEmbeddings(Embeddings):
+    """Every text embeds to one vector, like function names that differ by a letter"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0] + [0.0] * 1535
+
+
+def test_lookup_requires_the_same_function_names(qdrant):
+    from app.semantic_cache import SemanticCache
+    cache = SemanticCache(SameVectorEmbeddings(), collection_name="cache_test")
+    cache.store("What does VLOOKUP do?", "vlookup answer", "excel")
+    cache.store("How do I sort a column?", "sort answer", "excel")
+
+    assert cache.lookup("What does VLOOKUP do exactly?", "excel") == "vlookup answer"
+    assert cache.lookup("What does XLOOKUP do?", "excel") is None
+    assert cache.lookup("Compare VLOOKUP and XLOOKUP", "excel") is None
+    assert cache.lookup("How can I sort a column", "excel") == "sort answer"
+    assert cache.lookup("How do I sort a column with SORTBY?", "excel") is None
+    assert cache.lookup("What does VLOOKUP do?", "other scope") is None
+
+
+def test_exact_terms():
+    from app.semantic_cache import exact_terms
+    assert exact_terms("Use T.TEST or VLOOKUP on A1, not vlookup") == "a1 t.test vlookup"
+    assert exact_terms("What does VLOOKUP do? VLOOKUP!") == "vlookup"
+    assert exact_terms("How do I sort a column?") == ""
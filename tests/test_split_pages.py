@@ -0,0 +1,45 @@
+import random
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+WORDS = "alpha beta gamma delta VLOOKUP XLOOKUP sum range cell table pivot chart".split()
+
+
+def _page(rng, paragraphs, long_lines=False):
+    lines = []
+    for _ in range(rng.randint(5, 12 if long_lines else 60)):
+        size = rng.choice([5, 200, 400] if long_lines else [3, 8, 15, 40])
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(size)))
+        if paragraphs and rng.random() < 0.3:
+            lines.append("")
+    if paragraphs:
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("paragraphs,long_lines", [(False, False), (True, False), (True, True)])
+@pytest.mark.parametrize("chunk_size,chunk_overlap,buffer_size", [(1000, 200, 8000), (500, 100, 4000), (1000, 0, 8000)])
+def test_chunks_match_splitting_the_joined_text(redis_client, paragraphs, long_lines, chunk_size, chunk_overlap,
+                                                buffer_size):
+    from rag_on_doc.utils import split_pages
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for seed in range(40):
+        rng = random.Random(seed)
+        pages = [_page(rng, paragraphs, long_lines) for _ in range(rng.randint(5, 20 if long_lines else 60))]
+        assert list(split_pages(pages, splitter, buffer_size)) == splitter.split_text("".join(pages)), seed
+
+
+def test_chunks_come_out_while_pages_are_read(redis_client):
+    from rag_on_doc.utils import split_pages
+    rng = random.Random(0)
+    pages = [_page(rng, True) for _ in range(200)]
+    read = []
+
+    def page_stream():
+        for index, page in enumerate(pages):
+            read.append(index)
+            yield page
+
+    chunks = split_pages(page_stream(), RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200))
+    next(chunks)
+    assert len(read) < 20
@@ -0,0 +1,69 @@
+import json
+import time
+import pytest
+from datetime import datetime
+from langchain.schema import HumanMessage, AIMessage
+from langchain_community.chat_message_histories import ChatMessageHistory
+
+
+def _legacy_chat(redis_client, session_id, chat_id, timestamp):
+    # the original format: JSON dicts, no story_index
+    for msg_type, content in (("human", "once upon a time"), ("ai", "there was a dragon")):
+        redis_client.rpush(f"story:{session_id}:{chat_id}",
+                           json.dumps({"type": msg_type, "content": content, "timestamp": timestamp}))
+
+
+def test_legacy_chats_are_merged_after_a_new_save(redis_client):
+    from story_api import utils
+    now = datetime.utcnow().isoformat()
+    _legacy_chat(redis_client, "s", "c1", now)
+    _legacy_chat(redis_client, "s", "c2", now)
+    redis_client.set("story:s:c1:summary", json.dumps({"summary": "a dragon story"}))
+
+    history = ChatMessageHistory()
+    history.add_messages([HumanMessage(content="new story"), AIMessage(content="a knight")])
+    utils.save_chat_data("s", "c3", history, now)
+
+    chats = utils.load_recent_chat_data("s")
+    assert sorted(chat["chat_key"] for chat in chats) == ["story:s:c1", "story:s:c2", "story:s:c3"]
+    # the saved chat keeps its real last-activity score and stays first
+    assert chats[0]["chat_key"] == "story:s:c3"
+    assert "c1:summary" not in redis_client.zrange("story_index:s", 0, -1)
+
+    # the scan runs once per session
+    _legacy_chat(redis_client, "s", "c4", now)
+    assert len(utils.load_recent_chat_data("s")) == 3
+
+
+def _turn(text):
+    history = ChatMessageHistory()
+    history.add_messages([HumanMessage(content=text), AIMessage(content=f"and then {text}")])
+    return history
+
+
+def test_reads_take_two_round_trips_and_never_write(redis_client, monkeypatch):
+    from story_api import utils
+    now = datetime.utcnow().isoformat()
+    utils.save_chat_data("r", "c1", _turn("a dragon"), now)
+    utils.save_chat_data("r", "c2", _turn("a knight"), now)
+    assert len(utils.load_recent_chat_data("r")) == 2
+
+    executed = []
+    execute = utils.history_store.execute
+    monkeypatch.setattr(utils.history_store, "execute", lambda pipe: executed.append(pipe) or execute(pipe))
+    for name in ("set", "keys", "zrange", "zrem", "zadd"):
+        monkeypatch.setattr(redis_client, name, lambda *args, **kwargs: pytest.fail("extra round-trip"))
+    # c1 expired, it is skipped but left in the index
+    redis_client.delete("story:r:c1")
+    chats = utils.load_recent_chat_data("r")
+    assert [chat["chat_key"] for chat in chats] == ["story:r:c2"]
+    assert len(executed) == 2
+
+
+def test_saves_prune_chats_idle_past_the_ttl(redis_client):
+    from story_api import utils
+    now = datetime.utcnow().isoformat()
+    utils.save_chat_data("p", "old", _turn("long ago"), now)
+    redis_client.zadd("story_index:p", {"old": time.time() - utils.history_store.ttl - 1})
+    utils.save_chat_data("p", "new", _turn("today"), now)
+    assert redis_client.zrange("story_index:p", 0, -1) == ["new"]
@@ -0,0 +1,136 @@
+import json
+import logging
+import pytest
+from flask import Flask
+from langchain.schema import AIMessage, HumanMessage
+from fakes import RecordingChatModel
+from app.qdrant import get_vectorstore
+
+GF_REPLY = "Hey you, how was your day?"
+EXCEL_REPLY = "VLOOKUP searches the first column of a range."
+
+
+def parse_events(body):
+    """[(event, data)] of an SSE body, event is None for plain `data` messages"""
+    events = []
+    for message in body.split("\n\n"):
+        if not message:
+            continue
+        event = None
+        for line in message.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def read_stream(response, after_each=None):
+    """Consume the streamed body chunk by chunk, calling after_each(events so far) after every chunk"""
+    body = ""
+    try:
+        for chunk in response.response:
+            body += chunk.decode() if isinstance(chunk, bytes) else chunk
+            if after_each:
+                after_each(parse_events(body))
+    finally:
+        response.close()
+    return parse_events(body)
+
+
+@pytest.fixture
+def gf_client(redis_client, monkeypatch):
+    import gf_ai_chat.gf_ai_chat as gf_chat
+    model = RecordingChatModel(responses=[GF_REPLY])
+    monkeypatch.setattr(gf_chat, "llm", model)
+    app = Flask(__name__)
+    app.register_blueprint(gf_chat.bp, url_prefix="/gf")
+    return app.test_client(), model
+
+
+@pytest.fixture
+def excel_client(redis_client, qdrant, fake_embeddings, chat_model, monkeypatch):
+    import app.chains
+    import excel_companion.utils as excel_utils
+    import excel_companion.excel_companion as excel_companion
+    monkeypatch.setattr(excel_utils, "embeddings", fake_embeddings)
+    monkeypatch.setattr(excel_utils, "EXCEL_HYBRID_SEARCH", False)
+    get_vectorstore(excel_companion.COLLECTION_NAME, fake_embeddings).add_texts(
+        [f"{name} looks up a value in a table range." for name in ("VLOOKUP", "XLOOKUP")])
+    # the answer step gets the streaming model, question condensing the plain one
+    streaming_model = RecordingChatModel(responses=[EXCEL_REPLY], streaming=True)
+    monkeypatch.setattr(app.chains, "get_chat_model",
+                        lambda *args, **kwargs: streaming_model if kwargs.get("streaming") else chat_model)
+    chat_model.responses = ["What does VLOOKUP return?"]
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(excel_companion.bp, url_prefix="/excel")
+    client = flask_app.test_client()
+    client.set_cookie("session_id", "s")
+    return client, excel_utils
+
+
+def test_gf_ask_streams_tokens_then_saves_the_reply(gf_client):
+    from gf_ai_chat.utils import load_session_history
+    client, _ = gf_client
+    client.set_cookie("session_id", "s")
+    response = client.post("/gf/ask", json={"message": "hi", "stream": True})
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    def nothing_saved_before_done(events):
+        if not any(event == "done" for event, _ in events):
+            assert load_session_history("s")[0].messages == []
+
+    events = read_stream(response, nothing_saved_before_done)
+    tokens = [data["token"] for event, data in events if event is None]
+    assert len(tokens) == len(GF_REPLY.split())
+    assert "".join(tokens) == GF_REPLY
+    event, done = events[-1]
+    assert event == "done"
+    assert done["status"] == "success" and done["response"] == GF_REPLY
+    assert done["time_to_first_token"] is not None
+
+    messages = load_session_history("s")[0].messages
+    assert [type(msg) for msg in messages] == [HumanMessage, AIMessage]
+    assert [msg.content for msg in messages] == ["hi", GF_REPLY]
+
+
+def test_gf_ask_streams_errors_as_an_error_event(gf_client):
+    from gf_ai_chat.utils import load_session_history
+    client, model = gf_client
+    model.respond = lambda messages: 1 / 0
+    client.set_cookie("session_id", "s")
+    events = read_stream(client.post("/gf/ask?stream=1", json={"message": "hi"}))
+    assert events == [("error", {"status": "fail", "error": "division by zero"})]
+    assert load_session_history("s")[0].messages == []
+
+
+def test_excel_query_streams_only_the_answer(excel_client, chat_model):
+    client, excel_utils = excel_client
+    for turn, question in enumerate(["What does VLOOKUP do?", "And what does it return?"]):
+        response = client.post("/excel/query", json={"query": question, "chat_id": "c", "stream": True,
+                                                      "cache": False})
+        assert response.mimetype == "text/event-stream"
+        saved = len(excel_utils.load_user_chat_messages("s", "c").chat_memory.messages)
+
+        def nothing_saved_before_done(events):
+            if not any(event == "done" for event, _ in events):
+                assert len(excel_utils.load_user_chat_messages("s", "c").chat_memory.messages) == saved
+
+        events = read_stream(response, nothing_saved_before_done)
+        # the condensed question of the second turn is not streamed
+        assert "".join(data["token"] for event, data in events if event is None) == EXCEL_REPLY
+        assert events[-1] == ("done", {"answer": EXCEL_REPLY, "chat_id": "c", "status": "success",
+                                       "time_to_first_token": events[-1][1]["time_to_first_token"]})
+
+    messages = excel_utils.load_user_chat_messages("s", "c").chat_memory.messages
+    assert [msg.content for msg in messages] == [
+        "What does VLOOKUP do?", EXCEL_REPLY, "And what does it return?", EXCEL_REPLY]
+    assert len(chat_model.calls) == 1
+
+
+def test_time_to_first_token_is_logged(gf_client, caplog):
+    client, _ = gf_client
+    with caplog.at_level(logging.INFO, logger="app.streaming"):
+        read_stream(client.post("/gf/ask", json={"message": "hi", "stream": True}))
+    assert any("gf/ask time to first token" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,83 @@
+import time
+import pytest
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+from text_api import summarize
+from text_api.summarize import choose_mode, split_documents, map_reduce_summarize, refine_summarize
+
+PROMPT = PromptTemplate.from_template("Summarize in three bullet points:\n{page_content}\n")
+SENTENCE = "The quarterly report lists revenue, costs and the hiring plan for each region. "
+
+
+def _docs(chunks):
+    """Documents that split_documents(docs, 100) keeps as one chunk each"""
+    return [Document(page_content=f"Page {page}. " + SENTENCE * 4) for page in range(chunks)]
+
+
+def _text(messages):
+    return "\n".join(msg.content for msg in messages)
+
+
+def test_choose_mode_switches_on_token_count(monkeypatch):
+    monkeypatch.setattr(summarize, "SUMMARY_STUFF_MAX_TOKENS", 1000)
+    assert choose_mode(_docs(1)) == "stuff"
+    assert choose_mode(_docs(20)) == "map_reduce"
+    assert choose_mode(_docs(20), "refine") == "refine"
+    with pytest.raises(ValueError):
+        choose_mode(_docs(1), "bogus")
+
+
+def test_map_reduce_calls_and_bounded_concurrency(chat_model):
+    chat_model.respond = lambda messages: "partial summary" if "part of a longer document" in _text(messages) \
+        else "final summary"
+    chat_model.latency = 0.1
+    docs = _docs(12)
+    chunks = split_documents(docs, 100)
+    assert len(chunks) == 12
+
+    started = time.perf_counter()
+    assert map_reduce_summarize(docs, chat_model, PROMPT, max_concurrency=3, chunk_tokens=100) == "final summary"
+    elapsed = time.perf_counter() - started
+
+    calls = chat_model.calls
+    # one map call per chunk and a single final call that sees the partial summaries, not the content
+    assert len(calls) == len(chunks) + 1
+    assert sorted(_text(call) for call in calls[:-1]) == sorted(
+        summarize.MAP_PROMPT.format(page_content=chunk.page_content) for chunk in chunks)
+    assert "partial summary" in _text(calls[-1]) and SENTENCE.strip() not in _text(calls[-1])
+    assert chat_model.peak_concurrency == 3
+    # the map step takes ceil(chunks / 3) rounds of latency, not one per chunk
+    assert elapsed < (len(chunks) + 1) * 0.1 * 0.6
+
+
+def test_map_reduce_collapses_until_summaries_fit(chat_model):
+    # every map or collapse call returns ~26 tokens, so 8 of them need two collapse rounds to fit in 60
+    chat_model.respond = lambda messages: "x" * 100
+    docs = _docs(8)
+    chunks = len(split_documents(docs, 100))
+    assert chunks == 8
+
+    map_reduce_summarize(docs, chat_model, PROMPT, max_concurrency=4, chunk_tokens=100, max_tokens=60)
+    # 8 map calls, 8 -> 4 -> 2 collapse calls, then the final prompt
+    assert len(chat_model.calls) == 8 + 4 + 2 + 1
+    assert chat_model.peak_concurrency <= 4
+
+
+def test_refine_is_sequential_and_carries_the_summary(chat_model):
+    chat_model.respond = lambda messages: f"summary {len(chat_model.calls)}"
+    chat_model.latency = 0.01
+    docs = _docs(5)
+    chunks = split_documents(docs, 100)
+
+    assert refine_summarize(docs, chat_model, PROMPT, chunk_tokens=100) == f"summary {len(chunks)}"
+    calls = chat_model.calls
+    assert len(calls) == len(chunks)
+    assert chat_model.peak_concurrency == 1
+    for index, call in enumerate(calls[1:], start=1):
+        assert f"summary {index}" in _text(call)
+
+
+def test_stuff_is_one_call(chat_model):
+    chat_model.responses = ["whole summary"]
+    assert summarize.summarize(_docs(3), chat_model, PROMPT, "stuff") == "whole summary"
+    assert len(chat_model.calls) == 1
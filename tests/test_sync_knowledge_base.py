@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.qdrant import get_vectorstore
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: list = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def sync(qdrant, monkeypatch):
+    import common
+    embeddings = CountingEmbeddings(size=1536, embedded=[])
+    # built up front, QdrantVectorStore embeds a probe text while validating the collection
+    get_vectorstore("kb", embeddings)
+    monkeypatch.setattr(common, "get_qdrant_vectorstore",
+                        lambda collection_name: get_vectorstore(collection_name, embeddings))
+
+    def run(chunks, **kwargs):
+        embeddings.embedded.clear()
+        result = common.sync_knowledge_base(chunks, collection_name="kb", **kwargs)
+        return result, list(embeddings.embedded)
+    return run
+
+
+def contents(client):
+    points, _ = client.scroll("kb", limit=100)
+    return {point.payload["page_content"]: str(point.id) for point in points}
+
+
+def test_only_the_diff_is_synced(sync, qdrant):
+    result, embedded = sync(["VLOOKUP(a)", "SUM(b)", "IF(c)"])
+    assert result == {"added": 3, "deleted": 0, "unchanged": 0}
+    assert sorted(embedded) == ["IF(c)", "SUM(b)", "VLOOKUP(a)"]
+    first = contents(qdrant)
+
+    # SUM changed, IF removed
+    result, embedded = sync(["VLOOKUP(a)", "SUM(b, c)"])
+    assert result == {"added": 1, "deleted": 2, "unchanged": 1}
+    assert embedded == ["SUM(b, c)"]
+    second = contents(qdrant)
+    assert set(second) == {"VLOOKUP(a)", "SUM(b, c)"}
+    assert second["VLOOKUP(a)"] == first["VLOOKUP(a)"]
+
+    result, embedded = sync(["VLOOKUP(a)", "SUM(b, c)"])
+    assert result == {"added": 0, "deleted": 0, "unchanged": 2}
+    assert embedded == []
+    assert contents(qdrant) == second
+
+
+def test_other_sources_are_left_alone(sync, qdrant):
+    vectorstore = get_vectorstore("kb", DeterministicFakeEmbedding(size=1536))
+    vectorstore.add_texts(["pdf chunk"], metadatas=[{"source": "pdf"}])
+    vectorstore.add_texts(["unmarked chunk"])
+
+    sync(["VLOOKUP(a)"])
+    assert set(contents(qdrant)) == {"pdf chunk", "unmarked chunk", "VLOOKUP(a)"}
+
+    result, _ = sync(["VLOOKUP(a)"], drop_unmanaged=True)
+    assert result == {"added": 0, "deleted": 1, "unchanged": 1}
+    assert set(contents(qdrant)) == {"pdf chunk", "VLOOKUP(a)"}
@@ -0,0 +1,82 @@
+from langchain.chains import ConversationalRetrievalChain
+from langchain.schema import HumanMessage, SystemMessage
+from app.qdrant import get_vectorstore
+
+QUESTIONS = [
+    "What does VLOOKUP do?",
+    "How is it different from XLOOKUP?",
+    "Show an example with a table range",
+    "What happens when the value is missing?",
+    "Can it search to the left?",
+]
+COLLECTION = "Excel_Docs_DB"
+
+
+def _setup(qdrant, fake_embeddings, monkeypatch):
+    import excel_companion.utils as excel_utils
+    monkeypatch.setattr(excel_utils, "embeddings", fake_embeddings)
+    monkeypatch.setattr(excel_utils, "EXCEL_HYBRID_SEARCH", False)
+    vectorstore = get_vectorstore(COLLECTION, fake_embeddings)
+    vectorstore.add_texts([f"{name} looks up a value in a table range." for name in ("VLOOKUP", "XLOOKUP", "HLOOKUP")])
+    return excel_utils, vectorstore
+
+
+def _stored_bytes(redis_client, key):
+    return sum(len(value.encode()) for value in redis_client.lrange(key, 0, -1))
+
+
+def _legacy_turn(excel_utils, vectorstore, model, query, timestamp):
+    """ask_query before the change: prompt inserted into the loaded history, chain built with that memory"""
+    from excel_companion.excel_companion import SYSTEM_PROMPT
+    history = excel_utils.load_user_chat_messages("s", "legacy")
+    history.chat_memory.messages = excel_utils.history_store.load_messages(
+        "excel_user_chat:s:legacy", -20, -1)
+    history.chat_memory.messages.append(HumanMessage(content=query, additional_kwargs={"timestamp": timestamp}))
+    history.chat_memory.messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
+    chain = ConversationalRetrievalChain.from_llm(llm=model, retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
+                                                  memory=history, return_source_documents=False)
+    chain.invoke({"question": query})
+    excel_utils.save_user_chat_messages("s", "legacy", history, timestamp, real_time=True)
+
+
+def _current_turn(excel_utils, query, timestamp):
+    from excel_companion.excel_companion import SYSTEM_PROMPT
+    history = excel_utils.load_user_chat_messages("s", "current")
+    excel_utils.get_answer_from_query(query, history, COLLECTION, system_prompt=SYSTEM_PROMPT, use_cache=False)
+    excel_utils.save_user_chat_messages("s", "current", history, timestamp, real_time=True)
+
+
+def test_tokens_and_bytes_per_turn(redis_client, qdrant, fake_embeddings, chat_model, monkeypatch):
+    from excel_companion.excel_companion import SYSTEM_PROMPT
+    excel_utils, vectorstore = _setup(qdrant, fake_embeddings, monkeypatch)
+    chat_model.responses = ["VLOOKUP searches the first column of a range and returns a value from the same row."]
+
+    rows = []
+    for turn, query in enumerate(QUESTIONS):
+        timestamp = f"2025-01-01T10:00:{turn:02d}"
+        chat_model.reset()
+        _legacy_turn(excel_utils, vectorstore, chat_model, query, timestamp)
+        before = chat_model.calls
+        chat_model.reset()
+        _current_turn(excel_utils, query, timestamp)
+        after = chat_model.calls
+        rows.append((turn, chat_model.prompt_tokens(before), chat_model.prompt_tokens(after),
+                     chat_model.prompt_bytes(before), chat_model.prompt_bytes(after)))
+
+        # the prompt goes to the answer call once and never to question condensing
+        prompt_calls = [call for call in after if any(SYSTEM_PROMPT.strip() in msg.content for msg in call)]
+        assert len(prompt_calls) == 1
+
+    print("\nturn  tokens before/after  bytes before/after")
+    for row in rows:
+        print("%4d  %6d / %-6d  %7d / %-7d" % row)
+    # once there is history to condense, the old flow resends the prompt and a duplicated question
+    for turn, tokens_before, tokens_after, bytes_before, bytes_after in rows[1:]:
+        assert tokens_after < tokens_before
+        assert bytes_after < bytes_before
+
+    stored = excel_utils.history_store.load_messages("excel_user_chat:s:current")
+    assert [msg.type for msg in stored] == ["human", "ai"] * len(QUESTIONS)
+    assert all(SYSTEM_PROMPT.strip() not in msg.content for msg in stored)
+    assert _stored_bytes(redis_client, "excel_user_chat:s:current") \
+        <= _stored_bytes(redis_client, "excel_user_chat:s:legacy")
@@ -0,0 +1,145 @@
+import threading
+import pytest
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+
+URL = "https://example.test/article?utm_source=x"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def iter_content(self, size):
+        yield self.content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeServer:
+    """Stands in for requests.get / requests.head, answering conditional requests with 304 until changed"""
+
+    def __init__(self, body=b"<p>hello</p>", etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(("GET", url, dict(headers or {})))
+        return FakeResponse(200, self.body, {"ETag": self.etag, "Last-Modified": "Mon, 06 Jan 2025 10:00:00 GMT"})
+
+    def head(self, url, headers=None, **kwargs):
+        self.requests.append(("HEAD", url, dict(headers or {})))
+        if (headers or {}).get("If-None-Match") == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, headers={"ETag": self.etag})
+
+    def methods(self):
+        return [method for method, _, _ in self.requests]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    from text_api import cache
+    monkeypatch.setattr(cache, "TEXT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "_stores", {})
+    monkeypatch.setattr(cache, "stats", dict.fromkeys(cache.stats, 0))
+    server = FakeServer()
+    monkeypatch.setattr(cache.requests, "get", server.get)
+    monkeypatch.setattr(cache.requests, "head", server.head)
+    return cache, server
+
+
+def _loader(calls):
+    def fetch(response):
+        calls.append(response)
+        return [Document(page_content=response.content.decode(), metadata={"source": URL})]
+    return fetch
+
+
+def test_miss_is_fetched_with_one_get(cache):
+    cache, server = cache
+    calls = []
+    docs = cache.get_cached_content(URL, _loader(calls))
+
+    assert server.methods() == ["GET"]
+    assert [doc.page_content for doc in docs] == ["<p>hello</p>"]
+    assert len(calls) == 1 and calls[0].content == b"<p>hello</p>"
+    # fresh entries are served without asking the server
+    assert cache.get_cached_content(URL.replace("?utm_source=x", ""), _loader(calls))[0].page_content == "<p>hello</p>"
+    assert server.methods() == ["GET"] and len(calls) == 1
+    assert cache.get_stats()["content_misses"] == 1 and cache.get_stats()["content_hits"] == 1
+
+
+def test_stale_entry_is_revalidated_with_its_etag(cache, monkeypatch):
+    cache, server = cache
+    calls = []
+    cache.get_cached_content(URL, _loader(calls))
+    monkeypatch.setattr(cache, "CONTENT_CACHE_TTL", -1)
+
+    # 304: the stored documents are reused, nothing is downloaded
+    assert cache.get_cached_content(URL, _loader(calls))[0].page_content == "<p>hello</p>"
+    assert server.methods() == ["GET", "HEAD"]
+    assert server.requests[1][2]["If-None-Match"] == '"v1"'
+    assert server.requests[1][2]["If-Modified-Since"] == "Mon, 06 Jan 2025 10:00:00 GMT"
+    assert len(calls) == 1 and cache.get_stats()["content_revalidated"] == 1
+
+    # changed page: one GET for the new body
+    server.body, server.etag = b"<p>changed</p>", '"v2"'
+    assert cache.get_cached_content(URL, _loader(calls))[0].page_content == "<p>changed</p>"
+    assert server.methods() == ["GET", "HEAD", "HEAD", "GET"]
+    assert len(calls) == 2
+
+
+def test_content_without_revalidation_is_fetched_by_the_caller(cache):
+    cache, server = cache
+    calls = []
+    assert cache.get_cached_content("youtube:abc", lambda response: calls.append(response) or "text",
+                                    revalidate=False) == "text"
+    assert calls == [None] and server.requests == []
+
+
+def test_summaries_are_keyed_by_prompt_version(cache, monkeypatch):
+    from text_api import utils
+    cache, _ = cache
+    summarized = []
+    monkeypatch.setattr(utils, "summarize",
+                        lambda docs, model, prompt, mode: summarized.append(prompt.template) or f"summary {len(summarized)}")
+    model = type("Model", (), {"model_name": "gpt-4o-mini", "temperature": 0.2})()
+    docs = [Document(page_content="VLOOKUP searches the first column.")]
+    short = PromptTemplate(template="Summarize: {page_content}", input_variables=["page_content"])
+    bullets = PromptTemplate(template="Summarize as bullets: {page_content}", input_variables=["page_content"])
+
+    assert utils.summarize_documents(docs, model, short, "stuff")["output_text"] == "summary 1"
+    assert utils.summarize_documents(docs, model, short, "stuff")["output_text"] == "summary 1"
+    assert utils.summarize_documents(docs, model, bullets, "stuff")["output_text"] == "summary 2"
+    assert utils.summarize_documents(docs, model, short, "map_reduce")["output_text"] == "summary 3"
+    assert summarized == [short.template, bullets.template, short.template]
+    assert cache.get_stats()["summary_hits"] == 1 and cache.get_stats()["summary_misses"] == 3
+
+
+def test_stats_are_counted_under_concurrency(cache):
+    cache, _ = cache
+    docs = [Document(page_content="text")]
+    cache.get_cached_summary(docs, "key", lambda docs: "summary")
+
+    def hit():
+        for _ in range(200):
+            cache.get_cached_summary(docs, "key", lambda docs: pytest.fail("summarized again"))
+
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get_stats()["summary_hits"] == 1600
@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in a fresh gevent-patched interpreter, prints the longest pause of a 10ms ticker greenlet
+STALL_PROBE = """
+from gevent import monkey; monkey.patch_all()
+import sys, time, gevent
+sys.path.insert(0, %r)
+from app.threads import run_in_thread, start_thread
+
+def busy():
+    deadline = time.perf_counter() + 0.5
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    return "done"
+
+ticks = []
+def ticker():
+    while True:
+        ticks.append(time.perf_counter())
+        gevent.sleep(0.01)
+
+gevent.spawn(ticker)
+gevent.sleep(0.05)
+%s
+gevent.sleep(0.05)
+print(max(b - a for a, b in zip(ticks, ticks[1:])))
+"""
+
+
+def _max_stall(code):
+    output = subprocess.run([sys.executable, "-c", STALL_PROBE % (ROOT, code)], capture_output=True, text=True,
+                            timeout=60, check=True).stdout
+    return float(output.split()[-1])
+
+
+def test_cpu_work_off_the_hub_keeps_greenlets_running():
+    pytest.importorskip("gevent")
+    assert _max_stall("busy()") > 0.4
+    assert _max_stall("assert run_in_thread(busy) == 'done'") < 0.2
+    assert _max_stall("start_thread(busy); gevent.sleep(0.6)") < 0.2
+
+
+def test_without_gevent_work_runs_inline():
+    from app.threads import gevent_patched, run_in_thread, thread_pool_executor
+    assert not gevent_patched()
+    assert run_in_thread(sum, [1, 2, 3]) == 6
+    with thread_pool_executor(2, "test") as pool:
+        assert pool.submit(sum, [1, 2]).result() == 3
@@ -0,0 +1,159 @@
+import io
+import time
+import wave
+import threading
+from array import array
+import pytest
+
+RATE = 8000
+WORD_SECONDS = 0.8
+GAP_SECONDS = 0.2
+BASE_AMPLITUDE = 1000
+STEP = 37
+
+
+def synthetic_wav(words):
+    """One square-wave tone per word with a short pause after it, the amplitude encodes the word index"""
+    samples = array("h")
+    for index in range(words):
+        amplitude = BASE_AMPLITUDE + STEP * index
+        samples.extend([amplitude, -amplitude] * int(WORD_SECONDS * RATE / 2))
+        samples.extend([0] * int(GAP_SECONDS * RATE))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(RATE)
+        out.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+class FakeTranscriber:
+    """Hears a word for every run of tone in a WAV segment, records calls and concurrency"""
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, data, filename):
+        with self.lock:
+            self.calls.append((filename, len(data)))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency)
+            with wave.open(io.BytesIO(data), "rb") as source:
+                samples = array("h", source.readframes(source.getnframes()))
+            words, run = [], []
+            for sample in list(samples) + [0]:
+                if sample:
+                    run.append(abs(sample))
+                elif run:
+                    words.append(f"w{round((max(run) - BASE_AMPLITUDE) / STEP)}")
+                    run = []
+            return " ".join(words)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def text_utils(monkeypatch):
+    from text_api import utils
+    return utils
+
+
+def test_short_audio_is_sent_as_uploaded(text_utils, monkeypatch):
+    from text_api import transcribe
+    monkeypatch.setattr(transcribe, "to_wav", lambda *args: pytest.fail("short audio was decoded"))
+    fake = FakeTranscriber()
+    monkeypatch.setattr(text_utils, "_transcribe_once", fake)
+    data = synthetic_wav(20)
+
+    assert text_utils.transcribe_audio_bytes(data, "talk.wav") == " ".join(f"w{i}" for i in range(20))
+    assert fake.calls == [("talk.wav", len(data))]
+
+
+def test_compressed_audio_under_the_window_is_not_decoded(text_utils, monkeypatch):
+    from text_api import transcribe
+    monkeypatch.setattr(transcribe, "to_wav", lambda *args: pytest.fail("short audio was decoded"))
+    monkeypatch.setattr(transcribe, "audio_duration", lambda filename, data: 90.0)
+    sent = []
+    monkeypatch.setattr(text_utils, "_transcribe_once", lambda data, filename: sent.append((filename, data)) or "hi")
+
+    assert text_utils.transcribe_audio_bytes(b"mp3 bytes", "talk.mp3") == "hi"
+    assert sent == [("talk.mp3", b"mp3 bytes")]
+
+
+def test_other_containers_are_reencoded_only_when_sent_whole(text_utils, monkeypatch):
+    sent, chunked = [], []
+    monkeypatch.setattr(text_utils, "to_transcribable", lambda filename, data: ("audio.mp3", b"mp3 bytes"))
+    monkeypatch.setattr(text_utils, "_transcribe_once", lambda data, filename: sent.append((filename, data)) or "short")
+    monkeypatch.setattr(text_utils, "transcribe_chunked",
+                        lambda filename, data, transcribe: chunked.append((filename, data)) or "long")
+
+    monkeypatch.setattr(text_utils, "needs_chunking", lambda filename, data: False)
+    assert text_utils.transcribe_audio_bytes(b"mka bytes", "talk.mka") == "short"
+    assert sent == [("audio.mp3", b"mp3 bytes")]
+
+    # long audio is decoded to WAV segments from the original, an mp3 in between would be wasted
+    monkeypatch.setattr(text_utils, "needs_chunking", lambda filename, data: True)
+    assert text_utils.transcribe_audio_bytes(b"mka bytes", "talk.mka") == "long"
+    assert chunked == [("talk.mka", b"mka bytes")]
+
+
+def test_long_audio_is_split_and_stitched():
+    from text_api import transcribe
+    fake = FakeTranscriber(latency=0.2)
+    data = synthetic_wav(60)
+    assert transcribe.needs_chunking("talk.wav", data, window_seconds=10)
+
+    started = time.perf_counter()
+    text = transcribe.transcribe_chunked("talk.wav", data, fake, window_seconds=10)
+    elapsed = time.perf_counter() - started
+
+    assert text == " ".join(f"w{i}" for i in range(60))
+    assert len(fake.calls) >= 6
+    assert 1 < fake.peak <= transcribe.TRANSCRIBE_CONCURRENCY
+    # segments overlap in time, so the total is well under one latency per segment
+    assert elapsed < fake.latency * len(fake.calls)
+
+
+def test_audio_near_the_size_limit_is_chunked(monkeypatch):
+    from text_api import transcribe
+    data = synthetic_wav(5)
+    assert not transcribe.needs_chunking("talk.wav", data)
+    monkeypatch.setattr(transcribe, "TRANSCRIBE_SEGMENT_MAX_BYTES", len(data) - 1)
+    assert transcribe.needs_chunking("talk.wav", data)
+
+
+def test_small_compressed_audio_is_not_probed(monkeypatch):
+    from text_api import transcribe
+    monkeypatch.setattr(transcribe, "_probe_duration", lambda data: pytest.fail("small audio was probed"))
+    data = b"\0" * (transcribe.TRANSCRIBE_WINDOW_SECONDS * transcribe.TRANSCRIBE_MIN_BYTES_PER_SECOND - 1)
+    assert not transcribe.needs_chunking("talk.mp3", data)
+
+
+def test_duration_is_read_from_the_header_over_a_pipe(tmp_path, monkeypatch):
+    import subprocess
+    from moviepy.config import FFMPEG_BINARY
+    from text_api import transcribe
+    encoded = {}
+    for ext in ("flac", "mp3"):
+        target = tmp_path / f"talk.{ext}"
+        subprocess.run([FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", str(target)],
+                       input=synthetic_wav(30), check=True)
+        encoded[ext] = target.read_bytes()
+    monkeypatch.setattr(transcribe.tempfile, "TemporaryDirectory",
+                        lambda *args, **kwargs: pytest.fail("audio was written to disk"))
+
+    # flac carries the length in its header, mp3 read from a pipe is estimated from the bitrate
+    assert transcribe.audio_duration("talk.flac", encoded["flac"]) == pytest.approx(30, abs=0.1)
+    assert transcribe.audio_duration("talk.mp3", encoded["mp3"]) == pytest.approx(30, rel=0.05)
+    assert transcribe.audio_duration("talk.mp3", b"not audio") is None
+    monkeypatch.setattr(transcribe, "TRANSCRIBE_MIN_BYTES_PER_SECOND", 1)
+    assert transcribe.needs_chunking("talk.flac", encoded["flac"], window_seconds=20)
+    assert not transcribe.needs_chunking("talk.flac", encoded["flac"], window_seconds=40)
@@ -0,0 +1,225 @@
+import io
+import os
+import json
+import time
+import hashlib
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.test import EnvironBuilder
+from app.uploads import UploadRequest, HashingSpool, UploadTooLarge, get_upload, upload_hash, upload_bytes, \
+    upload_size, save_upload
+
+
+class CountingStream(io.BytesIO):
+    """Request body that records how much of it was read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = super().readline(size)
+        self.consumed += len(data)
+        return data
+
+
+@pytest.fixture
+def upload_app():
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+
+    @app.post("/upload")
+    def upload():
+        try:
+            file = get_upload("file", max_size=int(request.args["max"]))
+        except UploadTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        if file is None:
+            return jsonify({"error": "No file uploaded"}), 400
+        return jsonify({"size": upload_size(file), "sha256": upload_hash(file), "bytes": len(upload_bytes(file)),
+                        "spooled": isinstance(file.stream, HashingSpool), "form": request.form.get("mode")})
+
+    return app
+
+
+def test_upload_is_hashed_while_parsed(upload_app):
+    data = os.urandom(300 * 1024)
+    response = upload_app.test_client().post("/upload?max=1048576", data={
+        "file": (io.BytesIO(data), "a.bin"), "mode": "stuff"})
+    assert response.status_code == 200
+    assert response.json == {"size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data),
+                             "spooled": True, "form": "stuff"}
+
+
+def test_limits(upload_app):
+    client = upload_app.test_client()
+    assert client.post("/upload?max=1024", data={"file": (io.BytesIO(b"x" * 1024), "a.bin")}).status_code == 200
+    response = client.post("/upload?max=1024", data={"file": (io.BytesIO(b"x" * 1025), "a.bin")})
+    assert response.status_code == 413 and response.json["error"].startswith("File size exceeds")
+    assert client.post("/upload?max=1024", data={"other": "x"}).status_code == 400
+
+
+def test_oversized_body_without_content_length_is_not_read(upload_app):
+    builder = EnvironBuilder(method="POST", path="/upload?max=1024", data={
+        "file": (io.BytesIO(b"x" * (4 * 1024 * 1024)), "big.bin")})
+    environ = builder.get_environ()
+    body = CountingStream(environ["wsgi.input"].read())
+    # a chunked request: the size is only known once the body has been read
+    del environ["CONTENT_LENGTH"]
+    environ.update({"wsgi.input": body, "wsgi.input_terminated": True})
+
+    with upload_app.request_context(environ):
+        with pytest.raises(UploadTooLarge):
+            get_upload("file", max_size=1024)
+    assert body.consumed < 1024 * 1024
+
+
+def test_spool_moves_to_disk_above_the_spool_size():
+    spool = HashingSpool(spool_size=1024)
+    for _ in range(8):
+        spool.write(b"y" * 512)
+    spool.seek(0)
+    assert spool.size == 4096 and spool.read() == b"y" * 4096
+    assert spool._file._rolled
+    assert spool.hexdigest() == hashlib.sha256(b"y" * 4096).hexdigest()
+
+
+class _Upload:
+    def __init__(self, stream):
+        self.stream = stream
+
+
+class FailingStream(io.BytesIO):
+    def read(self, size=-1):
+        if self.tell() >= 1024:
+            raise OSError("connection reset")
+        return super().read(min(size, 1024) if size and size > 0 else 1024)
+
+
+def test_save_upload_is_atomic(tmp_path):
+    path = tmp_path / "doc.pdf"
+    save_upload(_Upload(io.BytesIO(b"first version")), str(path))
+    assert path.read_bytes() == b"first version"
+
+    with pytest.raises(OSError):
+        save_upload(_Upload(FailingStream(b"z" * 4096)), str(path))
+    # a failed write leaves the previous file and no partial one
+    assert path.read_bytes() == b"first version"
+    assert os.listdir(tmp_path) == ["doc.pdf"]
+
+
+@pytest.fixture
+def pdf_client(redis_client, qdrant, tmp_path, monkeypatch):
+    from rag_on_doc import rag_on_doc
+    monkeypatch.setattr(rag_on_doc, "UPLOAD_FOLDER", str(tmp_path))
+    jobs = []
+
+    def submit(doc_hash, file_path):
+        with open(file_path, "rb") if os.path.exists(file_path) else io.BytesIO() as f:
+            jobs.append((doc_hash, f.read()))
+        job = {"job_id": doc_hash, "doc_hash": doc_hash, "status": "queued", "processed": 0, "total": None,
+               "error": None, "updated_at": time.time()}
+        redis_client.set(f"pdf_job:{doc_hash}", json.dumps(job))
+        return job, True
+
+    monkeypatch.setattr(rag_on_doc, "submit_ingest_job", submit)
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.register_blueprint(rag_on_doc.bp, url_prefix="/pdf")
+    return app.test_client(), rag_on_doc, jobs
+
+
+def _pdf_bytes():
+    import fitz
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "VLOOKUP searches the first column.")
+        return pdf.tobytes()
+
+
+def test_pdf_upload_is_validated_before_it_is_saved(pdf_client, redis_client, tmp_path):
+    client, rag_on_doc, jobs = pdf_client
+    response = client.post("/pdf/upload", data={"file": (io.BytesIO(b"%PDF-1.4 not really"), "fake.pdf")})
+    assert response.status_code == 400 and response.json["error"] == "File is not a valid PDF"
+    assert os.listdir(tmp_path) == [] and jobs == []
+    # the reference taken for the upload was released
+    assert not redis_client.keys("doc_refs:*")
+
+    response = client.post("/pdf/upload", data={"file": (io.BytesIO(b"x" * (rag_on_doc.PDF_MAX_SIZE + 1)), "big.pdf")})
+    assert response.status_code == 400 and "exceeds" in response.json["error"]
+    assert os.listdir(tmp_path) == [] and jobs == []
+
+
+def test_pdf_upload_is_saved_by_content_hash(pdf_client, tmp_path):
+    client, rag_on_doc, jobs = pdf_client
+    data = _pdf_bytes()
+    doc_hash = hashlib.sha256(data).hexdigest()
+    response = client.post("/pdf/upload", data={"file": (io.BytesIO(data), "notes.pdf")})
+    assert response.status_code == 202 and response.json["job_id"] == response.json["doc_id"]
+    assert jobs == [(doc_hash, data)]
+    assert (tmp_path / f"{doc_hash}.pdf").read_bytes() == data
+
+
+def test_upload_status_is_only_visible_to_the_uploader(pdf_client, redis_client):
+    client, rag_on_doc, jobs = pdf_client
+    data = _pdf_bytes()
+    doc_hash = hashlib.sha256(data).hexdigest()
+    job_id = client.post("/pdf/upload", data={"file": (io.BytesIO(data), "notes.pdf")}).json["job_id"]
+
+    status = client.get(f"/pdf/upload/{job_id}")
+    assert status.status_code == 200
+    assert status.json["status"] == "queued" and status.json["job_id"] == job_id
+    assert doc_hash not in status.get_data(as_text=True)
+
+    # another session can neither use the job id nor probe for the content hash
+    other = client.application.test_client()
+    assert other.get(f"/pdf/upload/{job_id}").status_code == 404
+    assert other.get(f"/pdf/upload/{doc_hash}").status_code == 404
+    assert client.get(f"/pdf/upload/{doc_hash}").status_code == 404
+
+    # once the job record expires a stored document still reports done
+    redis_client.delete(f"pdf_job:{doc_hash}")
+    redis_client.set(f"doc_store:{doc_hash}", 7)
+    assert client.get(f"/pdf/upload/{job_id}").json == {
+        "job_id": job_id, "status": "done", "processed": 7, "total": 7, "error": None}
+
+
+def test_failed_upload_releases_the_reference_and_the_file(pdf_client, redis_client, tmp_path, monkeypatch):
+    client, rag_on_doc, jobs = pdf_client
+    submit = rag_on_doc.submit_ingest_job
+
+    def failing_submit(doc_hash, file_path):
+        raise ConnectionError("queue unavailable")
+
+    monkeypatch.setattr(rag_on_doc, "submit_ingest_job", failing_submit)
+    response = client.post("/pdf/upload", data={"file": (io.BytesIO(_pdf_bytes()), "notes.pdf")})
+    assert response.status_code == 500 and response.json["error"] == "queue unavailable"
+    assert os.listdir(tmp_path) == []
+    assert not redis_client.keys("doc_refs:*") and not redis_client.keys("doc_hash:*")
+
+    def failing_save(session_id, doc_id, title=None):
+        raise ConnectionError("redis went away")
+
+    # the job was queued before the failure, so the file is left for it
+    monkeypatch.setattr(rag_on_doc, "submit_ingest_job", submit)
+    monkeypatch.setattr(rag_on_doc, "save_doc_chat_id", failing_save)
+    assert client.post("/pdf/upload", data={"file": (io.BytesIO(_pdf_bytes()), "notes.pdf")}).status_code == 500
+    assert len(os.listdir(tmp_path)) == 1
+    assert not redis_client.keys("doc_hash:*")
+
+
+def test_stored_pdf_is_not_validated_or_saved_again(pdf_client, redis_client, tmp_path, monkeypatch):
+    client, rag_on_doc, jobs = pdf_client
+    data = _pdf_bytes()
+    redis_client.set(f"doc_store:{hashlib.sha256(data).hexdigest()}", 1)
+    monkeypatch.setattr(rag_on_doc, "is_valid_pdf", lambda data: pytest.fail("stored document was parsed"))
+    monkeypatch.setattr(rag_on_doc, "save_upload", lambda file, path: pytest.fail("stored document was saved"))
+
+    assert client.post("/pdf/upload", data={"file": (io.BytesIO(data), "again.pdf")}).status_code == 202
+    # the job of a stored document is only looked up, the upload never touched disk
+    assert jobs == [(hashlib.sha256(data).hexdigest(), b"")]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import requests
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from langchain.storage import LocalFileStore
+from langchain_core.documents import Document
+from app.embedding_cache import BoundedByteStore
+
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", ".cache/text_api")
+TEXT_CACHE_REDIS_URL = os.getenv("TEXT_CACHE_REDIS_URL", "")
+TEXT_CACHE_MAX_ENTRIES = int(os.getenv("TEXT_CACHE_MAX_ENTRIES", 5000))
+# fetched pages are reused without asking the server for this long, then revalidated
+# with ETag / Last-Modified until CONTENT_CACHE_MAX_AGE
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", 60 * 60))
+CONTENT_CACHE_MAX_AGE = int(os.getenv("CONTENT_CACHE_MAX_AGE", 60 * 60 * 24 * 7))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", 60 * 60 * 24 * 30))
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|si)$")
+YOUTUBE_ID = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})")
+
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stores = {}
+
+stats = {
+    "content_hits": 0,
+    "content_revalidated": 0,
+    "content_misses": 0,
+    "summary_hits": 0,
+    "summary_misses": 0,
+}
+
+
+def _get_store(level, ttl):
+    with _lock:
+        store = _stores.get(level)
+        if store is None:
+            if TEXT_CACHE_REDIS_URL:
+                from langchain_community.storage import RedisStore
+                store = BoundedByteStore(RedisStore(redis_url=TEXT_CACHE_REDIS_URL, ttl=ttl, namespace=f"text_api:{level}"))
+            else:
+                store = BoundedByteStore(LocalFileStore(os.path.join(TEXT_CACHE_DIR, level)), max_entries=TEXT_CACHE_MAX_ENTRIES)
+            _stores[level] = store
+        return store
+
+
+def _get(level, ttl, key):
+    raw = _get_store(level, ttl).mget([key])[0]
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    # the file store has no TTL of its own
+    if entry["stored_at"] + ttl < time.time():
+        return None
+    return entry
+
+
+def _set(level, ttl, key, entry):
+    _get_store(level, ttl).mset([(key, json.dumps(entry, default=str).encode())])
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def normalize_url(url):
+    """Canonical form of a URL so the same page is cached once (YouTube links by video id)"""
+    url = url.strip()
+    match = YOUTUBE_ID.search(url)
+    if match and ("youtube.com" in url.lower() or "youtu.be" in url.lower()):
+        return f"youtube:{match.group(1)}"
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMS.match(k))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def _validators(response):
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+
+def _revalidate(url, entry):
+    """True when the server confirms the cached page hasn't changed (304)"""
+    headers = {"User-Agent": USER_AGENT}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if len(headers) == 1:
+        return False
+    try:
+        return requests.head(url, headers=headers, timeout=10, allow_redirects=True).status_code == 304
+    except requests.RequestException as e:
+        print("Error:", e)
+        return False
+
+
+def get_cached_content(url, fetch, revalidate=True, namespace="page"):
+    """Return fetch(response)'s value for url, a list of Documents or a string, from the content cache when possible.
+
+    Entries younger than CONTENT_CACHE_TTL are used as is. Older ones are kept until
+    CONTENT_CACHE_MAX_AGE and reused after a conditional request when revalidate is
+    set, otherwise content that never changes for a URL (YouTube) is reused until then.
+    With revalidate a miss is fetched here with one streamed GET whose ETag and
+    Last-Modified are kept, fetch builds the content from that response; without it
+    response is None and fetch gets the content itself.
+    namespace separates different content of the same URL, e.g. a page and its audio transcript.
+    """
+    key = _hash(f"{namespace}:{normalize_url(url)}")
+    entry = _get("content", CONTENT_CACHE_MAX_AGE, key)
+    now = time.time()
+    if entry is not None:
+        if not revalidate or now - entry["fetched_at"] < CONTENT_CACHE_TTL:
+            _count("content_hits")
+            return _load_content(entry)
+        if _revalidate(url, entry):
+            _count("content_revalidated")
+            entry.update(fetched_at=now, stored_at=now)
+            _set("content", CONTENT_CACHE_MAX_AGE, key, entry)
+            return _load_content(entry)
+    _count("content_misses")
+
+    validators = {}
+    if revalidate:
+        with requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=60, stream=True) as response:
+            if response.ok:
+                validators = _validators(response)
+            content = fetch(response)
+    else:
+        content = fetch(None)
+    if content:
+        entry = {"fetched_at": now, "stored_at": now, **validators}
+        if isinstance(content, str):
+            entry["text"] = content
+        else:
+            entry["documents"] = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in content]
+        _set("content", CONTENT_CACHE_MAX_AGE, key, entry)
+    return content
+
+
+def _load_content(entry):
+    if "text" in entry:
+        return entry["text"]
+    return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in entry["documents"]]
+
+
+def documents_hash(docs):
+    return _hash("\n\n".join(doc.page_content for doc in docs))
+
+
+def get_cached_summary(docs, cache_key, summarize):
+    """Return summarize(docs), cached by content hash and cache_key (model, prompt version, mode)"""
+    key = _hash(f"{documents_hash(docs)}:{cache_key}")
+    entry = _get("summary", SUMMARY_CACHE_TTL, key)
+    if entry is not None:
+        _count("summary_hits")
+        return entry["summary"]
+    _count("summary_misses")
+    summary = summarize(docs)
+    if summary:
+        _set("summary", SUMMARY_CACHE_TTL, key, {"summary": summary, "stored_at": time.time()})
+    return summary
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(stats)
@@ -0,0 +1,110 @@
+import os
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.chains import get_summarize_chain
+from app.history_store import estimate_tokens
+
+SUMMARY_MODES = ("auto", "stuff", "map_reduce", "refine")
+# "auto" sends content up to this many tokens in one prompt and switches to map-reduce above it
+SUMMARY_STUFF_MAX_TOKENS = int(os.getenv("SUMMARY_STUFF_MAX_TOKENS", 12000))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))
+# parallel map calls per request
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", 4))
+SUMMARY_MAX_COLLAPSE_ROUNDS = 5
+
+MAP_PROMPT = PromptTemplate.from_template(
+    """Write a concise summary of the following part of a longer document.
+    Keep the key facts, names, numbers and conclusions:
+    {page_content}
+    """
+)
+
+REFINE_PROMPT = PromptTemplate.from_template(
+    """Here is a summary of a document so far:
+    {existing_summary}
+
+    Refine it with the next part of the document below, keeping the same format.
+    If the new part adds nothing useful, return the summary unchanged.
+    {page_content}
+    """
+)
+
+
+def count_tokens(docs):
+    return sum(estimate_tokens(doc.page_content) for doc in docs)
+
+
+def choose_mode(docs, mode="auto"):
+    if mode not in SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode '{mode}', expected one of {', '.join(SUMMARY_MODES)}")
+    if mode != "auto":
+        return mode
+    return "stuff" if count_tokens(docs) <= SUMMARY_STUFF_MAX_TOKENS else "map_reduce"
+
+
+def split_documents(docs, chunk_tokens=SUMMARY_CHUNK_TOKENS):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_tokens * 4, chunk_overlap=200)
+    return splitter.split_documents(docs)
+
+
+def _join(texts):
+    return "\n\n".join(texts)
+
+
+def _group(texts, max_tokens):
+    """Pack consecutive texts into groups of at most max_tokens (a single longer text is its own group)"""
+    groups = [[]]
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if groups[-1] and used + tokens > max_tokens:
+            groups.append([])
+            used = 0
+        groups[-1].append(text)
+        used += tokens
+    return groups
+
+
+def stuff_summarize(docs, model, prompt):
+    return get_summarize_chain(model, prompt, chain_type="stuff").invoke(docs)["output_text"]
+
+
+def map_reduce_summarize(docs, model, prompt, max_concurrency=SUMMARY_MAX_CONCURRENCY,
+                         chunk_tokens=SUMMARY_CHUNK_TOKENS, max_tokens=SUMMARY_STUFF_MAX_TOKENS):
+    """Summarize chunks in parallel, collapse the partial summaries until they fit, then apply prompt once"""
+    map_chain = MAP_PROMPT | model | StrOutputParser()
+    config = {"max_concurrency": max_concurrency}
+    chunks = split_documents(docs, chunk_tokens)
+    summaries = map_chain.batch([{"page_content": chunk.page_content} for chunk in chunks], config=config)
+    rounds = 0
+    while len(summaries) > 1 and estimate_tokens(_join(summaries)) > max_tokens and rounds < SUMMARY_MAX_COLLAPSE_ROUNDS:
+        groups = _group(summaries, max_tokens)
+        if len(groups) == len(summaries):
+            # every partial summary already fills a group on its own, collapsing won't shrink them
+            break
+        summaries = map_chain.batch([{"page_content": _join(group)} for group in groups], config=config)
+        rounds += 1
+    final_chain = prompt | model | StrOutputParser()
+    return final_chain.invoke({"page_content": _join(summaries)})
+
+
+def refine_summarize(docs, model, prompt, chunk_tokens=SUMMARY_CHUNK_TOKENS):
+    """Summarize the first chunk with prompt, then refine that summary with each following chunk in order"""
+    chunks = split_documents(docs, chunk_tokens)
+    if not chunks:
+        return ""
+    summary = (prompt | model | StrOutputParser()).invoke({"page_content": chunks[0].page_content})
+    refine_chain = REFINE_PROMPT | model | StrOutputParser()
+    for chunk in chunks[1:]:
+        summary = refine_chain.invoke({"existing_summary": summary, "page_content": chunk.page_content})
+    return summary
+
+
+def summarize(docs, model, prompt, mode="stuff"):
+    """Summarize docs with a resolved mode (see choose_mode)"""
+    if mode == "map_reduce":
+        return map_reduce_summarize(docs, model, prompt)
+    if mode == "refine":
+        return refine_summarize(docs, model, prompt)
+    return stuff_summarize(docs, model, prompt)
@@ -3,9 +3,11 @@ import traceback
 from flask import request, jsonify
 from flask_smorest import Blueprint
 from langchain_core.prompts import PromptTemplate
-from text_api.utils import connect_to_model, is_valid_url, transcribe_audio_file, \
-    get_content, get_summarized_content, audio_to_text_content, get_summarized_content_audio
+from text_api.utils import connect_to_model, is_valid_url, transcribe_upload, MAX_FILESIZE, \
+    load_url_documents, get_summarized_content, load_audio_transcript, get_summarized_content_audio
 from langchain_core.documents import Document
+from text_api.summarize import SUMMARY_MODES
+from app.uploads import get_upload, upload_hash, upload_bytes, UploadTooLarge
 
 bp = Blueprint("text-api", __name__,)
 
@@ -19,6 +21,8 @@ def index():
 def get_text_summarize():
     data = request.get_json()
     url = data.get("url")
+    # "auto" (default), "stuff", "map_reduce" or "refine"
+    mode = data.get("mode", "auto")
     model_name = os.getenv("MODEL_NAME")  
     try:    
         prompt_template="""
@@ -32,13 +36,16 @@ def get_text_summarize():
             return jsonify({ 
                 "status": "failed",
                 "error": "URL is not valid"}), 400
+        if mode not in SUMMARY_MODES:
+            return jsonify({"status": "failed", "error": f"mode must be one of {', '.join(SUMMARY_MODES)}"}), 400
 
-        loader = get_content(url)
+        docs = load_url_documents(url)
         llm = connect_to_model(model_name)
-        summarized_content = get_summarized_content(loader, llm, prompt)
+        summarized_content = get_summarized_content(docs, llm, prompt, mode)
+        used_mode = summarized_content.get("mode") if summarized_content else None
         if 'output_text' in summarized_content:
             summarized_content = summarized_content['output_text']
-        return jsonify({"status": "success", "summary": summarized_content}), 200
+        return jsonify({"status": "success", "summary": summarized_content, "mode": used_mode}), 200
     except Exception as e:
         traceback.print_exc()
         return jsonify({"status": "failed", "message": str(e)}), 500
@@ -48,6 +55,7 @@ def get_text_summarize():
 def get_audio_summarize():
     data = request.get_json()
     url = data.get("url")
+    mode = data.get("mode", "auto")
     model_name = os.getenv("MODEL_NAME")
     try:    
         prompt_template="""
@@ -59,20 +67,22 @@ def get_audio_summarize():
 
         if not is_valid_url(url):
             return jsonify({ "status": "failed", "error": "URL is not valid"}), 400
+        if mode not in SUMMARY_MODES:
+            return jsonify({"status": "failed", "error": f"mode must be one of {', '.join(SUMMARY_MODES)}"}), 400
     
-        loader = audio_to_text_content(url)
+        loader = load_audio_transcript(url)
         llm = connect_to_model(model_name)
         if(loader):
             summarized_content = ''
             if isinstance(loader, str): 
                 loader = [Document(page_content=loader)]
-                summarized_content = get_summarized_content_audio(loader, llm, prompt)
+                summarized_content = get_summarized_content_audio(loader, llm, prompt, mode)
             else:
-                summarized_content = get_summarized_content(loader, llm, prompt)
+                summarized_content = get_summarized_content(loader, llm, prompt, mode)
             output = ''
             if 'output_text' in summarized_content:
                 output = summarized_content['output_text']
-            return jsonify({"status": "success", "summary": output}), 200
+            return jsonify({"status": "success", "summary": output, "mode": summarized_content.get("mode")}), 200
         else:
             return jsonify({"status": "failed", "message": "unsupported audio url"}), 400
     except Exception as e:
@@ -81,21 +91,24 @@ def get_audio_summarize():
 
 @bp.post("/audio-transcribe")
 def transcribe_audio():
-    if "file" not in request.files:
+    try:
+        file = get_upload("file", max_size=MAX_FILESIZE)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    if file is None:
         return jsonify({"error": "No file part in request"}), 400
 
-    file = request.files["file"]
+    mode = request.form.get("mode", "auto")
     model_name = os.getenv("MODEL_NAME")
     if file.filename == "":
         return jsonify({"error": "No file selected"}), 400
+    if mode not in SUMMARY_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SUMMARY_MODES)}"}), 400
 
     try:
-        # Save the uploaded file temporarily
-        temp_path = f"/tmp/{file.filename}"
-        file.save(temp_path)
-        transcription = transcribe_audio_file(temp_path)
+        # the upload is transcribed from its in-memory buffer, a repeated upload reuses the transcript
+        transcription = transcribe_upload(file.filename, upload_bytes(file), upload_hash(file))
         if(transcription is None):
-            os.remove(temp_path)
             return jsonify({"error": "Transcription failed"}), 500
 
         llm = connect_to_model(model_name)
@@ -107,8 +120,7 @@ def transcribe_audio():
         prompt=PromptTemplate(template=prompt_template,input_variables=["page_content"])
 
         loader = [Document(page_content=transcription)]
-        summarized_content = get_summarized_content_audio(loader, llm, prompt)
-        os.remove(temp_path)
+        summarized_content = get_summarized_content_audio(loader, llm, prompt, mode)
         output = ''
         if 'output_text' in summarized_content:
             output = summarized_content['output_text']
@@ -0,0 +1,170 @@
+import io
+import os
+import re
+import wave
+import tempfile
+import subprocess
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+# audio longer than one window is cut into windows transcribed in parallel
+TRANSCRIBE_WINDOW_SECONDS = int(os.getenv("TRANSCRIBE_WINDOW_SECONDS", 120))
+# each segment runs this far past its cut so words on the boundary aren't lost
+TRANSCRIBE_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", 2))
+# cuts move to the quietest point within this many seconds before the window end
+TRANSCRIBE_SILENCE_SEARCH_SECONDS = float(os.getenv("TRANSCRIBE_SILENCE_SEARCH_SECONDS", 5))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", 4))
+# the transcription API takes up to 25 MB per request
+TRANSCRIBE_SEGMENT_MAX_BYTES = 24 * 1024 * 1024
+# compressed speech is rarely below 32 kbit/s, audio smaller than one window at that
+# rate is sent whole without probing its length
+TRANSCRIBE_MIN_BYTES_PER_SECOND = int(os.getenv("TRANSCRIBE_MIN_BYTES_PER_SECOND", 4000))
+TRANSCRIBE_SAMPLE_RATE = 16000
+MAX_OVERLAP_WORDS = 30
+
+
+def _probe_duration(data):
+    """Duration ffmpeg reads from the header of data piped to it, estimated from the bitrate
+    for streams that only carry it in a trailer or not at all (mp3, ogg)"""
+    from moviepy.config import FFMPEG_BINARY
+    # without an output file ffmpeg stops after reading the header and prints the stream info
+    result = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", "pipe:0"], input=data,
+                            capture_output=True, timeout=30)
+    info = result.stderr.decode(errors="replace")
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", info)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = re.search(r"bitrate: (\d+) kb/s", info)
+    if match and int(match.group(1)):
+        return len(data) * 8 / (int(match.group(1)) * 1000)
+    return None
+
+
+def audio_duration(filename, data):
+    """Length in seconds read from the container header without decoding, None when unknown"""
+    try:
+        if filename.lower().endswith(".wav"):
+            with wave.open(io.BytesIO(data), "rb") as source:
+                return source.getnframes() / source.getframerate()
+        return _probe_duration(data)
+    except Exception as e:
+        print("Error:", e)
+        return None
+
+
+def needs_chunking(filename, data, window_seconds=TRANSCRIBE_WINDOW_SECONDS):
+    """Only audio longer than one window or close to the API size limit is decoded and split,
+    anything else goes to the API as the original compressed file in one request"""
+    if len(data) > TRANSCRIBE_SEGMENT_MAX_BYTES:
+        return True
+    if len(data) < window_seconds * TRANSCRIBE_MIN_BYTES_PER_SECOND:
+        return False
+    duration = audio_duration(filename, data)
+    return duration is not None and duration > window_seconds
+
+
+def to_wav(filename, data):
+    """Decode any audio container to 16 kHz mono 16-bit WAV bytes"""
+    from moviepy import AudioFileClip
+    ext = os.path.splitext(filename)[1] or ".bin"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, f"source{ext}")
+        target = os.path.join(tmp_dir, "audio.wav")
+        with open(source, "wb") as f:
+            f.write(data)
+        audio_clip = AudioFileClip(source)
+        try:
+            audio_clip.write_audiofile(target, fps=TRANSCRIBE_SAMPLE_RATE, nbytes=2, codec="pcm_s16le",
+                                       ffmpeg_params=["-ac", "1"], logger=None)
+        finally:
+            audio_clip.close()
+        with open(target, "rb") as f:
+            return f.read()
+
+
+def _wav_bytes(params, frames):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setparams(params)
+        out.writeframes(frames)
+    return buffer.getvalue()
+
+
+def _quietest_frame(frames, params, start, end):
+    """Frame index of the quietest 20 ms block in [start, end), the latest on ties, only for 16-bit audio"""
+    if params.sampwidth != 2 or end <= start:
+        return end
+    frame_size = params.sampwidth * params.nchannels
+    block = max(1, params.framerate // 50)
+    samples = array("h", frames[start * frame_size:end * frame_size])
+    step = block * params.nchannels
+    best, best_energy = end, None
+    for offset in range(0, len(samples) - step + 1, step):
+        energy = sum(sample * sample for sample in samples[offset:offset + step])
+        if best_energy is None or energy <= best_energy:
+            best, best_energy = start + offset // params.nchannels, energy
+    return best
+
+
+def split_wav(data, window_seconds=TRANSCRIBE_WINDOW_SECONDS, overlap_seconds=TRANSCRIBE_OVERLAP_SECONDS,
+              search_seconds=TRANSCRIBE_SILENCE_SEARCH_SECONDS):
+    """Cut WAV bytes into overlapping segments (WAV bytes each), preferring silent cut points"""
+    with wave.open(io.BytesIO(data), "rb") as source:
+        params = source.getparams()
+        frames = source.readframes(params.nframes)
+    frame_size = params.sampwidth * params.nchannels
+    total = len(frames) // frame_size
+    rate = params.framerate
+    overlap = int(overlap_seconds * rate)
+    window = min(int(window_seconds * rate), TRANSCRIBE_SEGMENT_MAX_BYTES // frame_size - overlap)
+    search = min(int(search_seconds * rate), window // 2)
+
+    segments = []
+    start = 0
+    while start < total:
+        cut = start + window
+        if cut >= total:
+            cut = total
+        else:
+            cut = _quietest_frame(frames, params, cut - search, cut)
+        end = min(cut + overlap, total)
+        segments.append(_wav_bytes(params, frames[start * frame_size:end * frame_size]))
+        start = cut
+    return segments
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch_transcripts(texts, max_overlap=MAX_OVERLAP_WORDS):
+    """Join segment transcripts in order, dropping words repeated across each overlap"""
+    words = []
+    for text in texts:
+        next_words = text.split()
+        if words and next_words:
+            tail = [_normalize_word(word) for word in words[-max_overlap:]]
+            head = [_normalize_word(word) for word in next_words[:max_overlap]]
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    next_words = next_words[size:]
+                    break
+        words.extend(next_words)
+    return " ".join(words)
+
+
+def transcribe_chunked(filename, data, transcribe, window_seconds=TRANSCRIBE_WINDOW_SECONDS,
+                       overlap_seconds=TRANSCRIBE_OVERLAP_SECONDS, concurrency=TRANSCRIBE_CONCURRENCY):
+    """Transcribe long audio as parallel segments, transcribe(data, filename) handles one segment.
+
+    Latency follows the slowest segment rather than the total length, segments run on
+    at most `concurrency` threads and are stitched back in order.
+    """
+    wav = data if filename.lower().endswith(".wav") else to_wav(filename, data)
+    segments = split_wav(wav, window_seconds, overlap_seconds)
+    if len(segments) == 1:
+        return transcribe(segments[0], "audio.wav")
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(segments))) as pool:
+        texts = list(pool.map(lambda item: transcribe(item[1], f"segment_{item[0]}.wav"), enumerate(segments)))
+    return stitch_transcripts(texts)
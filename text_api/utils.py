@@ -1,15 +1,29 @@
+import io
+import os
+import tempfile
 import validators
 import requests
-import os
 import openai
-from langchain_openai import ChatOpenAI
-from langchain.chains.summarize import load_summarize_chain
+from urllib.parse import urlsplit
+from langchain_core.documents import Document
+from app.chains import get_chat_model, prompt_version
+from text_api.summarize import choose_mode, summarize
+from text_api.cache import get_cached_content, get_cached_summary
+from text_api.transcribe import transcribe_chunked, needs_chunking
 from langchain_community.document_loaders import YoutubeLoader, UnstructuredURLLoader
 from pytubefix import YouTube
 from moviepy import AudioFileClip
 
-MAX_DURATION = 60 * 1
-MAX_FILESIZE = 1 * 1024 * 1024
+# longer audio is transcribed in parallel segments (see text_api/transcribe.py)
+MAX_DURATION = int(os.getenv("AUDIO_MAX_DURATION", 60 * 30))
+MAX_FILESIZE = int(os.getenv("AUDIO_MAX_FILESIZE", 50 * 1024 * 1024))
+# containers the transcription API accepts as is, anything else is re-encoded to mp3
+TRANSCRIBE_FORMATS = {"flac", "mp3", "mp4", "mpeg", "mpga", "m4a", "ogg", "oga", "wav", "webm"}
+MIME_EXTENSIONS = {
+    "audio/mpeg": "mp3", "audio/mp3": "mp3", "audio/mp4": "m4a", "audio/x-m4a": "m4a", "audio/webm": "webm",
+    "audio/ogg": "ogg", "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav", "audio/flac": "flac",
+    "video/mp4": "mp4", "video/webm": "webm",
+}
 
 def is_valid_url(url=''):
     return validators.url(url)
@@ -23,69 +37,151 @@ def get_content(url):
                 headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"})
     return loader
 
-def get_summarized_content(loader, model, prompt):
+def is_youtube_url(url):
+    return "youtube.com" in url.lower() or "youtu.be" in url.lower()
+
+def load_page_documents(url, response):
+    """A fetched page as one Document, partitioned like UnstructuredURLLoader does in its default mode"""
+    from unstructured.partition.auto import partition
+    if not response.ok:
+        print("Error:", f"{response.status_code} fetching {url}")
+        return []
+    try:
+        elements = partition(file=io.BytesIO(response.content), content_type=response.headers.get("Content-Type"))
+    except Exception as e:
+        print("Error:", e)
+        return []
+    return [Document(page_content="\n\n".join(str(el) for el in elements), metadata={"source": url})]
+
+def load_url_documents(url):
+    """Documents of a web page or YouTube transcript, served from the content cache when fresh"""
+    if is_youtube_url(url):
+        return get_cached_content(url, lambda response: get_content(url).load(), revalidate=False)
+    return get_cached_content(url, lambda response: load_page_documents(url, response))
+
+def load_audio_transcript(url):
+    """Transcript of the audio behind url, transcribed once per URL"""
+    return get_cached_content(url, lambda response: audio_to_text_content(url, response),
+                              revalidate=not is_youtube_url(url), namespace="audio")
+
+def transcribe_upload(filename, data, digest):
+    """Transcript of uploaded audio, transcribed once per content hash"""
+    def transcribe(response):
+        return transcribe_audio_bytes(data, os.path.basename(filename) or "audio")
+    return get_cached_content(f"upload:{digest}", transcribe, revalidate=False, namespace="audio-upload")
+
+def summarize_documents(docs, model, prompt, mode="auto"):
+    """Summarize docs, reusing the summary of identical content made with the same model, prompt and mode.
+
+    mode is "stuff", "map_reduce", "refine" or "auto" (one prompt for short content, map-reduce for long)
+    """
+    mode = choose_mode(docs, mode)
+    cache_key = f"{model.model_name}:{model.temperature}:{mode}:{prompt_version(prompt.template)}"
+    summary = get_cached_summary(docs, cache_key, lambda docs: summarize(docs, model, prompt, mode))
+    return {"output_text": summary, "mode": mode}
+
+def get_summarized_content(docs, model, prompt, mode="auto"):
     output_summary = ''
-    if(loader):
-        docs=loader.load() if loader else {}
-        chain = load_summarize_chain(model, chain_type="stuff", prompt=prompt, document_variable_name="page_content" )
-        output_summary = chain.invoke(docs)
+    if(docs):
+        output_summary = summarize_documents(docs, model, prompt, mode)
     return output_summary
 
 def connect_to_model(model_name):
     api_key = os.getenv("OPEN_AI_API_KEY")
     TEMP = os.getenv("TEMPERATURE", 0.2)
-    llm = ChatOpenAI(openai_api_key=api_key, model=model_name, temperature=TEMP)
+    llm = get_chat_model(model_name, TEMP, openai_api_key=api_key)
     return llm
 
-def audio_to_text_content(url):
-    transcription = ''
-    file_path = ''
-    if "youtube.com" in url.lower():
-        yt = YouTube(url)
-        if yt.length > MAX_DURATION:
-            raise ValueError(f"Video is too long (exceeds {MAX_DURATION//60} minutes).")
-        video = yt.streams.get_audio_only()
-        if video.filesize and video.filesize > MAX_FILESIZE:
-            raise ValueError(f"Audio file is too large (exceeds {MAX_FILESIZE/(1024*1024)} MB).")
-        downloaded_file = video.download()
-        audio_clip = AudioFileClip(downloaded_file)
-        new_path = downloaded_file.replace(' ','_')
-        file_path = os.path.splitext(new_path)[0] + '.wav'
-        audio_clip.write_audiofile(file_path)
-        transcription = transcribe_audio_file(file_path)
-        os.remove(downloaded_file)
+def _audio_extension(name, content_type=None):
+    ext = os.path.splitext(name)[1].lstrip(".").lower()
+    if ext:
+        return ext
+    return MIME_EXTENSIONS.get((content_type or "").split(";")[0].strip().lower(), "")
+
+def download_youtube_audio(url):
+    """Audio-only stream of a YouTube video as (filename, bytes), downloaded straight into memory"""
+    yt = YouTube(url)
+    if yt.length > MAX_DURATION:
+        raise ValueError(f"Video is too long (exceeds {MAX_DURATION//60} minutes).")
+    stream = yt.streams.get_audio_only()
+    if stream.filesize and stream.filesize > MAX_FILESIZE:
+        raise ValueError(f"Audio file is too large (exceeds {MAX_FILESIZE/(1024*1024)} MB).")
+    buffer = io.BytesIO()
+    stream.stream_to_buffer(buffer)
+    # audio-only streams are m4a (mp4) or webm, both accepted by the transcription API
+    ext = "m4a" if stream.subtype == "mp4" else stream.subtype
+    return f"{yt.video_id}.{ext}", buffer.getvalue()
+
+def download_audio_bytes(audio_url, response=None):
+    """Download an audio file into memory as (filename, bytes), stopping once it passes MAX_FILESIZE.
+
+    response is an already opened streamed GET of audio_url, e.g. the content cache's.
+    """
+    if response is None:
+        with requests.get(audio_url, stream=True, timeout=60) as response:
+            return download_audio_bytes(audio_url, response)
+    if response.status_code != 200:
+        raise Exception("Failed to download audio file")
+    buffer = io.BytesIO()
+    for chunk in response.iter_content(64 * 1024):
+        buffer.write(chunk)
+        if buffer.tell() > MAX_FILESIZE:
+            raise ValueError(f"File size exceeds {MAX_FILESIZE/(1024*1024)}MB limit.")
+    ext = _audio_extension(urlsplit(audio_url).path, response.headers.get("Content-Type"))
+    return f"audio.{ext or 'bin'}", buffer.getvalue()
+
+def to_transcribable(filename, data):
+    """Pass accepted containers through untouched, re-encode anything else to a compact mp3"""
+    ext = _audio_extension(filename)
+    if ext in TRANSCRIBE_FORMATS:
+        return filename, data
+    # moviepy needs files, so they go to a private temp dir instead of the working directory
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, f"source.{ext or 'bin'}")
+        target = os.path.join(tmp_dir, "audio.mp3")
+        with open(source, "wb") as f:
+            f.write(data)
+        audio_clip = AudioFileClip(source)
+        try:
+            audio_clip.write_audiofile(target, codec="libmp3lame", logger=None)
+        finally:
+            audio_clip.close()
+        with open(target, "rb") as f:
+            return "audio.mp3", f.read()
+
+def audio_to_text_content(url, response=None):
+    if is_youtube_url(url):
+        filename, data = download_youtube_audio(url)
     else:
-        file_path = download_audio_file(url, "temp_audio_file")
-        transcription = transcribe_audio_file(file_path)
-    # Clean up files
-    if os.path.exists(file_path): os.remove(file_path)
-    return transcription
- 
+        filename, data = download_audio_bytes(url, response)
+    return transcribe_audio_bytes(data, filename)
+
+def _transcribe_once(data, filename):
+    transcription = openai.audio.transcriptions.create(
+        model="gpt-4o-mini-transcribe", 
+        file=(filename, data)
+    )
+    return transcription.text
+
+def transcribe_audio_bytes(data, filename):
+    if len(data) > MAX_FILESIZE:
+        raise ValueError(f"File size exceeds {MAX_FILESIZE/(1024*1024)}MB limit.")
+    # long audio is decoded to WAV segments straight from the original container,
+    # so it isn't re-encoded to mp3 first
+    if needs_chunking(filename, data):
+        return transcribe_chunked(filename, data, _transcribe_once)
+    filename, data = to_transcribable(filename, data)
+    return _transcribe_once(data, filename)
+
 def transcribe_audio_file(file_path):
     file_size = os.path.getsize(file_path)
     if file_size > MAX_FILESIZE:
         raise ValueError(f"File size exceeds {MAX_FILESIZE/(1024*1024)}MB limit.")
-    transcription = ''
     with open(file_path, "rb") as audio_file:
-        transcription = openai.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe", 
-            file=audio_file
-        )
-    return transcription.text
-
-def download_audio_file(audio_url, save_path):
-    response = requests.get(audio_url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
-        return save_path
-    else:
-        raise Exception("Failed to download audio file")
+        return transcribe_audio_bytes(audio_file.read(), os.path.basename(file_path))
      
-def get_summarized_content_audio(loader, model, prompt):
+def get_summarized_content_audio(loader, model, prompt, mode="auto"):
     output_summary = ''
     if(loader):
-        chain = load_summarize_chain(model, chain_type="stuff", prompt=prompt, document_variable_name="page_content")
-        output_summary = chain.invoke(loader)
+        output_summary = summarize_documents(loader, model, prompt, mode)
     return output_summary
\ No newline at end of file